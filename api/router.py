@@ -1,5 +1,7 @@
 from fastapi import APIRouter
 from controllers.extractTyc import router as extractTyc_router
+from controllers.metrics import router as metrics_router
+from controllers.health import router as health_router
 
 
 GLOBAL_PREFIX = '/api/v1'
@@ -8,5 +10,7 @@ GLOBAL_PREFIX = '/api/v1'
 router = APIRouter()
 
 router.include_router(extractTyc_router, prefix=GLOBAL_PREFIX, tags=["extractTyc"])
+router.include_router(metrics_router, tags=["metrics"])
+router.include_router(health_router, tags=["health"])
 
 
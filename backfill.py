@@ -0,0 +1,107 @@
+"""
+Replays historical ATM files through the ingest path, without Pub/Sub.
+
+The source is a local directory, or a prefix of the configured bucket
+written gs://<bucket>/<prefix>. Files are decoded in a process pool and
+written by concurrent database workers; progress is saved to a checkpoint
+after every file, and running the same command again resumes from it.
+
+Usage:
+    python backfill.py <directory | gs://bucket/prefix> [--pattern "*.json"]
+        [--parse-workers N] [--db-workers N] [--checkpoint path] [--restart]
+        [--dry-run [--sample N] [--records-per-second N]]
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from dotenv import load_dotenv
+
+from services import alloyDB
+from services.backfill import Checkpoint, Source, estimate_backfill, run_backfill
+
+# Load environment variables
+load_dotenv()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Local directory or gs://bucket/prefix")
+    parser.add_argument("--pattern", default="*", help="Only replay files whose name matches it")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--db-workers", type=int, default=int(os.getenv("BACKFILL_DB_WORKERS", 4)),
+                        help="Files written concurrently; 1 commits them in name order")
+    parser.add_argument("--checkpoint", help="Defaults to .backfill-<source hash>.json")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and replay every file")
+    parser.add_argument("--no-validate", dest="validate", action="store_false",
+                        default=os.getenv("VALIDATE_INGEST", "true").lower() == "true")
+    parser.add_argument("--dry-run", action="store_true", help="Only estimate how long the run would take")
+    parser.add_argument("--sample", type=int, default=3, help="Files decoded to estimate the dry run")
+    parser.add_argument("--records-per-second", type=float,
+                        help="Write rate for the dry run, defaults to the one of the last run")
+    return parser.parse_args()
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s"
+
+
+async def main() -> int:
+    args = parse_args()
+    try:
+        source = Source(args.source, args.pattern)
+    except ValueError as e:
+        logging.error(str(e))
+        return 2
+    checkpoint_path = args.checkpoint or f".backfill-{hashlib.sha1(args.source.encode()).hexdigest()[:12]}.json"
+    checkpoint = Checkpoint(checkpoint_path, args.source)
+    if not args.restart:
+        checkpoint = Checkpoint.load(checkpoint_path, args.source)
+
+    files = [file for file in source.list() if file.name not in checkpoint.done]
+    logging.info(
+        f"{len(files)} files to replay from {args.source} "
+        f"({sum(file.size for file in files) / 2**20:,.1f} MiB), {len(checkpoint.done)} already done"
+    )
+
+    if args.dry_run:
+        estimate = await estimate_backfill(
+            source, files, args.sample, args.parse_workers,
+            args.records_per_second or checkpoint.records_per_second, args.validate,
+        )
+        print(f"Files:             {estimate.files}")
+        print(f"Size:              {estimate.bytes / 2**20:,.1f} MiB")
+        print(f"Records (approx.): {estimate.records:,}")
+        print(f"Decoding:          {format_duration(estimate.parse_seconds)} with {args.parse_workers} processes")
+        if estimate.seconds is None:
+            print("Writing:           unknown, pass --records-per-second or run once to measure it")
+        else:
+            print(f"Writing:           {format_duration(estimate.write_seconds)}")
+            print(f"Estimated total:   {format_duration(estimate.seconds)}")
+        return 0
+
+    await alloyDB.init_db_pool()
+    with ProcessPoolExecutor(max_workers=args.parse_workers, mp_context=get_context("spawn")) as executor:
+        stats = await run_backfill(
+            source, files, checkpoint, executor,
+            parse_ahead=args.parse_workers * 2,
+            db_workers=args.db_workers,
+            validate=args.validate,
+        )
+    logging.info(
+        f"Replayed {stats.files} files in {format_duration(stats.elapsed)}: {stats.records} records, "
+        f"{stats.inserted} inserted, {stats.updated} updated, {stats.unchanged} unchanged, "
+        f"{stats.failed} failed"
+    )
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of the blob cache: cost of processing a file again (a retry
+after a failed write, a redelivery or a replay) when it is downloaded again
+and when it is read from the cache, download plus decode as the ingest
+pipeline does them.
+
+Cloud Storage is replaced by a stand-in answering each request after a
+latency and serving content at a given bandwidth.
+
+Usage: python bench/bench_blob_cache.py [records] [--latency 0.03] [--bandwidth-mb 100]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import services.storage as storage
+from bench.synthetic import Scenario, file_records
+from services.decoder import validate_atm_file
+
+FILE_NAME = "atms/bench.json"
+GENERATION = 1700000000000000
+
+
+class SlowBucket:
+    def __init__(self, content: bytes, latency: float, bandwidth: float):
+        self.content = content
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests = 0
+
+    def blob(self, file_path: str, generation: int = None):
+        return SimpleNamespace(generation=GENERATION, crc32c=None, download_as_bytes=self.download_as_bytes)
+
+    def download_as_bytes(self, **kwargs) -> bytes:
+        self.requests += 1
+        time.sleep(self.latency + len(self.content) / self.bandwidth)
+        return self.content
+
+
+async def process(generation) -> float:
+    started = time.perf_counter()
+    downloaded = await storage.download_file_async(FILE_NAME, generation)
+    validate_atm_file(downloaded.content)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("records", type=int, nargs="?", default=20000)
+    parser.add_argument("--latency", type=float, default=0.03, help="Seconds per request")
+    parser.add_argument("--bandwidth-mb", type=float, default=100, help="Download bandwidth, in MB/s")
+    options = parser.parse_args()
+    content = json.dumps(list(file_records(Scenario(records=options.records), 0))).encode("utf-8")
+    bucket = SlowBucket(content, options.latency, options.bandwidth_mb * 1e6)
+
+    with tempfile.TemporaryDirectory() as directory, mock.patch.object(storage, "bucket", bucket), \
+            mock.patch.object(storage, "blob_cache", None), mock.patch.object(storage, "blob_cache_failed", False):
+        storage.open_blob_cache("", 0)
+        uncached = asyncio.run(process(GENERATION))
+        storage.open_blob_cache(directory, 4 * len(content))
+        first = asyncio.run(process(GENERATION))
+        requests = bucket.requests
+        unknown = asyncio.run(process(None))
+        unknown_requests = bucket.requests - requests
+        notified = asyncio.run(process(GENERATION))
+        notified_requests = bucket.requests - requests - unknown_requests
+
+    print(f"file: {len(content) / 1e6:.1f} MB, {options.records} records")
+    print(f"no cache, every time:          {uncached * 1e3:8.1f} ms")
+    print(f"first time, stored in cache:   {first * 1e3:8.1f} ms")
+    print(f"again, generation unknown:     {unknown * 1e3:8.1f} ms ({unknown_requests} request)")
+    print(f"again, notified generation:    {notified * 1e3:8.1f} ms ({notified_requests} requests)")
+
+
+if __name__ == "__main__":
+    main()
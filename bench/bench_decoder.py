@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of the ATM record decoder and of the validating decoder
+against the previous inline decoding of the controller. Every path starts
+from the raw file bytes.
+
+Usage: python bench/bench_decoder.py [records]
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.decoder import decode_atm_records, parse_timestamp, validate_atm_file
+
+
+def legacy_decode(file_data: list) -> tuple:
+    # The decoding loop of listen_for_messages before the decoder module
+    check_values = []
+    insert_values = []
+    for record in file_data:
+        payload = record.get("payload", {})
+        atmfromdatetime = datetime.strptime(payload.get("atmfromdatetime"), "%Y-%m-%d %H:%M:%S.%f")
+        atmtodatetime = datetime.strptime(payload.get("atmtodatetime"), "%Y-%m-%d %H:%M:%S.%f")
+        check_values.append((
+            payload.get("atmidentifier"),
+            payload.get("atmaddress_streetname"),
+            payload.get("atmaddress_buildingnumber"),
+            payload.get("atmtownname"),
+            payload.get("atmdistrictname"),
+            payload.get("atmcountrysubdivisionmajorname")
+        ))
+        insert_values.append((
+            payload.get("atmidentifier"),
+            payload.get("atmaddress_streetname"),
+            payload.get("atmaddress_buildingnumber"),
+            payload.get("atmtownname"),
+            payload.get("atmdistrictname"),
+            payload.get("atmcountrysubdivisionmajorname"),
+            atmfromdatetime,
+            atmtodatetime,
+            payload.get("atmtimetype"),
+            payload.get("atmattentionhour"),
+            payload.get("atmservicetype"),
+            payload.get("atmaccesstype")
+        ))
+    return check_values, insert_values
+
+
+def synthetic_records(count: int) -> list:
+    opening_hours = [(f"2024-01-01 0{h}:00:00.000", f"2024-01-01 1{h}:30:00.000") for h in range(8)]
+    records = []
+    for i in range(count):
+        from_datetime, to_datetime = opening_hours[i % len(opening_hours)]
+        records.append({"payload": {
+            "atmidentifier": f"ATM{i:07d}",
+            "atmaddress_streetname": "Av. Vicuña Mackenna Ote",
+            "atmaddress_buildingnumber": str(i % 9000),
+            "atmtownname": "Talca",
+            "atmdistrictname": "Las Condes",
+            "atmcountrysubdivisionmajorname": "Región de Los Ríos",
+            "atmfromdatetime": from_datetime,
+            "atmtodatetime": to_datetime,
+            "atmtimetype": "CONT",
+            "atmattentionhour": "08:00:00 - 15:00:00",
+            "atmservicetype": "DPST",
+            "atmaccesstype": "BRAN",
+        }})
+    return records
+
+
+def measure(function, content: bytes, count: int, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        parse_timestamp.cache_clear()
+        started = time.perf_counter()
+        function(content)
+        best = min(best, time.perf_counter() - started)
+    return count / best
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    content = json.dumps(synthetic_records(count)).encode("utf-8")
+    legacy = measure(lambda data: legacy_decode(json.loads(data.decode("utf-8"))), content, count)
+    decoder = measure(lambda data: decode_atm_records(json.loads(data)), content, count)
+    validated = measure(validate_atm_file, content, count)
+    print(f"records:           {count}")
+    print(f"inline decode:     {legacy:,.0f} records/s")
+    print(f"decoder module:    {decoder:,.0f} records/s ({decoder / legacy:.1f}x)")
+    print(f"validating decode: {validated:,.0f} records/s ({validated / legacy:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Micro-benchmark of the dedup cache persistence: time to write a snapshot of
+a full cache, to restore it at startup, and to look digests up in it, with a
+share of its entries already expired.
+
+Usage: python bench/bench_dedup_snapshot.py [entries] [expired ratio]
+"""
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.dedup_snapshot import DedupPersistence, write_snapshot
+from services.in_memory_cache import DedupCache
+
+TTL = 3600
+LOOKUPS = 100_000
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    expired_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    now = time.time()
+    # Last-seen times spread over the TTL, the oldest ones beyond it
+    first = now - TTL * (1 + expired_ratio)
+    step = (now - first) / count
+    entries = [
+        (hashlib.sha256(index.to_bytes(8, "little")).digest(), first + index * step)
+        for index in range(count)
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "dedup.snapshot")
+        started = time.perf_counter()
+        write_snapshot(path, entries, None, 0.0, count)
+        written = time.perf_counter() - started
+        size = os.path.getsize(path)
+
+        cache = DedupCache(max_entries=count, ttl=TTL)
+        persistence = DedupPersistence(cache, path)
+        started = time.perf_counter()
+        persistence.load()
+        loaded = time.perf_counter() - started
+
+        sample = entries[::max(1, count // LOOKUPS)]
+        started = time.perf_counter()
+        duplicates = sum(key in cache for key, _ in sample)
+        lookup = (time.perf_counter() - started) / len(sample) * 1e6
+        persistence.snapshot.close()
+
+    print(f"entries:          {count:,} ({size / 2**20:,.1f} MiB)")
+    print(f"write snapshot:   {written:.3f}s")
+    print(f"restore at start: {loaded * 1000:.2f} ms")
+    print(f"lookup:           {lookup:.1f} µs per digest, {duplicates:,}/{len(sample):,} still live")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+End-to-end benchmark of message processing: synthetic ATM files are
+notified through a local Pub/Sub stand-in and processed by the controller's
+listen_for_messages loop, with the processing pipeline, deduplication,
+decoding and validation of the service. Files are read from a local
+directory standing in for Cloud Storage, and records are written to an
+in-process fake table, or to PostgreSQL with --database postgres (DB_*
+environment variables, the records are written to the real table).
+
+Each scenario runs in a fresh process so its peak RSS is its own. Results
+are printed and saved as JSON, to compare runs across commits.
+
+Usage: python bench/bench_e2e.py [--sizes 1000,10000,100000] [--files 4]
+           [--duplicate-ratio 0.1] [--update-ratio 0.2] [--redelivery-ratio 0]
+           [--max-messages 1000] [--ingest-mode buffered|streaming]
+           [--database fake|postgres] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import List
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from bench.synthetic import Scenario, existing_records, write_scenario
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BUCKET = "bench-bucket"
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def import_controller():
+    # Clients are created on first use, the fakes below are used instead
+    import controllers.extractTyc as extractTyc
+    return extractTyc
+
+
+async def run_scenario(scenario: Scenario, directory: str, names: List[str], options: dict) -> dict:
+    extractTyc = import_controller()
+    # After the imports, whose logging.basicConfig would reset the level
+    logging.getLogger().setLevel(options["log_level"])
+    from bench.fakes import FakeAtmTable, FakeSubscriber, LocalBucket
+    from services import alloyDB
+    from services.ack_manager import AckManager
+    from services.decoder import decode_atm_records
+
+    subscriber = FakeSubscriber()
+    bucket = LocalBucket(directory)
+    prefix = options["prefix"]
+    seed = decode_atm_records(existing_records(scenario, prefix))
+
+    with ExitStack() as stack:
+        patch = lambda name, value: stack.enter_context(mock.patch.object(extractTyc, name, value))
+        patch("subscriber", subscriber)
+        patch("subscription_path", "projects/bench/subscriptions/bench")
+        if options["max_messages"]:
+            patch("max_messages", options["max_messages"])
+        patch("ingest_mode", options["ingest_mode"])
+        patch("download_file_async", bucket.download_file_async)
+        patch("iter_file_chunks", bucket.iter_file_chunks)
+        if options["database"] == "postgres":
+            await alloyDB.init_db_pool()
+            await alloyDB.upsert_atm_records(seed)
+        else:
+            table = FakeAtmTable()
+            await table.upsert_atm_records(seed)
+            patch("upsert_atm_records", table.upsert_atm_records)
+            patch("upsert_atm_batches", table.upsert_atm_batches)
+        ack_manager = AckManager(
+            extractTyc.acknowledge,
+            extractTyc.modify_ack_deadline,
+            flush_interval=extractTyc.ack_flush_interval,
+            ack_deadline=extractTyc.ack_deadline_seconds,
+            max_lease=extractTyc.max_lease_seconds,
+        )
+        patch("ack_manager", ack_manager)
+        pipeline = extractTyc.create_pipeline()
+        patch("pipeline", pipeline)
+        pipeline.start()
+
+        records = messages = 0
+        started = time.perf_counter()
+        for index, name in enumerate(names):
+            generation = str(int(started * 1e6) + index)
+            data = {"bucket": BUCKET, "name": name, "generation": generation}
+            attributes = {"eventType": "OBJECT_FINALIZE", "bucketId": BUCKET, "objectId": name, "objectGeneration": generation}
+            deliveries = 2 if index < round(len(names) * scenario.redelivery_ratio) else 1
+            for _ in range(deliveries):
+                subscriber.publish(data, attributes)
+                messages += 1
+            records += scenario.records
+
+        listener = asyncio.create_task(extractTyc.listen_for_messages())
+        deadline = started + options["timeout"]
+        while not subscriber.done and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        completed = subscriber.done
+
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+        await pipeline.stop()
+        await ack_manager.stop()
+        if options["database"] == "postgres":
+            await alloyDB.pool.close()
+
+    latencies = subscriber.latencies
+    return {
+        "scenario": scenario._asdict() | {"name": scenario.name},
+        "completed": completed,
+        "messages": messages,
+        "records": records,
+        "seconds": elapsed,
+        "messages_per_second": messages / elapsed,
+        "records_per_second": records / elapsed,
+        "latency_p50_seconds": percentile(latencies, 0.50),
+        "latency_p99_seconds": percentile(latencies, 0.99),
+        "redeliveries": subscriber.redeliveries,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def run_in_process(scenario: Scenario, directory: str, names: List[str], options: dict) -> dict:
+    return asyncio.run(run_scenario(scenario, directory, names, options))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Records per file, one scenario per size")
+    parser.add_argument("--files", type=int, default=4, help="Files per scenario")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1)
+    parser.add_argument("--update-ratio", type=float, default=0.2)
+    parser.add_argument("--redelivery-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-messages", type=int, help="Largest pull, defaults to MAX_MESSAGES")
+    parser.add_argument("--ingest-mode", choices=("buffered", "streaming"), default=os.getenv("INGEST_MODE", "buffered"))
+    parser.add_argument("--database", choices=("fake", "postgres"), default="fake")
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds allowed per scenario")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="Results file, defaults to bench/results/e2e-<time>-<commit>.json")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    commit = git_commit()
+    options = {
+        "max_messages": args.max_messages,
+        "ingest_mode": args.ingest_mode,
+        "database": args.database,
+        "timeout": args.timeout,
+        "log_level": args.log_level.upper(),
+        # Fresh identifiers on every run, so a real table starts each run alike
+        "prefix": f"B{int(time.time()) % 100000:05d}-",
+    }
+    results = []
+    context = get_context("spawn")
+    with tempfile.TemporaryDirectory(prefix="atm-bench-") as directory:
+        for size in (int(size) for size in args.sizes.split(",")):
+            scenario = Scenario(
+                records=size,
+                files=args.files,
+                duplicate_ratio=args.duplicate_ratio,
+                update_ratio=args.update_ratio,
+                redelivery_ratio=args.redelivery_ratio,
+                seed=args.seed,
+            )
+            names = write_scenario(scenario, directory, options["prefix"])
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_in_process, scenario, directory, names, options).result()
+            results.append(result)
+            status = "" if result["completed"] else "  (timed out)"
+            print(
+                f"{scenario.name:<48} {result['messages_per_second']:>9,.1f} msgs/s "
+                f"{result['records_per_second']:>12,.0f} records/s "
+                f"p50 {result['latency_p50_seconds'] * 1000:>9,.1f} ms "
+                f"p99 {result['latency_p99_seconds'] * 1000:>9,.1f} ms "
+                f"peak RSS {result['peak_rss_bytes'] / 2**20:>7,.0f} MiB{status}"
+            )
+
+    report = {
+        "benchmark": "e2e",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": options | {"sizes": args.sizes, "files": args.files},
+        "results": results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIRECTORY, f"e2e-{stamp}-{commit}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
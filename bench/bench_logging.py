@@ -0,0 +1,123 @@
+"""
+Micro-benchmark of the logging cost per message on the event loop thread:
+the previous eager f-string logs of process_message against the ingest
+logging layer (lazy arguments, truncation, queue handler), with and without
+sampling. Records are written to a file, as a container writes its stdout.
+Also measures the debug logs of execute_bulk_query with DEBUG disabled.
+
+Usage: python bench/bench_logging.py [messages]
+"""
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import services.ingest_log as ingest_log
+from bench.synthetic import Scenario, file_records
+from services.ingest_log import EventSampler, Lazy, Truncated, log_event
+
+
+def notification(index: int) -> dict:
+    # The JSON API representation of a Cloud Storage object, as notified
+    return {
+        "kind": "storage#object",
+        "id": f"bench-bucket/atms/file-{index}.json/1700000000000000",
+        "selfLink": f"https://www.googleapis.com/storage/v1/b/bench-bucket/o/atms%2Ffile-{index}.json",
+        "name": f"atms/file-{index}.json",
+        "bucket": "bench-bucket",
+        "generation": "1700000000000000",
+        "metageneration": "1",
+        "contentType": "application/json",
+        "timeCreated": "2024-01-01T00:00:00.000Z",
+        "updated": "2024-01-01T00:00:00.000Z",
+        "storageClass": "STANDARD",
+        "size": "1048576",
+        "md5Hash": "1B2M2Y8AsgTpgAmY7PhCfg==",
+        "mediaLink": f"https://storage.googleapis.com/download/storage/v1/b/bench-bucket/o/atms%2Ffile-{index}.json",
+        "crc32c": "AAAAAA==",
+        "etag": "CIDo2dSBiv8CEAE=",
+    }
+
+
+def legacy_log(message_data: dict, message_hash: bytes, event_type: str) -> None:
+    # The logs of process_message before the ingest logging layer
+    logging.info(f"Received message: {message_data}")
+    logging.info(f"message_hash: {message_hash.hex()}")
+    logging.info(f"event_type: {event_type}")
+    logging.info(f"File name: {message_data.get('name')}")
+
+
+def layered_log(message_data: dict, message_hash: bytes, event_type: str) -> None:
+    log_event("message", logging.INFO, "Received message %s: %s", Lazy(message_hash.hex), Truncated(message_data))
+    log_event("file", logging.INFO, "File name: %s", message_data.get("name"))
+
+
+def measure(log, messages: list) -> float:
+    started = time.perf_counter()
+    for message_data, message_hash in messages:
+        log(message_data, message_hash, "OBJECT_FINALIZE")
+    return (time.perf_counter() - started) / len(messages) * 1e6
+
+
+def run(log, messages: list, queued: bool, sample: dict = None) -> tuple:
+    root = logging.getLogger()
+    root.handlers = []
+    with tempfile.TemporaryFile("w") as output:
+        handler = logging.StreamHandler(output)
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        with mock.patch.object(ingest_log, "log_queue", queued), \
+                mock.patch.object(ingest_log, "sampler", EventSampler(sample or {})):
+            started = time.perf_counter()
+            ingest_log.start_queue_logging()
+            on_loop = measure(log, messages)
+            ingest_log.stop_queue_logging()
+            total = (time.perf_counter() - started) / len(messages) * 1e6
+        root.handlers = []
+    return on_loop, total
+
+
+def bulk_debug(count: int) -> tuple:
+    logging.getLogger().setLevel(logging.INFO)
+    data = list(file_records(Scenario(records=count), 0))
+    started = time.perf_counter()
+    logging.debug(f"Data: {data}")
+    eager = (time.perf_counter() - started) * 1e6
+    started = time.perf_counter()
+    logging.debug("Data: %s", Truncated(data))
+    lazy = (time.perf_counter() - started) * 1e6
+    return eager, lazy
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    messages = [
+        (notification(index), hashlib.blake2b(str(index).encode(), digest_size=32).digest())
+        for index in range(count)
+    ]
+    legacy = run(legacy_log, messages, queued=False)
+    layered = run(layered_log, messages, queued=False)
+    queued = run(layered_log, messages, queued=True)
+    sampled = run(layered_log, messages, queued=True, sample={"message": 100, "file": 100})
+
+    print(f"messages:                 {count}")
+    print("per message (µs)          event loop   total")
+    for name, (on_loop, total) in (
+        ("eager f-strings", legacy),
+        ("lazy + truncated", layered),
+        ("lazy + queue", queued),
+        ("lazy + queue + 1/100", sampled),
+    ):
+        print(f"{name:<26}{on_loop:>10.1f}{total:>8.1f}")
+    eager, lazy = bulk_debug(5000)
+    print(f"bulk debug log, 5000 records, DEBUG off: {eager:,.0f} µs eager, {lazy:,.1f} µs lazy")
+
+
+if __name__ == "__main__":
+    main()
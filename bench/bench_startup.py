@@ -0,0 +1,120 @@
+"""
+Cold start benchmark: time from the import of main to the service being
+ready and to the first processed message.
+
+The run happens in a fresh interpreter, so imports are cold. Clients are
+replaced by local stand-ins (bench/fakes.py) whose creation takes the given
+latencies, to show how much of them the concurrent warm-up hides; the
+import of main and everything else is the real one.
+
+Usage: python bench/bench_startup.py [--credentials-latency 0.2]
+           [--storage-latency 0.2] [--pubsub-latency 0.2] [--db-latency 0.5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+CHILD_FLAG = "--child"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--credentials-latency", type=float, default=0.2, help="Loading the key and the first token")
+    parser.add_argument("--storage-latency", type=float, default=0.2)
+    parser.add_argument("--pubsub-latency", type=float, default=0.2)
+    parser.add_argument("--db-latency", type=float, default=0.5, help="Opening and preparing the pool")
+    parser.add_argument("--timeout", type=float, default=30)
+    return parser.parse_args([arg for arg in sys.argv[1:] if arg != CHILD_FLAG])
+
+
+def child(options: argparse.Namespace) -> dict:
+    # First import: the start of the cold start, as measured by the service
+    from services.readiness import readiness
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter() - started
+
+    import asyncio
+    import tempfile
+    from types import SimpleNamespace
+    from unittest import mock
+    from bench.fakes import FakeAtmTable, FakeSubscriber, LocalBucket
+    from bench.synthetic import Scenario, write_scenario
+    import controllers.extractTyc as extractTyc
+    from services import clients, dedup_snapshot, storage
+
+    def delayed(seconds: float, value):
+        time.sleep(seconds)
+        return value
+
+    async def init_db_pool() -> None:
+        await asyncio.sleep(options.db_latency)
+
+    subscriber = FakeSubscriber(max_wait=0.05)
+    table = FakeAtmTable()
+    with tempfile.TemporaryDirectory() as directory:
+        names = write_scenario(Scenario(records=100, files=1), directory, "bench")
+        bucket = LocalBucket(directory)
+        subscriber.publish(
+            {"bucket": "bench-bucket", "name": names[0], "generation": "1"},
+            {"eventType": "OBJECT_FINALIZE", "bucketId": "bench-bucket", "objectId": names[0], "objectGeneration": "1"},
+        )
+        token = SimpleNamespace(project_id="bench", refresh=lambda request: None)
+        with mock.patch.object(clients.credentials, "_factory", lambda: delayed(options.credentials_latency, token)), \
+                mock.patch.object(clients.storage_client, "_factory", lambda: delayed(
+                    options.storage_latency, SimpleNamespace(bucket=lambda name: (clients.credentials.get(), bucket)[1])
+                )), \
+                mock.patch.object(clients.subscriber_client, "_factory", lambda: (
+                    clients.credentials.get(), delayed(options.pubsub_latency, subscriber)
+                )[1]), \
+                mock.patch.object(main, "init_db_pool", init_db_pool), \
+                mock.patch.object(dedup_snapshot, "dedup_snapshot_path", os.path.join(directory, "dedup.snapshot")), \
+                mock.patch.object(storage, "blob_cache_dir", os.path.join(directory, "blob_cache")), \
+                mock.patch.object(extractTyc, "download_file_async", bucket.download_file_async), \
+                mock.patch.object(extractTyc, "upsert_atm_records", table.upsert_atm_records), \
+                mock.patch.object(extractTyc, "upsert_atm_batches", table.upsert_atm_batches):
+
+            async def run() -> dict:
+                await main.startup_event()
+                deadline = time.perf_counter() + options.timeout
+                while readiness.first_message_seconds is None and time.perf_counter() < deadline:
+                    await asyncio.sleep(0.005)
+                report = readiness.report()
+                await main.shutdown_event()
+                return report
+
+            report = asyncio.run(run())
+    report["import_seconds"] = round(imported, 3)
+    return report
+
+
+def main() -> None:
+    options = parse_args()
+    if CHILD_FLAG in sys.argv:
+        print(json.dumps(child(options)))
+        return
+    result = subprocess.run([sys.executable, __file__, CHILD_FLAG, *sys.argv[1:]], capture_output=True, text=True)
+    if result.returncode:
+        sys.exit(result.stderr)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    dependencies = report["dependencies"]
+    sequential = options.credentials_latency + options.storage_latency + options.pubsub_latency + options.db_latency
+    ready_after = max(state.get("ready_after_seconds", 0.0) for state in dependencies.values())
+    print(f"import main:            {report['import_seconds']:.3f}s")
+    for name, state in dependencies.items():
+        seconds = f"{state['seconds']:.3f}s" if "seconds" in state else "-"
+        print(f"  {name:<20} {seconds:>8}, ready at {state.get('ready_after_seconds', float('nan')):.3f}s")
+    print(f"ready after start:      {ready_after:.3f}s")
+    print(f"warm-up after import:   {ready_after - report['import_seconds']:.3f}s "
+          f"({sequential:.3f}s of initialization one after another)")
+    first = report["first_message_seconds"]
+    print(f"first message after:    {first:.3f}s" if first is not None else "first message: not processed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Local stand-ins for Pub/Sub, Cloud Storage and the ATM table, used to drive
+the processing path of the controller without any cloud service.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from types import SimpleNamespace
+from typing import AsyncIterable, Dict, Iterator, List, Optional
+
+from services.alloyDB import _unique_batch
+from services.atm_index import NATURAL_KEY_LENGTH
+from services.storage import DownloadedFile
+
+
+class FakeSubscriber:
+    """
+    In-memory subscription with the synchronous pull API of
+    pubsub_v1.SubscriberClient.
+
+    Messages are delivered in publication order. A nack (deadline set to 0)
+    puts the message back at the end of the queue. The delivery and ack time
+    of every message are kept to compute per-file latencies.
+    """
+
+    def __init__(self, max_wait: float = 0.2):
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._messages: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.delivered_at: Dict[str, float] = {}
+        self.latencies: List[float] = []
+        self.outstanding = 0
+        self.redeliveries = 0
+
+    def publish(self, data: dict, attributes: dict) -> str:
+        with self._lock:
+            ack_id = f"ack-{self._next_id}"
+            self._next_id += 1
+            self._messages[ack_id] = (json.dumps(data).encode("utf-8"), attributes)
+            self.outstanding += 1
+        self._queue.put(ack_id)
+        return ack_id
+
+    def subscription_path(self, project: str, subscription: str) -> str:
+        return f"projects/{project}/subscriptions/{subscription}"
+
+    def pull(self, request, timeout: float = None):
+        # A real pull waits up to the timeout, a short wait keeps shutdown quick
+        received = []
+        try:
+            received.append(self._queue.get(timeout=min(timeout or self.max_wait, self.max_wait)))
+            while len(received) < request.max_messages:
+                received.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        now = time.perf_counter()
+        messages = []
+        for ack_id in received:
+            data, attributes = self._messages[ack_id]
+            self.delivered_at[ack_id] = now
+            messages.append(SimpleNamespace(
+                ack_id=ack_id, message=SimpleNamespace(data=data, attributes=attributes)
+            ))
+        return SimpleNamespace(received_messages=messages)
+
+    def acknowledge(self, request) -> None:
+        now = time.perf_counter()
+        with self._lock:
+            for ack_id in request["ack_ids"]:
+                if self._messages.pop(ack_id, None) is not None:
+                    self.latencies.append(now - self.delivered_at.pop(ack_id))
+                    self.outstanding -= 1
+
+    def modify_ack_deadline(self, request) -> None:
+        if request["ack_deadline_seconds"]:
+            return  # Lease extension
+        with self._lock:
+            self.redeliveries += len(request["ack_ids"])
+        for ack_id in request["ack_ids"]:
+            self._queue.put(ack_id)
+
+    @property
+    def done(self) -> bool:
+        return self.outstanding == 0
+
+
+class LocalBucket:
+    """
+    Cloud Storage stand-in serving files from a local directory, with the
+    signatures of services.storage.download_file_async and iter_file_chunks.
+    """
+
+    def __init__(self, directory: str, chunk_size: int = 1024 * 1024):
+        self.directory = directory
+        self.chunk_size = chunk_size
+
+    async def download_file_async(
+        self, file_path: str, generation: Optional[int] = None, size: Optional[int] = None
+    ) -> Optional[DownloadedFile]:
+        try:
+            with open(os.path.join(self.directory, file_path), "rb") as file:
+                content = file.read()
+        except FileNotFoundError:
+            return None
+        return DownloadedFile(content, len(content), 1)
+
+    def iter_file_chunks(self, file_path: str, chunk_size: int = None) -> Iterator[bytes]:
+        with open(os.path.join(self.directory, file_path), "rb") as file:
+            while True:
+                chunk = file.read(chunk_size or self.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+
+class FakeAtmTable:
+    """
+    In-process ATM table with the signatures of services.alloyDB's
+    upsert_atm_records and upsert_atm_batches, matching rows on the natural
+    key like the upsert statement does.
+    """
+
+    def __init__(self):
+        self.rows: Dict[tuple, tuple] = {}
+
+    def _apply(self, records) -> dict:
+        inserted = updated = unchanged = 0
+        for row in _unique_batch(records):
+            key = row[:NATURAL_KEY_LENGTH]
+            stored = self.rows.get(key)
+            if stored is None:
+                inserted += 1
+            elif stored == row:
+                unchanged += 1
+                continue
+            else:
+                updated += 1
+            self.rows[key] = row
+        return {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+
+    async def upsert_atm_records(self, records, chunk_size: int = None) -> dict:
+        return self._apply(records)
+
+    async def upsert_atm_batches(self, batches: AsyncIterable) -> dict:
+        totals = {"inserted": 0, "updated": 0, "unchanged": 0}
+        async for batch in batches:
+            for name, count in self._apply(batch).items():
+                totals[name] += count
+        return totals
@@ -0,0 +1,129 @@
+"""
+Synthetic ATM files for the benchmarks.
+
+Records are built from integer keys, so a scenario can be regenerated
+identically from its parameters: the same seed gives the same files.
+"""
+import json
+import os
+import random
+from typing import Iterator, List, NamedTuple
+
+TOWNS = ("Talca", "Santiago", "Valparaíso", "Concepción", "Temuco", "Antofagasta", "La Serena", "Puerto Montt")
+DISTRICTS = ("Las Condes", "Providencia", "Centro", "Ñuñoa", "Maipú")
+OPENING_HOURS = [
+    (f"2024-01-01 0{hour}:00:00.000", f"2024-01-01 1{hour}:30:00.000", f"0{hour}:00:00 - 1{hour}:30:00")
+    for hour in range(8)
+]
+
+
+class Scenario(NamedTuple):
+    """
+    Parameters of one benchmark run.
+
+    - records: Records per file.
+    - files: Number of files, one notification each.
+    - duplicate_ratio: Share of the records of a file repeating the natural
+      key of an earlier record of the same file.
+    - update_ratio: Share of the records whose natural key is already in the
+      table before the run.
+    - redelivery_ratio: Share of the notifications delivered twice.
+    - seed: Random seed.
+    """
+    records: int
+    files: int = 4
+    duplicate_ratio: float = 0.0
+    update_ratio: float = 0.0
+    redelivery_ratio: float = 0.0
+    seed: int = 0
+
+    @property
+    def existing(self) -> int:
+        # Size of the key range loaded before the run
+        return max(1, int(self.records * self.update_ratio))
+
+    @property
+    def name(self) -> str:
+        return (
+            f"{self.records}x{self.files}"
+            f"-dup{self.duplicate_ratio:g}-upd{self.update_ratio:g}-redeliver{self.redelivery_ratio:g}"
+        )
+
+
+def payload(key: int, variant: int = 0, prefix: str = "ATM") -> dict:
+    from_datetime, to_datetime, attention_hour = OPENING_HOURS[(key + variant) % len(OPENING_HOURS)]
+    return {
+        "atmidentifier": f"{prefix}{key:08d}",
+        "atmaddress_streetname": "Av. Vicuña Mackenna Ote",
+        "atmaddress_buildingnumber": str(key % 9000),
+        "atmtownname": TOWNS[key % len(TOWNS)],
+        "atmdistrictname": DISTRICTS[key % len(DISTRICTS)],
+        "atmcountrysubdivisionmajorname": "Región de Los Ríos",
+        "atmfromdatetime": from_datetime,
+        "atmtodatetime": to_datetime,
+        "atmtimetype": "CONT",
+        "atmattentionhour": attention_hour,
+        "atmservicetype": "DPST",
+        "atmaccesstype": "BRAN",
+    }
+
+
+def existing_records(scenario: Scenario, prefix: str = "ATM") -> Iterator[dict]:
+    """
+    The records in the table before the run, the targets of the updates.
+    """
+    for key in range(scenario.existing):
+        yield {"payload": payload(key, prefix=prefix)}
+
+
+def file_records(scenario: Scenario, file_index: int, prefix: str = "ATM") -> Iterator[dict]:
+    """
+    The records of one file. New keys never collide across files.
+    """
+    rng = random.Random(scenario.seed * 1_000_003 + file_index)
+    next_new_key = scenario.existing + file_index * scenario.records
+    written: List[int] = []
+    for _ in range(scenario.records):
+        draw = rng.random()
+        if written and draw < scenario.duplicate_ratio:
+            key = rng.choice(written)
+        elif draw < scenario.duplicate_ratio + scenario.update_ratio:
+            key = rng.randrange(scenario.existing)
+        else:
+            key = next_new_key
+            next_new_key += 1
+        written.append(key)
+        # A different variant changes the opening hours, so updates change rows
+        yield {"payload": payload(key, variant=1 + file_index, prefix=prefix)}
+
+
+def write_json_array(path: str, records: Iterator[dict]) -> int:
+    """
+    Writes records as a JSON array, one record per line, without holding
+    them all in memory.
+
+    Returns:
+        int: The size of the file in bytes.
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("[\n")
+        for index, record in enumerate(records):
+            if index:
+                file.write(",\n")
+            file.write(json.dumps(record, ensure_ascii=False))
+        file.write("\n]\n")
+    return os.path.getsize(path)
+
+
+def write_scenario(scenario: Scenario, directory: str, prefix: str = "ATM") -> List[str]:
+    """
+    Writes the files of a scenario and returns their names, relative to the
+    directory.
+    """
+    names = []
+    for file_index in range(scenario.files):
+        name = f"{scenario.name}/atm-{file_index:04d}.json"
+        os.makedirs(os.path.join(directory, scenario.name), exist_ok=True)
+        write_json_array(os.path.join(directory, name), file_records(scenario, file_index, prefix))
+        names.append(name)
+    return names
@@ -1,200 +1,681 @@
-from datetime import datetime
 import logging
 from os import getenv
 import asyncio
 import json
-from typing import NoReturn
-from google.cloud import pubsub_v1
-from google.pubsub_v1.types import PullRequest
-from google.oauth2 import service_account
+from dataclasses import dataclass
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Mapping, NamedTuple, NoReturn, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 import google.api_core.exceptions
-from services.in_memory_cache import add_message, is_message_processed
-from services.storage import download_file
-from services.alloyDB import execute_bulk_query
+import asyncpg
+from services.clients import subscriber_client
+from services.readiness import readiness
+from services.dedup import Seen, create_dedup_backend, dedup_in_flight_retry_seconds
+from services.storage import download_file_async, iter_file_chunks
+from services.alloyDB import (
+    get_atms_by_identifier,
+    get_atms_by_town,
+    list_atms,
+    upsert_atm_batches,
+    upsert_atm_records,
+)
+from services.read_cache import LISTING_TAG, CachedResponse, atm_batch_tags, atm_tag, read_cache, town_tag
+from services.json_stream import iter_json_records
+from services.decoder import (
+    AtmBatch,
+    ValidatedBatch,
+    decode_atm_records,
+    iter_atm_batches,
+    iter_validated_batches,
+    load_json,
+    validate_atm_file,
+)
+from services.pipeline import Pipeline, Stage
+from services.ack_manager import AckManager
+from services.pull_scheduler import PullScheduler
+from services.ingest_log import Lazy, Truncated, log_event
+from services.supervisor import Shard, shard_of
+from models.responseDTO import ResponseDTO
+from services.metrics import (
+    dedup_hits_total,
+    files_total,
+    messages_total,
+    record_error,
+    records_total,
+    stage_seconds,
+    timed_stage,
+)
 import hashlib
 
 subscriber = None
 subscription_path = None
+pipeline = None
+ack_manager = None
+# Set in the subscriber worker processes of the supervisor mode
+shard: Optional[Shard] = None
+dedup_backend = create_dedup_backend()
+# Messages held until they are released for a later redelivery
+deferred_nacks: set = set()
 
 project_id = getenv("GCP_PROJECT_ID")
 subscription_id = getenv("SUBSCRIPTION_ID")
-max_messages = int(getenv("MAX_MESSAGES", 1))
-credentials_path = getenv("GCP_CREDENTIALS")
+# Pull sizes adapt between PULL_MIN_MESSAGES and MAX_MESSAGES (see PullScheduler)
+max_messages = int(getenv("MAX_MESSAGES", 1000))
+pull_min_messages = int(getenv("PULL_MIN_MESSAGES", 1))
+# Received messages not yet acked above which pulls shrink
+pull_max_in_flight = int(getenv("PULL_MAX_IN_FLIGHT", 1000))
+# Pause after an empty or failed pull, doubled up to the maximum while it repeats
+pull_backoff_min_seconds = float(getenv("PULL_BACKOFF_MIN_SECONDS", 0.1))
+pull_backoff_max_seconds = float(getenv("PULL_BACKOFF_MAX_SECONDS", 10))
+# "pull" (synchronous pull, run off the event loop) or "streaming" (streaming pull with flow control)
+pull_mode = getenv("PULL_MODE", "pull")
+flow_control_max_messages = int(getenv("FLOW_CONTROL_MAX_MESSAGES", 100))
+flow_control_max_bytes = int(getenv("FLOW_CONTROL_MAX_BYTES", 100 * 1024 * 1024))
+pipeline_workers = int(getenv("PIPELINE_WORKERS", 4))
+pipeline_queue_size = int(getenv("PIPELINE_QUEUE_SIZE", 16))
+# "buffered" (download the whole file, then parse it) or "streaming" (parse and write while reading)
+ingest_mode = getenv("INGEST_MODE", "buffered")
+stream_batch_size = int(getenv("STREAM_BATCH_SIZE", 5000))
+# Acks are sent in batches every ACK_FLUSH_INTERVAL seconds; in-flight messages
+# get their ack deadline extended to ACK_DEADLINE_SECONDS for up to MAX_LEASE_SECONDS
+ack_flush_interval = float(getenv("ACK_FLUSH_INTERVAL", 0.1))
+ack_deadline_seconds = int(getenv("ACK_DEADLINE_SECONDS", 60))
+max_lease_seconds = int(getenv("MAX_LEASE_SECONDS", 3600))
+# Validate ingested records against the ingest schema, skipping invalid ones
+validate_ingest = getenv("VALIDATE_INGEST", "true").lower() == "true"
+max_logged_validation_errors = 10
+# Message identity used for deduplication: "notification", "raw" or "canonical"
+message_identity = getenv("MESSAGE_IDENTITY", "notification")
+max_page_size = int(getenv("MAX_PAGE_SIZE", 500))
+
+router = APIRouter()
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-async def initialize_pubsub_service() -> None:
-    global subscriber, subscription_path
-    credentials = service_account.Credentials.from_service_account_file(
-        credentials_path
-    )
-    subscriber = pubsub_v1.SubscriberClient(credentials=credentials)
+class IncomingMessage(NamedTuple):
+    """
+    A received Pub/Sub message, independent of the intake mode.
+    """
+    data: bytes
+    attributes: Mapping[str, str]
+    ack: Callable[[], Awaitable[None]]
+    nack: Callable[[], Awaitable[None]]
+    # Only for synchronous pulls, where any client of the subscription can ack it
+    ack_id: Optional[str] = None
+
+@dataclass
+class FileJob:
+    """
+    A file moving through the processing pipeline.
+    """
+    file_name: str
+    ack: Callable[[], Awaitable[None]]
+    nack: Callable[[], Awaitable[None]]
+    message_hash: bytes
+    content: Optional[bytes] = None
+    generation: Optional[int] = None
+    size: Optional[int] = None
+    insert_values: Optional[AtmBatch] = None
+    batches: Optional[Iterator[AtmBatch]] = None
+
+async def initialize_pubsub_service(worker_shard: Optional[Shard] = None) -> None:
+    """
+    Starts the subscriber.
+
+    Parameters:
+    - worker_shard (Shard): In a subscriber worker process, the files it owns;
+      the files of other workers are handed over to them.
+    """
+    global subscriber, subscription_path, pipeline, ack_manager, shard
+    shard = worker_shard
+    # Usually created already by the startup warm-up, with the shared credentials
+    subscriber = await asyncio.get_running_loop().run_in_executor(None, subscriber_client.get)
     subscription_path = subscriber.subscription_path(project_id, subscription_id)
-    asyncio.create_task(listen_for_messages())
+    ack_manager = AckManager(
+        acknowledge,
+        modify_ack_deadline,
+        flush_interval=ack_flush_interval,
+        ack_deadline=ack_deadline_seconds,
+        max_lease=max_lease_seconds,
+    )
+    pipeline = create_pipeline()
+    pipeline.start()
+    if shard is not None:
+        asyncio.create_task(receive_handed_over_files())
+    if pull_mode == "streaming":
+        asyncio.create_task(stream_messages())
+    else:
+        asyncio.create_task(listen_for_messages())
+
+async def process_messages(messages: List[IncomingMessage]) -> None:
+    """
+    Process a batch of Pub/Sub messages.
+
+    The whole batch is checked against the deduplication store at once, then
+    every message is handled by process_message. If the batch fails, only
+    the messages not yet acked, nacked or submitted are nacked, and only
+    the digests they claimed are discarded.
+
+    Parameters:
+    - messages (list[IncomingMessage]): The received messages.
+    """
+    messages_total.inc(len(messages))
+    # Positions of the messages not settled yet, and the digest each claimed
+    unsettled: Dict[int, Optional[bytes]] = dict.fromkeys(range(len(messages)))
+    try:
+        await _process_batch(messages, unsettled)
+    except Exception as e:
+        logging.error(f"Error processing {len(unsettled)} of {len(messages)} messages: {str(e)}")
+        record_error(e)
+        for position in unsettled:
+            await messages[position].nack()
+        for message_hash in unsettled.values():
+            if message_hash is None:
+                continue
+            try:
+                await dedup_backend.discard(message_hash)
+            except Exception as discard_error:
+                # The claim expires on its own in the shared stores
+                logging.error(f"Failed to discard message_hash {message_hash.hex()}: {str(discard_error)}")
+
+async def _process_batch(messages: List[IncomingMessage], unsettled: Dict[int, Optional[bytes]]) -> None:
+    parsed = []
+    for position, message in enumerate(messages):
+        try:
+            message_data = json.loads(message.data.decode("utf-8"))
+        except json.JSONDecodeError as json_err:
+            # A malformed notification will never decode, do not let it be redelivered
+            logging.error(f"Error decoding JSON: {str(json_err)}")
+            record_error(json_err)
+            await message.ack()
+            del unsettled[position]
+            continue
+        parsed.append((position, message, message_data, get_message_hash(message, message_data)))
+    if not parsed:
+        return
+
+    with stage_seconds.labels("dedup").time():
+        duplicates = await dedup_backend.check_and_add_many(
+            [message_hash for _, _, _, message_hash in parsed]
+        )
+    for (position, _, _, message_hash), duplicate in zip(parsed, duplicates):
+        if duplicate is Seen.NEW:
+            unsettled[position] = message_hash
+    for (position, message, message_data, message_hash), duplicate in zip(parsed, duplicates):
+        try:
+            await process_message(message, message_data, message_hash, duplicate)
+        except Exception as e:
+            logging.error(f"Error processing message: {str(e)}")
+            record_error(e)
+            await dedup_backend.discard(message_hash)
+            await message.nack()
+        del unsettled[position]
+
+async def process_message(message: IncomingMessage, message_data: dict, message_hash: bytes, duplicate: bool) -> None:
+    """
+    Process a single Pub/Sub message.
+
+    Messages that need no work are acknowledged right away; OBJECT_FINALIZE
+    notifications are submitted to the file processing pipeline, which
+    acknowledges them once their file is committed.
+
+    Parameters:
+    - message (IncomingMessage): The received message.
+    - message_data (dict): The decoded message data.
+    - message_hash (bytes): The message digest.
+    - duplicate (bool): Whether the message was already processed.
+    """
+    log_event("message", logging.INFO, "Received message %s: %s", Lazy(message_hash.hex), Truncated(message_data))
+
+    if duplicate is Seen.IN_FLIGHT:
+        # Acking it would lose the file if the delivery in flight fails
+        log_event("in_flight", logging.INFO, "Message in flight elsewhere, retried later: %s", Lazy(message_hash.hex))
+        defer_nack(message)
+        return
+
+    if duplicate:
+        log_event("duplicate", logging.INFO, "Already processed message_hash: %s", Lazy(message_hash.hex))
+        dedup_hits_total.inc()
+        await message.ack()
+        return
+
+    event_type = message.attributes.get("eventType")
+
+    if event_type == "OBJECT_FINALIZE":
+        file_name = message_data.get("name")
+        if file_name:
+            log_event("file", logging.INFO, "File name: %s", file_name)
+            await submit_file(
+                message, file_name, message_hash,
+                notified_generation(message, message_data), notified_size(message_data),
+            )
+        else:
+            logging.warning("No file name found in the message")
+            await dedup_backend.commit(message_hash)
+            await message.ack()
+    else:
+        log_event("ignored", logging.INFO, "Ignoring message with event type: %s", event_type)
+        await dedup_backend.commit(message_hash)
+        await message.ack()
+
+def defer_nack(message: IncomingMessage, delay: float = None) -> None:
+    """
+    Nacks the message after a delay, so that it is redelivered once the
+    delivery in flight is likely over, without being redelivered in a loop
+    meanwhile. Its lease is kept until then.
+    """
+    async def nack_later() -> None:
+        await asyncio.sleep(dedup_in_flight_retry_seconds if delay is None else delay)
+        await message.nack()
+
+    task = asyncio.create_task(nack_later())
+    deferred_nacks.add(task)
+    task.add_done_callback(deferred_nacks.discard)
+
+def notified_generation(message: IncomingMessage, message_data: dict) -> Optional[int]:
+    """
+    Returns the object generation a notification is about, if it names one.
+    """
+    generation = message.attributes.get("objectGeneration") or message_data.get("generation")
+    try:
+        return int(generation) if generation else None
+    except (TypeError, ValueError):
+        return None
+
+def notified_size(message_data: dict) -> Optional[int]:
+    """
+    Returns the size in bytes of the object a notification is about, if it
+    names one.
+    """
+    try:
+        return int(message_data["size"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+async def submit_file(
+    message: IncomingMessage,
+    file_name: str,
+    message_hash: bytes,
+    generation: Optional[int] = None,
+    size: Optional[int] = None,
+) -> None:
+    """
+    Submits a file to the pipeline, or hands it over to the worker process
+    owning it when the subscriber runs in several processes.
+    """
+    if shard is not None and message.ack_id is not None:
+        owner = shard_of(file_name, shard.count)
+        if owner != shard.index:
+            ack_manager.release(message.ack_id)
+            shard.queues[owner].put((message.ack_id, file_name, message_hash, generation, size))
+            return
+    await pipeline.submit(FileJob(
+        file_name=file_name,
+        ack=message.ack,
+        nack=message.nack,
+        message_hash=message_hash,
+        generation=generation,
+        size=size,
+    ))
+
+async def receive_handed_over_files() -> None:
+    """
+    Submits the files handed over by the other worker processes, already
+    deduplicated, and keeps their messages leased until they are acked.
+    """
+    loop = asyncio.get_running_loop()
+    inbound = shard.queues[shard.index]
+    while True:
+        item = await loop.run_in_executor(None, inbound.get)
+        if item is None:
+            return
+        ack_id, file_name, message_hash, generation, size = item
+        ack_manager.lease(ack_id)
+        await pipeline.submit(FileJob(
+            file_name=file_name,
+            ack=partial(ack_manager.ack, ack_id),
+            nack=partial(ack_manager.nack, ack_id),
+            message_hash=message_hash,
+            generation=generation,
+            size=size,
+        ))
+
+async def download_stage(job: FileJob) -> None:
+    if ingest_mode == "streaming":
+        # Nothing is downloaded up front: the file is read, parsed and written
+        # batch by batch in the write stage
+        records = iter_json_records(iter_file_chunks(job.file_name))
+        if validate_ingest:
+            job.batches = valid_batches(job.file_name, iter_validated_batches(records, stream_batch_size))
+        else:
+            job.batches = iter_atm_batches(records, stream_batch_size)
+        return
+    # With the notified generation, a file already downloaded is read from the
+    # blob cache; with its size as well, a large file is read in parallel ranges
+    downloaded = await download_file_async(job.file_name, job.generation, job.size)
+    if not downloaded:
+        raise FileNotFoundError(f"Failed to download file content for {job.file_name}")
+    job.content = downloaded.content
+    job.generation = downloaded.generation
+    logging.info(f"File content downloaded successfully ({downloaded.size} bytes)")
+
+async def decode_stage(job: FileJob) -> None:
+    if job.batches is not None:
+        return
+    if validate_ingest:
+        validated = validate_atm_file(job.content)
+        log_validation_errors(job.file_name, validated.errors)
+        job.insert_values = validated.batch
+    else:
+        file_data = load_json(job.content)
+        if isinstance(file_data, dict):
+            file_data = [file_data]  # Convert to list if it's a single record
+        job.insert_values = decode_atm_records(file_data)
+    job.content = None
+
+def valid_batches(file_name: str, validated_batches: Iterator[ValidatedBatch]) -> Iterator[AtmBatch]:
+    for validated in validated_batches:
+        log_validation_errors(file_name, validated.errors)
+        yield validated.batch
+
+def log_validation_errors(file_name: str, errors: List[Tuple[int, str]]) -> None:
+    if not errors:
+        return
+    logging.error(f"Skipped {len(errors)} invalid records in {file_name}")
+    for index, message in errors[:max_logged_validation_errors]:
+        logging.error(f"Invalid record {index} in {file_name}: {message}")
+
+async def write_stage(job: FileJob) -> None:
+    if job.batches is not None:
+        tags = set()
+        result = await upsert_atm_batches(read_batches(job.batches, tags))
+    else:
+        tags = atm_batch_tags(job.insert_values)
+        result = await upsert_atm_records(job.insert_values)
+    # The records are committed, drop the cached read responses built before
+    invalidate_reads(tags)
+    records_total.labels("updated").inc(result["updated"])
+    records_total.labels("inserted").inc(result["inserted"])
+    records_total.labels("unchanged").inc(result["unchanged"])
+    logging.info(f"Updated {result['updated']} records")
+    logging.info(f"Inserted {result['inserted']} new records")
+    logging.info(
+        f"File {job.file_name}: {result['inserted'] + result['updated']} records changed, "
+        f"{result['unchanged']} unchanged"
+    )
+
+def invalidate_reads(tags: set) -> None:
+    read_cache.invalidate(tags)
+    if shard is not None and shard.events is not None:
+        # In a worker process: the reads are served by the HTTP process
+        shard.events.put(("invalidate", list(tags)))
+
+async def read_batches(batches: Iterator[AtmBatch], tags: Optional[set] = None) -> AsyncIterator[AtmBatch]:
+    # Reading and parsing a batch blocks, so it runs in the default executor
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = await loop.run_in_executor(None, next, batches, None)
+        if batch is None:
+            return
+        if tags is not None:
+            tags.update(atm_batch_tags(batch))
+        yield batch
+
+async def ack_stage(job: FileJob) -> None:
+    # Only now is a redelivery a duplicate
+    await dedup_backend.commit(job.message_hash)
+    await job.ack()
+    files_total.labels("processed").inc()
+    readiness.message_processed()
+
+# Failures that a later delivery may not meet: everything else, a missing
+# file or records the decoder or the database reject, fails the same way on
+# every delivery
+TRANSIENT_ERRORS = (
+    # Connections, timeouts and corrupted transfers, FileNotFoundError aside
+    OSError,
+    asyncio.TimeoutError,
+    MemoryError,
+    google.api_core.exceptions.ServerError,
+    google.api_core.exceptions.TooManyRequests,
+    google.api_core.exceptions.RetryError,
+    asyncpg.exceptions.InterfaceError,
+    asyncpg.exceptions.PostgresConnectionError,
+    # Deadlocks and serialization failures
+    asyncpg.exceptions.TransactionRollbackError,
+    asyncpg.exceptions.InsufficientResourcesError,
+    # Canceled statements, server shutdowns and restarts
+    asyncpg.exceptions.OperatorInterventionError,
+)
+
+def is_transient(error: Exception) -> bool:
+    """
+    Tells a failure worth a redelivery of the file from a permanent one.
+    """
+    return isinstance(error, TRANSIENT_ERRORS) and not isinstance(error, FileNotFoundError)
+
+async def on_pipeline_error(job: FileJob, error: Exception) -> None:
+    logging.error(f"Error processing file {job.file_name}: {str(error)}")
+    record_error(error)
+    if not is_transient(error):
+        # Redelivered, it would fail the same way, forever
+        files_total.labels("rejected").inc()
+        await dedup_backend.commit(job.message_hash)
+        await job.ack()
+        return
+    files_total.labels("failed").inc()
+    # Let Pub/Sub redeliver the notification right away, and process it then
+    await dedup_backend.discard(job.message_hash)
+    await job.nack()
+
+def create_pipeline() -> Pipeline:
+    return Pipeline(
+        stages=[
+            Stage("download", timed_stage("download", download_stage), pipeline_workers),
+            Stage("decode", timed_stage("decode", decode_stage), pipeline_workers),
+            Stage("write", timed_stage("write", write_stage), pipeline_workers),
+            Stage("ack", timed_stage("ack", ack_stage)),
+        ],
+        key=lambda job: job.file_name,
+        queue_size=pipeline_queue_size,
+        on_error=on_pipeline_error,
+    )
 
 async def listen_for_messages() -> NoReturn:
+    from google.pubsub_v1.types import PullRequest
+
     logging.info("Listening for messages...")
+    loop = asyncio.get_running_loop()
+    ack_manager.start()
+    scheduler = PullScheduler(
+        min_batch=pull_min_messages,
+        max_batch=max_messages,
+        max_in_flight=pull_max_in_flight,
+        min_backoff=pull_backoff_min_seconds,
+        max_backoff=pull_backoff_max_seconds,
+    )
     while True:
         try:
-            response = subscriber.pull(
-                request=PullRequest(
-                    subscription=subscription_path,
-                    max_messages=max_messages,
-                    return_immediately=False,
-                ),
-                timeout=90,
-            )
-            if response.received_messages:
-                ack_ids = []
-                for msg in response.received_messages:
-                    try:
-                        message_data = json.loads(msg.message.data.decode("utf-8"))
-                        message_hash = get_message_hash(message_data)
-                        logging.info(f"Received message: {msg.message.data.decode('utf-8')}")
-                        logging.info(f"message_hash: {message_hash}")
-                        
-                        if await is_message_processed(message_hash):
-                            logging.info(f"Already processed message_hash: {message_hash}")
-                            ack_ids.append(msg.ack_id)
-                            continue
-                        
-                        await add_message(message_hash)
-                        event_type = msg.message.attributes.get("eventType")
-                        logging.info(f"event_type: {event_type}")
-                        
-                        if event_type == "OBJECT_FINALIZE":
-                            logging.info(f"Received message: {message_data}")
-                            ack_ids.append(msg.ack_id)
-                            
-                            file_name = message_data.get("name")
-                            if file_name:
-                                logging.info(f"File name: {file_name}")
-                                file_content = download_file(file_name)
-                                if file_content:
-                                    logging.info("File content downloaded successfully")
-                                    file_data = json.loads(file_content.decode('utf-8'))
-                                    if isinstance(file_data, dict):
-                                        file_data = [file_data]  # Convert to list if it's a single record
-                                    
-                                    check_values = []
-                                    insert_values = []
-                                    for record in file_data:
-                                        payload = record.get("payload", {})
-                                        
-                                        # Convert date strings to datetime objects
-                                        atmfromdatetime = datetime.strptime(payload.get("atmfromdatetime"), "%Y-%m-%d %H:%M:%S.%f")
-                                        atmtodatetime = datetime.strptime(payload.get("atmtodatetime"), "%Y-%m-%d %H:%M:%S.%f")
-                                        
-                                        check_values.append((
-                                            payload.get("atmidentifier"),
-                                            payload.get("atmaddress_streetname"),
-                                            payload.get("atmaddress_buildingnumber"),
-                                            payload.get("atmtownname"),
-                                            payload.get("atmdistrictname"),
-                                            payload.get("atmcountrysubdivisionmajorname")
-                                        ))
-                                        
-                                        insert_values.append((
-                                            payload.get("atmidentifier"),
-                                            payload.get("atmaddress_streetname"),
-                                            payload.get("atmaddress_buildingnumber"),
-                                            payload.get("atmtownname"),
-                                            payload.get("atmdistrictname"),
-                                            payload.get("atmcountrysubdivisionmajorname"),
-                                            atmfromdatetime,
-                                            atmtodatetime,
-                                            payload.get("atmtimetype"),
-                                            payload.get("atmattentionhour"),
-                                            payload.get("atmservicetype"),
-                                            payload.get("atmaccesstype")
-                                        ))
-                                    
-                                    # Check for existing records
-                                    check_query = """
-                                        SELECT id, atmidentifier, atmaddress_streetname, atmaddress_buildingnumber,
-                                               atmtownname, atmdistrictname, atmcountrysubdivisionmajorname
-                                        FROM presential_service_channels.automated_teller_machines
-                                        WHERE (atmidentifier, atmaddress_streetname, atmaddress_buildingnumber,
-                                               atmtownname, atmdistrictname, atmcountrysubdivisionmajorname) = ($1, $2, $3, $4, $5, $6)
-                                    """
-                                    existing_records = await execute_bulk_query(check_query, check_values)
-                                    
-                                    # Prepare update and insert lists
-                                    update_values = []
-                                    new_insert_values = []
-                                    
-                                    if existing_records is not None:
-                                        for i, record in enumerate(insert_values):
-                                            matching_record = next((er for er in existing_records if er[1:] == check_values[i]), None)
-                                            if matching_record:
-                                                update_values.append((
-                                                    record[6],  # atmfromdatetime
-                                                    record[7],  # atmtodatetime
-                                                    record[8],  # atmtimetype
-                                                    record[9],  # atmattentionhour
-                                                    record[10], # atmservicetype
-                                                    record[11], # atmaccesstype
-                                                    matching_record[0]  # id
-                                                ))
-                                            else:
-                                                new_insert_values.append(record)
-                                    else:
-                                        logging.warning("No existing records found or query returned None. Proceeding with insert for all records.")
-                                        new_insert_values = insert_values
-                                    
-                                    # Perform updates
-                                    if update_values:
-                                        update_query = """
-                                            UPDATE presential_service_channels.automated_teller_machines
-                                            SET atmfromdatetime = $1,
-                                                atmtodatetime = $2,
-                                                atmtimetype = $3,
-                                                atmattentionhour = $4,
-                                                atmservicetype = $5,
-                                                atmaccesstype = $6
-                                            WHERE id = $7
-                                        """
-                                        update_result = await execute_bulk_query(update_query, update_values)
-                                        logging.info(f"Updated {update_result} records")
-                                    
-                                    # Perform inserts
-                                    if new_insert_values:
-                                        insert_query = """
-                                            INSERT INTO presential_service_channels.automated_teller_machines (
-                                                atmidentifier, atmaddress_streetname, atmaddress_buildingnumber,
-                                                atmtownname, atmdistrictname, atmcountrysubdivisionmajorname,
-                                                atmfromdatetime, atmtodatetime, atmtimetype,
-                                                atmattentionhour, atmservicetype, atmaccesstype
-                                            ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
-                                        """
-                                        insert_result = await execute_bulk_query(insert_query, new_insert_values)
-                                        logging.info(f"Inserted {insert_result} new records")
-                                else:
-                                    logging.error(f"Failed to download file content for {file_name}")
-                            else:
-                                logging.warning("No file name found in the message")
-                        else:
-                            logging.info(f"Ignoring message with event type: {event_type}")
-                    
-                    except json.JSONDecodeError as json_err:
-                        logging.error(f"Error decoding JSON: {str(json_err)}")
-                    except ValueError as ve:
-                        logging.error(f"Error parsing datetime: {str(ve)}")
-                    except Exception as e:
-                        logging.error(f"Error processing message: {str(e)}")
-                    
-                if ack_ids:
-                    subscriber.acknowledge(
-                        request={"subscription": subscription_path, "ack_ids": ack_ids}
-                    )
+            # The synchronous pull blocks for up to 90 seconds, keep it off the event loop
+            with stage_seconds.labels("pull").time():
+                response = await loop.run_in_executor(
+                    None,
+                    partial(
+                        subscriber.pull,
+                        request=PullRequest(
+                            subscription=subscription_path,
+                            max_messages=scheduler.next_batch_size(),
+                            return_immediately=False,
+                        ),
+                        timeout=90,
+                    ),
+                )
+            for msg in response.received_messages:
+                ack_manager.lease(msg.ack_id)
+            await process_messages([
+                IncomingMessage(
+                    msg.message.data,
+                    msg.message.attributes,
+                    partial(ack_manager.ack, msg.ack_id),
+                    partial(ack_manager.nack, msg.ack_id),
+                    msg.ack_id,
+                )
+                for msg in response.received_messages
+            ])
+            delay = scheduler.on_pull(len(response.received_messages), ack_manager.in_flight)
         except google.api_core.exceptions.DeadlineExceeded:
             logging.warning("DeadlineExceeded: Pull request timed out, retrying...")
+            delay = scheduler.on_pull(0, ack_manager.in_flight)
         except Exception as e:
             logging.error(f"Unexpected error in listen_for_messages: {str(e)}")
-        
-        await asyncio.sleep(1)
+            record_error(e)
+            delay = scheduler.on_error()
+
+        if delay:
+            await asyncio.sleep(delay)
+
+def acknowledge(ack_ids: List[str]) -> None:
+    subscriber.acknowledge(
+        request={"subscription": subscription_path, "ack_ids": ack_ids}
+    )
+
+def modify_ack_deadline(ack_ids: List[str], ack_deadline_seconds: int) -> None:
+    subscriber.modify_ack_deadline(
+        request={
+            "subscription": subscription_path,
+            "ack_ids": ack_ids,
+            "ack_deadline_seconds": ack_deadline_seconds,
+        }
+    )
+
+async def stream_messages() -> NoReturn:
+    """
+    Receive messages through a streaming pull.
 
-def get_message_hash(message_data: dict) -> str:
-    message_str = json.dumps(message_data, sort_keys=True)
-    return hashlib.sha256(message_str.encode("utf-8")).hexdigest()
\ No newline at end of file
+    The client library delivers messages on its own threads; they are handed
+    over to the event loop through a queue and processed there. Flow control
+    bounds the number of outstanding messages and bytes, which also bounds the
+    queue.
+    """
+    from google.cloud import pubsub_v1
+
+    logging.info("Listening for messages (streaming pull)...")
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def callback(message) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    # The client library batches acks and extends leases itself
+    flow_control = pubsub_v1.types.FlowControl(
+        max_messages=flow_control_max_messages,
+        max_bytes=flow_control_max_bytes,
+        max_lease_duration=max_lease_seconds,
+    )
+    streaming_pull_future = subscriber.subscribe(
+        subscription_path, callback=callback, flow_control=flow_control
+    )
+    try:
+        while True:
+            # Take whatever has arrived so it is deduplicated as one batch
+            messages = [await queue.get()]
+            while not queue.empty() and len(messages) < flow_control_max_messages:
+                messages.append(queue.get_nowait())
+            try:
+                await process_messages([
+                    IncomingMessage(
+                        message.data,
+                        message.attributes,
+                        partial(ack_message, message),
+                        partial(nack_message, message),
+                    )
+                    for message in messages
+                ])
+            except Exception as e:
+                # process_messages nacks the messages it could not settle
+                logging.error(f"Unexpected error in stream_messages: {str(e)}")
+                record_error(e)
+    finally:
+        streaming_pull_future.cancel()
+
+async def ack_message(message) -> None:
+    message.ack()
+
+async def nack_message(message) -> None:
+    message.nack()
+
+def get_message_hash(message: IncomingMessage, message_data: dict) -> bytes:
+    """
+    Returns the 32-byte identity of a message, as selected by MESSAGE_IDENTITY:
+
+    - "notification": the GCS object the notification is about (event type,
+      bucket, name, generation and metageneration). A rewritten object has a
+      new generation, so it is new work even if the payload looks the same.
+      Falls back to "raw" for messages that do not describe an object.
+    - "raw": a hash of the message bytes as received.
+    - "canonical": a hash of the message data re-serialized with sorted keys.
+    """
+    if message_identity == "notification":
+        attributes = message.attributes
+        name = attributes.get("objectId") or message_data.get("name")
+        generation = attributes.get("objectGeneration") or message_data.get("generation")
+        if name and generation:
+            key = "\x1f".join((
+                attributes.get("eventType") or "",
+                attributes.get("bucketId") or message_data.get("bucket") or "",
+                name,
+                str(generation),
+                str(message_data.get("metageneration") or ""),
+            ))
+            return hashlib.blake2b(key.encode("utf-8"), digest_size=32).digest()
+    elif message_identity == "canonical":
+        message_str = json.dumps(message_data, sort_keys=True)
+        return hashlib.sha256(message_str.encode("utf-8")).digest()
+    return hashlib.blake2b(message.data, digest_size=32).digest()
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def json_response(request: Request, cached: CachedResponse) -> Response:
+    """
+    Builds the response for a cached body, or a 304 Not Modified when the
+    client already has it.
+    """
+    headers = {"ETag": cached.etag}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+@router.get("/atms", response_model=List[ResponseDTO])
+async def get_atms(
+    request: Request,
+    page: int = Query(1, ge=1),
+    size: int = Query(100, ge=1, le=max_page_size),
+) -> Response:
+    cached = await read_cache.get_or_load(
+        ("page", page, size), [LISTING_TAG], partial(list_atms, page, size)
+    )
+    return json_response(request, cached)
+
+@router.get("/atms/{atm_identifier}", response_model=List[ResponseDTO])
+async def get_atm(request: Request, atm_identifier: str) -> Response:
+    cached = await read_cache.get_or_load(
+        ("atm", atm_identifier), [atm_tag(atm_identifier)], partial(get_atms_by_identifier, atm_identifier)
+    )
+    if cached.body == b"[]":
+        raise HTTPException(status_code=404, detail=f"ATM {atm_identifier} not found")
+    return json_response(request, cached)
+
+@router.get("/towns/{town_name}/atms", response_model=List[ResponseDTO])
+async def get_town_atms(request: Request, town_name: str, district: Optional[str] = None) -> Response:
+    cached = await read_cache.get_or_load(
+        ("town", town_name, district), [town_tag(town_name)], partial(get_atms_by_town, town_name, district)
+    )
+    return json_response(request, cached)
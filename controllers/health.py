@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from services.readiness import readiness
+
+router = APIRouter()
+
+
+@router.get("/ready")
+async def ready() -> JSONResponse:
+    """
+    Reports whether every dependency is warm, with the time each one took
+    and the time to the first processed message; 503 until all are ready.
+    """
+    report = readiness.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
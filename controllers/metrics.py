@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Response
+from services import alloyDB, in_memory_cache, storage
+from services.metrics import register_gauge, render
+from services.read_cache import read_cache
+import controllers.extractTyc as extractTyc
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+router = APIRouter()
+
+
+def _pool_connections() -> dict:
+    stats = alloyDB.pool_stats()
+    return {state: stats[state] for state in ("in_use", "idle", "size", "max_size") if state in stats}
+
+
+register_gauge(
+    "atm_dedup_cache_entries", "Message digests held in the in-process dedup cache.",
+    lambda: len(in_memory_cache.cache),
+)
+register_gauge(
+    "atm_read_cache_entries", "Responses held in the read cache.",
+    lambda: len(read_cache),
+)
+register_gauge(
+    "atm_blob_cache_bytes", "Size of the downloaded files held in the blob cache.",
+    lambda: storage.blob_cache.size if storage.blob_cache else None,
+)
+register_gauge(
+    "atm_db_pool_connections", "Database pool connections, by state.",
+    _pool_connections, ("state",),
+)
+register_gauge(
+    "atm_ingest_messages_in_flight", "Received messages not yet acked or nacked.",
+    lambda: extractTyc.ack_manager.in_flight if extractTyc.ack_manager else None,
+)
+register_gauge(
+    "atm_ingest_files_pending", "Files submitted to the pipeline and not finished.",
+    lambda: extractTyc.pipeline.pending if extractTyc.pipeline else None,
+)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    return Response(content=render(), media_type=CONTENT_TYPE)
@@ -1,30 +1,84 @@
+# Imported first: importing services.readiness starts the startup timer
+from services.readiness import readiness
+import asyncio
 from os import getenv
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from services.alloyDB import init_db_pool
-from services.in_memory_cache import set_expiration_time, start_cleaning_task
+from services.clients import credentials, subscriber_client
+from services.storage import get_blob_cache, get_bucket
+from services.in_memory_cache import cache, set_expiration_time, start_cleaning_task
+from services.dedup_snapshot import start_dedup_persistence, stop_dedup_persistence
 from controllers.extractTyc import initialize_pubsub_service
+from services.supervisor import Supervisor, subscriber_workers
+from services.ingest_log import start_queue_logging, stop_queue_logging
+from api.router import router
 app = FastAPI()
+app.include_router(router)
 
 # Load environment variables
 load_dotenv()
 cleaning_interval_hours = int(getenv("CLEANING_INTERVAL_HOURS", 1))  # Default to 1 hour
+supervisor = None
+startup_task = None
 
-async def startup_event():
-    await init_db_pool()
-    print("db pool initialized succesfully")
-     # Initialize in-memory cache
+async def in_thread(function) -> None:
+    await asyncio.get_running_loop().run_in_executor(None, function)
+
+def open_storage() -> None:
+    get_bucket()
+    # Indexes the files kept from before the restart
+    get_blob_cache()
+
+def refresh_credentials() -> None:
+    # Fetch the first access token now rather than on the first request
+    from google.auth.transport.requests import Request
+    credentials.get().refresh(Request())
+
+async def start_services():
+    global supervisor
+    if subscriber_workers > 1:
+        readiness.expect("database", "subscriber_workers")
+        await readiness.warm("database", init_db_pool)
+        # The HTTP app stays in this process, the subscriber runs in worker processes
+        supervisor = Supervisor(subscriber_workers)
+        supervisor.start()
+        readiness.mark_ready("subscriber_workers")
+        return
+    readiness.expect("dedup_cache", "credentials", "database", "storage", "pubsub", "subscriber")
+    # Initialize in-memory cache
     set_expiration_time(cleaning_interval_hours)
+    # Messages processed before a restart are still known as such
+    start_dedup_persistence(cache)
     start_cleaning_task()
-    print("In-memory cache initialized successfully")
-    await initialize_pubsub_service()
-    print("pull subscriber initialized succesfully")
+    readiness.mark_ready("dedup_cache")
+    # The clients share one credentials load, whichever needs it first
+    await asyncio.gather(
+        readiness.warm("credentials", lambda: in_thread(refresh_credentials)),
+        readiness.warm("database", init_db_pool),
+        readiness.warm("storage", lambda: in_thread(open_storage)),
+        readiness.warm("pubsub", lambda: in_thread(subscriber_client.get)),
+    )
+    await readiness.warm("subscriber", initialize_pubsub_service)
 
-    return
+async def startup_event():
+    global startup_task
+    start_queue_logging()
+    # Serve /ready while the dependencies warm up
+    startup_task = asyncio.create_task(start_services())
+
+async def shutdown_event():
+    if startup_task:
+        startup_task.cancel()
+        await asyncio.gather(startup_task, return_exceptions=True)
+    if supervisor:
+        await supervisor.stop()
+    await stop_dedup_persistence()
+    stop_queue_logging()
 
 app.add_event_handler("startup", startup_event)
+app.add_event_handler("shutdown", shutdown_event)
 
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8080, reload=True)
-
@@ -0,0 +1,53 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Optional
+from pydantic import ConfigDict, PlainValidator
+from typing_extensions import Annotated, NotRequired, Required, TypedDict
+from models.bodyRequestDto import AutomatedTellerMachines
+
+# Format of the timestamps of ingested files
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+@lru_cache(maxsize=4096)
+def _parse_ingest_timestamp(value: str) -> datetime:
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def _ingest_timestamp(value: Any) -> datetime:
+    # Only the ingest format is accepted: pydantic's own datetime parsing
+    # would also take ISO 8601 strings and epoch numbers, and return
+    # timezone-aware datetimes the timestamp columns cannot take
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"Input should be a timestamp string formatted as {TIMESTAMP_FORMAT}")
+    return _parse_ingest_timestamp(value)
+
+
+IngestTimestamp = Annotated[datetime, PlainValidator(_ingest_timestamp)]
+
+# Ingested files carry the AutomatedTellerMachines fields under their lowercase
+# names. The opening times arrive as naive timestamps in TIMESTAMP_FORMAT and
+# are required, and the attention hour arrives as text.
+_INGEST_TYPES = {
+    "ATMFromDatetime": Required[IngestTimestamp],
+    "ATMToDatetime": Required[IngestTimestamp],
+    "ATMAttentionHour": NotRequired[Optional[str]],
+}
+
+# TypedDicts rather than models: validation builds plain dicts, which keeps it
+# as fast as decoding without validation.
+AtmIngestPayload = TypedDict(
+    "AtmIngestPayload",
+    {
+        name.lower(): _INGEST_TYPES.get(name, NotRequired[field.annotation])
+        for name, field in AutomatedTellerMachines.model_fields.items()
+    },
+    total=False,
+)
+AtmIngestPayload.__pydantic_config__ = ConfigDict(coerce_numbers_to_str=True)
+
+
+class AtmIngestRecord(TypedDict):
+    payload: AtmIngestPayload
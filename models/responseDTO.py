@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import time
-from typing import Optional, Tuple
+from typing import Optional
 
 
 class AutomatedTellerMachines(BaseModel):
@@ -17,7 +17,8 @@ class AutomatedTellerMachines(BaseModel):
     ATMFromDatetime: Optional[time] = Field(default=None, example="08:00:00")
     ATMToDatetime: Optional[time] = Field(default=None, example="15:00:00")
     ATMTimeType: Optional[str] = Field(default=None, example="CONT")
-    ATMAttentionHour: Optional[Tuple[time, time]] = Field(
+    # Served as stored, the text the ingested file carried
+    ATMAttentionHour: Optional[str] = Field(
         default=None, example="08:00:00 - 15:00:00"
     )
     ATMServiceType: Optional[str] = Field(default=None, example="DPST")
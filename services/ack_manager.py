@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Configure logging to output detailed logs
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Pub/Sub accepts a limited number of ack ids per request
+MAX_ACK_IDS_PER_REQUEST = 1000
+
+
+class AckManager:
+    """
+    Batches acknowledgements and keeps the leases of in-flight messages.
+
+    Acks and nacks are queued and sent together every `flush_interval`
+    seconds, whatever message they belong to. Messages registered with
+    `lease` get `ack_deadline` on the next flush, in place of the
+    subscription's deadline, and then have it extended every half deadline
+    of their own until they are acked, nacked or held for `max_lease`
+    seconds, so slow processing does not cause redeliveries.
+    """
+
+    def __init__(
+        self,
+        acknowledge: Callable[[List[str]], None],
+        modify_ack_deadline: Callable[[List[str], int], None],
+        flush_interval: float = 0.1,
+        ack_deadline: int = 60,
+        max_lease: float = 3600,
+    ):
+        """
+        Parameters:
+        - acknowledge (Callable): Blocking call acknowledging a list of ack ids.
+        - modify_ack_deadline (Callable): Blocking call setting the ack deadline
+          (seconds) of a list of ack ids.
+        - flush_interval (float): Seconds between two flushes.
+        - ack_deadline (int): Ack deadline set when leases are extended.
+        - max_lease (float): Seconds after which leases are no longer extended.
+        """
+        self.acknowledge = acknowledge
+        self.modify_ack_deadline = modify_ack_deadline
+        self.flush_interval = flush_interval
+        self.ack_deadline = ack_deadline
+        self.max_lease = max_lease
+        self._acks: List[str] = []
+        self._nacks: List[str] = []
+        # In-flight ack ids: the time they were received, and the time their
+        # deadline is next due for an extension
+        self._leases: Dict[str, Tuple[float, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def lease(self, ack_id: str) -> None:
+        """
+        Registers a received message whose deadline must be kept extended,
+        starting with the next flush.
+        """
+        now = time.monotonic()
+        self._leases[ack_id] = (now, now)
+
+    def release(self, ack_id: str) -> None:
+        """
+        Stops extending the lease of a message handed over to another
+        process, which leases and acks it from then on.
+        """
+        self._leases.pop(ack_id, None)
+
+    async def ack(self, ack_id: str) -> None:
+        self._leases.pop(ack_id, None)
+        self._acks.append(ack_id)
+
+    async def nack(self, ack_id: str) -> None:
+        self._leases.pop(ack_id, None)
+        self._nacks.append(ack_id)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._leases)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the periodic flush and sends whatever is still queued.
+        """
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Sends the queued acks and nacks, and extends the leases that are due.
+        """
+        acks, self._acks = self._acks, []
+        nacks, self._nacks = self._nacks, []
+        await self._send(self.acknowledge, acks)
+        # A zero deadline makes Pub/Sub redeliver the message right away
+        await self._send(self.modify_ack_deadline, nacks, 0)
+
+        now = time.monotonic()
+        due = []
+        for ack_id, (received, extend_at) in list(self._leases.items()):
+            if now - received >= self.max_lease:
+                logging.warning(f"Lease of message {ack_id} exceeded {self.max_lease} seconds, no longer extended")
+                del self._leases[ack_id]
+            elif extend_at <= now:
+                self._leases[ack_id] = (received, now + self.ack_deadline / 2)
+                due.append(ack_id)
+        await self._send(self.modify_ack_deadline, due, self.ack_deadline)
+
+    async def _send(self, request: Callable, ack_ids: List[str], *args) -> None:
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(ack_ids), MAX_ACK_IDS_PER_REQUEST):
+            batch = ack_ids[start:start + MAX_ACK_IDS_PER_REQUEST]
+            try:
+                await loop.run_in_executor(None, request, batch, *args)
+            except Exception as e:
+                # Unsent acks end in a redelivery, which deduplication absorbs
+                logging.error(f"Failed to send {len(batch)} ack ids: {str(e)}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
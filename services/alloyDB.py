@@ -1,8 +1,17 @@
 import asyncpg
 import logging
+import time
+import zlib
+from contextlib import asynccontextmanager
 from os import getenv
 from dotenv import load_dotenv
 from fastapi import HTTPException
+from typing import AsyncIterable, Dict, Iterable, Union
+from services.atm_index import NATURAL_KEY_LENGTH, AtmRecordIndex
+from services.decoder import AtmBatch
+from services.fingerprint import FingerprintCache
+from services.ingest_log import Truncated
+from services.metrics import db_acquire_seconds
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -15,12 +24,50 @@ logging.basicConfig(
 # Database connection pool (shared resource)
 pool = None
 
+# Number of records sent per set-based upsert statement
+upsert_chunk_size = int(getenv("UPSERT_CHUNK_SIZE", 5000))
+# Files with at least this many records are loaded through COPY
+bulk_load_threshold = int(getenv("BULK_LOAD_THRESHOLD", 50000))
+# Natural keys whose last written content is remembered, so unchanged records
+# are not even sent. 0 disables it; only enable it when no other process
+# writes the table.
+fingerprint_cache_max_entries = int(getenv("FINGERPRINT_CACHE_MAX_ENTRIES", 0))
+fingerprint_cache = FingerprintCache(fingerprint_cache_max_entries) if fingerprint_cache_max_entries else None
+# Writers lock the stripes of the natural key space their records fall in, so
+# two files holding the same new ATM never both insert it. Every stripe locked
+# takes a slot of the server lock table until commit.
+atm_lock_stripes = int(getenv("ATM_LOCK_STRIPES", 256))
+
+
+# Connection pool settings
+pool_min_size = int(getenv("DB_POOL_MIN_SIZE", 4))
+pool_max_size = int(getenv("DB_POOL_MAX_SIZE", 10))
+# Prepared statements kept per connection, 0 disables the cache
+statement_cache_size = int(getenv("DB_STATEMENT_CACHE_SIZE", 100))
+# Idle connections are closed after this many seconds, 0 keeps them open
+max_inactive_connection_lifetime = float(getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME", 300))
+# Prepare the ingest statements on every new connection
+prepare_statements = getenv("DB_PREPARE_STATEMENTS", "true").lower() == "true"
+
+# Pool saturation counters, updated by acquire()
+pool_metrics = {
+    "acquired": 0,
+    "in_use": 0,
+    "max_in_use": 0,
+    "acquire_wait_seconds_total": 0.0,
+    "acquire_wait_seconds_max": 0.0,
+}
+
 
 # Initialize the asyncpg connection pool
 async def init_db_pool():
     """
     Initialize the database connection pool.
 
+    The pool opens its minimum number of connections right away, and each new
+    connection prepares the ingest statements (see prepare_connection), so the
+    first files do not pay for connecting and planning.
+
     Parameters:
     - None
 
@@ -34,7 +81,86 @@ async def init_db_pool():
         host=getenv("DB_HOST"),  # Database host address
         port=getenv("DB_PORT"),  # Port number to connect
         database=getenv("DB_NAME"),  # Name of the target database
+        min_size=pool_min_size,
+        max_size=pool_max_size,
+        statement_cache_size=statement_cache_size,
+        max_inactive_connection_lifetime=max_inactive_connection_lifetime,
+        init=prepare_connection if prepare_statements else None,
     )
+    logging.info(
+        f"Database pool ready with {pool_min_size}-{pool_max_size} connections, "
+        f"statement cache size {statement_cache_size}"
+    )
+
+
+async def prepare_connection(conn) -> None:
+    """
+    Prepare the ingest statements on a new connection.
+
+    asyncpg keeps the statements it runs in a per-connection cache keyed by
+    the query text, so running each statement once here, on empty arrays that
+    touch no rows, leaves it parsed and planned for every file written through
+    this connection afterwards.
+
+    Parameters:
+    - conn (asyncpg.Connection): The new connection.
+
+    Returns:
+    - None
+    """
+    if not statement_cache_size:
+        return
+    for query, args in INGEST_STATEMENTS:
+        try:
+            await conn.fetchrow(query, *args)
+        except asyncpg.exceptions.PostgresError as e:
+            # The statement is prepared on first use instead
+            logging.warning(f"Could not prepare ingest statement: {e}")
+
+
+# Acquire a pooled connection, recording how long it took
+@asynccontextmanager
+async def acquire():
+    """
+    Acquire a connection from the pool, like pool.acquire(), recording the
+    wait time and the number of connections in use in pool_metrics.
+
+    Yields:
+    - asyncpg.Connection: The acquired connection.
+    """
+    started = time.perf_counter()
+    async with pool.acquire() as conn:
+        wait = time.perf_counter() - started
+        db_acquire_seconds.observe(wait)
+        pool_metrics["acquired"] += 1
+        pool_metrics["acquire_wait_seconds_total"] += wait
+        pool_metrics["acquire_wait_seconds_max"] = max(pool_metrics["acquire_wait_seconds_max"], wait)
+        pool_metrics["in_use"] += 1
+        pool_metrics["max_in_use"] = max(pool_metrics["max_in_use"], pool_metrics["in_use"])
+        try:
+            yield conn
+        finally:
+            pool_metrics["in_use"] -= 1
+
+
+def pool_stats() -> Dict[str, Union[int, float]]:
+    """
+    Report the pool size and saturation.
+
+    Returns:
+    - dict: The pool bounds and current size, idle and in-use connections,
+      and the number of acquisitions with their total, mean and max wait in
+      seconds.
+    """
+    stats = dict(pool_metrics)
+    acquired = stats["acquired"]
+    stats["acquire_wait_seconds_mean"] = stats["acquire_wait_seconds_total"] / acquired if acquired else 0.0
+    stats["min_size"] = pool_min_size
+    stats["max_size"] = pool_max_size
+    if pool is not None:
+        stats["size"] = pool.get_size()
+        stats["idle"] = pool.get_idle_size()
+    return stats
 
 
 # Execute a single SQL query and handle exceptions
@@ -48,13 +174,14 @@ async def execute_query(query: str, params: list = None, fetch: bool = False):
     - fetch (bool): Flag to determine if the query expects a return value (e.g., SELECT).
 
     Returns:
-    - List of dict or dict or None: The result of the query based on the fetch flag.
+    - List of asyncpg.Record or None: The result of the query based on the fetch flag.
+      Records are read-only mappings, accessed by column name like dicts.
 
     Raises:
     - HTTPException: If any database or execution error occurs.
     """
     try:
-        async with pool.acquire() as conn:  # Assume `pool` is previously defined
+        async with acquire() as conn:
             async with conn.transaction():
                 if fetch:
                     # Use fetch for SELECT queries or any query that returns data
@@ -63,8 +190,8 @@ async def execute_query(query: str, params: list = None, fetch: bool = False):
                         if params
                         else await conn.fetch(query)
                     )
-                    # Convert each Record to dict with keys
-                    return [dict(record) for record in result] if result else []
+                    # Records are returned as they are, without a copy per row
+                    return result if result else []
                 else:
                     # Use execute for INSERT, UPDATE, DELETE, etc., that do not need to return data
                     (
@@ -81,6 +208,35 @@ async def execute_query(query: str, params: list = None, fetch: bool = False):
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
 
 
+# Execute a query returning one JSON document, built by the database
+async def fetch_json(query: str, *params) -> bytes:
+    """
+    Execute a query whose single value is a JSON document, and return it
+    encoded, ready to be sent as a response body without building Python
+    objects for its rows.
+
+    Parameters:
+    - query (str): The SQL query string, returning one text value.
+    - params: Parameters to pass to the SQL query.
+
+    Returns:
+    - bytes: The UTF-8 encoded JSON document.
+
+    Raises:
+    - HTTPException: If any database or execution error occurs.
+    """
+    try:
+        async with acquire() as conn:
+            document = await conn.fetchval(query, *params)
+        return document.encode()
+    except asyncpg.exceptions.PostgresError as e:
+        logging.error(f"Database operation failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        logging.error(f"Database operation failed: {e}")
+        raise HTTPException(status_code=500, detail="An unexpected error occurred")
+
+
 # Execute a bulk query (multiple statements) and handle exceptions
 async def execute_bulk_query(query: str, data: list) -> int:
     """
@@ -98,11 +254,12 @@ async def execute_bulk_query(query: str, data: list) -> int:
     """
     try:
         logging.info(f"Executing bulk query with {len(data)} records")
-        logging.debug(f"Query: {query}")
-        logging.debug(f"Data: {data}")
-        
+        # Formatted only when DEBUG is enabled, and cut to LOG_MAX_PAYLOAD
+        logging.debug("Query: %s", query)
+        logging.debug("Data: %s", Truncated(data))
+
         # Acquire a database connection and start a transaction
-        async with pool.acquire() as conn:
+        async with acquire() as conn:
             async with conn.transaction():
                 # Execute multiple statements with provided data
                 result = await conn.executemany(query, data)
@@ -115,4 +272,453 @@ async def execute_bulk_query(query: str, data: list) -> int:
     except Exception as e:
         # Handle any general exception during query execution
         logging.error(f"Unexpected error in bulk query execution: {e}")
-        raise Exception(f"Unexpected error: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Unexpected error: {str(e)}")
+# Applies the rows of an "incoming" CTE in one statement: matching rows are
+# updated when their content differs and the rest inserted. Both data-modifying CTEs see the same
+# snapshot, so a row is never both updated and inserted.
+_APPLY_INCOMING_ATMS = """
+    updated AS (
+        UPDATE presential_service_channels.automated_teller_machines t
+        SET atmfromdatetime = i.atmfromdatetime,
+            atmtodatetime = i.atmtodatetime,
+            atmtimetype = i.atmtimetype,
+            atmattentionhour = i.atmattentionhour,
+            atmservicetype = i.atmservicetype,
+            atmaccesstype = i.atmaccesstype
+        FROM incoming i
+        WHERE (t.atmidentifier, t.atmaddress_streetname, t.atmaddress_buildingnumber,
+               t.atmtownname, t.atmdistrictname, t.atmcountrysubdivisionmajorname)
+            = (i.atmidentifier, i.atmaddress_streetname, i.atmaddress_buildingnumber,
+               i.atmtownname, i.atmdistrictname, i.atmcountrysubdivisionmajorname)
+          -- Rows whose content would not change are not rewritten
+          AND (t.atmfromdatetime, t.atmtodatetime, t.atmtimetype,
+               t.atmattentionhour, t.atmservicetype, t.atmaccesstype)
+            IS DISTINCT FROM (i.atmfromdatetime, i.atmtodatetime, i.atmtimetype,
+               i.atmattentionhour, i.atmservicetype, i.atmaccesstype)
+        RETURNING 1
+    ),
+    inserted AS (
+        INSERT INTO presential_service_channels.automated_teller_machines (
+            atmidentifier, atmaddress_streetname, atmaddress_buildingnumber,
+            atmtownname, atmdistrictname, atmcountrysubdivisionmajorname,
+            atmfromdatetime, atmtodatetime, atmtimetype,
+            atmattentionhour, atmservicetype, atmaccesstype
+        )
+        SELECT i.*
+        FROM incoming i
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM presential_service_channels.automated_teller_machines t
+            WHERE (t.atmidentifier, t.atmaddress_streetname, t.atmaddress_buildingnumber,
+                   t.atmtownname, t.atmdistrictname, t.atmcountrysubdivisionmajorname)
+                = (i.atmidentifier, i.atmaddress_streetname, i.atmaddress_buildingnumber,
+                   i.atmtownname, i.atmdistrictname, i.atmcountrysubdivisionmajorname)
+        )
+        RETURNING 1
+    )
+    SELECT inserted, updated, (SELECT count(*) FROM incoming) - inserted - updated AS unchanged
+    FROM (
+        SELECT (SELECT count(*) FROM inserted) AS inserted,
+               (SELECT count(*) FROM updated) AS updated
+    ) counts
+"""
+
+# Class of the advisory locks taken on natural key stripes ("ATM")
+ATM_LOCK_CLASS = 0x41544D
+# Locks the stripes in ascending order, until the end of the transaction. It
+# runs as its own statement before the rows are applied: under READ COMMITTED
+# the applying statement then sees the rows committed by the writer that held
+# a stripe before.
+LOCK_ATM_STRIPES_QUERY = """
+    SELECT pg_advisory_xact_lock($1, stripe)
+    FROM (SELECT stripe FROM unnest($2::int[]) AS stripe ORDER BY stripe) stripes
+"""
+
+UPSERT_ATM_QUERY = """
+    WITH incoming AS (
+        SELECT *
+        FROM unnest(
+            $1::text[], $2::text[], $3::text[], $4::text[], $5::text[], $6::text[],
+            $7::timestamp[], $8::timestamp[], $9::text[], $10::text[], $11::text[], $12::text[]
+        ) AS i(
+            atmidentifier, atmaddress_streetname, atmaddress_buildingnumber,
+            atmtownname, atmdistrictname, atmcountrysubdivisionmajorname,
+            atmfromdatetime, atmtodatetime, atmtimetype,
+            atmattentionhour, atmservicetype, atmaccesstype
+        )
+    ),""" + _APPLY_INCOMING_ATMS
+
+# Statements prepared on every new connection, with arguments that touch no
+# rows. The COPY path is left out: its statements refer to a temporary table
+# that is dropped on commit, so they cannot be reused across files.
+INGEST_STATEMENTS = (
+    (LOCK_ATM_STRIPES_QUERY, [ATM_LOCK_CLASS, []]),
+    (UPSERT_ATM_QUERY, [[] for _ in range(12)]),
+)
+
+# Bulk loads are copied into this table first; it has the column types of the
+# target table, as the binary COPY format requires, and lives until commit
+ATM_STAGING_TABLE = "atm_staging"
+ATM_COLUMNS = (
+    "atmidentifier", "atmaddress_streetname", "atmaddress_buildingnumber",
+    "atmtownname", "atmdistrictname", "atmcountrysubdivisionmajorname",
+    "atmfromdatetime", "atmtodatetime", "atmtimetype",
+    "atmattentionhour", "atmservicetype", "atmaccesstype",
+)
+CREATE_ATM_STAGING_QUERY = f"""
+    CREATE TEMPORARY TABLE {ATM_STAGING_TABLE} ON COMMIT DROP AS
+    SELECT {", ".join(ATM_COLUMNS)}
+    FROM presential_service_channels.automated_teller_machines
+    WITH NO DATA
+"""
+APPLY_ATM_STAGING_QUERY = f"""
+    WITH incoming AS (
+        SELECT * FROM {ATM_STAGING_TABLE}
+    ),""" + _APPLY_INCOMING_ATMS
+
+# Streamed files are copied into this table as they are read, outside of any
+# transaction, so it lives until it is dropped. Each row keeps its position in
+# the file, as a natural key may appear again in a later batch.
+ATM_STREAM_STAGING_TABLE = "atm_stream_staging"
+CREATE_ATM_STREAM_STAGING_QUERY = f"""
+    CREATE TEMPORARY TABLE {ATM_STREAM_STAGING_TABLE} AS
+    SELECT {", ".join(ATM_COLUMNS)}, 0::bigint AS seq
+    FROM presential_service_channels.automated_teller_machines
+    WITH NO DATA
+"""
+_ATM_NATURAL_KEY = ", ".join(ATM_COLUMNS[:NATURAL_KEY_LENGTH])
+APPLY_ATM_STREAM_STAGING_QUERY = f"""
+    WITH incoming AS (
+        SELECT DISTINCT ON ({_ATM_NATURAL_KEY}) {", ".join(ATM_COLUMNS)}
+        FROM {ATM_STREAM_STAGING_TABLE}
+        ORDER BY {_ATM_NATURAL_KEY}, seq DESC
+    ),""" + _APPLY_INCOMING_ATMS
+DROP_ATM_STREAM_STAGING_QUERY = f"DROP TABLE IF EXISTS {ATM_STREAM_STAGING_TABLE}"
+
+
+def _unique_batch(records) -> AtmBatch:
+    # Columnar batch of the records, one per natural key, the last one winning
+    if isinstance(records, AtmBatch):
+        return records.deduplicated()
+    return AtmBatch.from_rows(list(AtmRecordIndex(records)))
+
+
+def atm_lock_stripe(key: tuple) -> int:
+    """
+    Returns the lock stripe of a natural key, the same in every process.
+    """
+    return zlib.crc32("\x1f".join(map(str, key)).encode("utf-8")) % atm_lock_stripes
+
+
+def _by_lock_stripe(batch: AtmBatch) -> AtmBatch:
+    # Chunks of a batch sorted this way lock their stripes in ascending order
+    # across the whole transaction, so two writers cannot deadlock
+    stripes = [atm_lock_stripe(key) for key in batch.keys()]
+    order = sorted(range(len(batch)), key=stripes.__getitem__)
+    return AtmBatch([[column[i] for i in order] for column in batch.columns])
+
+
+async def lock_atm_keys(conn, batch: Union[AtmBatch, list]) -> None:
+    """
+    Serializes the writers of the natural keys of a batch until the end of
+    the current transaction.
+
+    Parameters:
+    - conn (asyncpg.Connection): The connection, inside a transaction.
+    - batch (AtmBatch or list): The records about to be applied, as a
+      columnar batch or record tuples.
+
+    Returns:
+    - None
+    """
+    keys = batch.keys() if isinstance(batch, AtmBatch) else (record[:NATURAL_KEY_LENGTH] for record in batch)
+    stripes = sorted({atm_lock_stripe(key) for key in keys})
+    await conn.execute(LOCK_ATM_STRIPES_QUERY, ATM_LOCK_CLASS, stripes)
+
+
+def _skip_unchanged(records):
+    # Records not known to be unchanged, their fingerprints and the number of
+    # records skipped
+    if fingerprint_cache is None:
+        return records, [], 0
+    batch = records if isinstance(records, AtmBatch) else AtmBatch.from_rows(list(records))
+    changed, fingerprints = fingerprint_cache.split(batch)
+    return changed, fingerprints, len(batch) - len(changed)
+
+
+# Insert or update ATM records in set-based chunks within one transaction
+async def upsert_atm_records(records: Union[list, AtmBatch], chunk_size: int = None) -> dict:
+    """
+    Insert new ATM records and update the existing ones, matched on the
+    six-column natural key (identifier, street, building number, town,
+    district and country subdivision).
+
+    Records sharing a natural key within the same file are collapsed, the last
+    one wins. Every chunk is applied with a single statement and the whole
+    file is written in one transaction, holding the lock stripes of its keys
+    (see lock_atm_keys), taken in ascending order. Files of BULK_LOAD_THRESHOLD records
+    or more go through bulk_load_atm_records instead. Existing rows whose
+    content is the same as the record's are left untouched.
+
+    Parameters:
+    - records (list or AtmBatch): Tuples with the twelve ATM columns, natural
+      key first, or a columnar batch.
+    - chunk_size (int, optional): Records per statement. Defaults to UPSERT_CHUNK_SIZE.
+
+    Returns:
+    - dict: The number of "inserted", "updated" and "unchanged" records.
+
+    Raises:
+    - asyncpg.exceptions.PostgresError: If the database rejects the write.
+    """
+    chunk_size = chunk_size or upsert_chunk_size
+    # Last record wins for duplicated natural keys
+    batch = _unique_batch(records)
+    if len(batch) >= bulk_load_threshold:
+        return await bulk_load_atm_records(batch)
+    batch = _by_lock_stripe(batch)
+
+    chunks = (
+        AtmBatch([column[start:start + chunk_size] for column in batch.columns])
+        for start in range(0, len(batch), chunk_size)
+    )
+    inserted = updated = unchanged = 0
+    written = []
+    try:
+        async with acquire() as conn:
+            async with conn.transaction():
+                for chunk in chunks:
+                    chunk, fingerprints, skipped = _skip_unchanged(chunk)
+                    unchanged += skipped
+                    if not len(chunk):
+                        continue
+                    logging.info(f"Upserting {len(chunk)} records")
+                    await lock_atm_keys(conn, chunk)
+                    result = await conn.fetchrow(UPSERT_ATM_QUERY, *chunk.columns)
+                    inserted += result["inserted"]
+                    updated += result["updated"]
+                    unchanged += result["unchanged"]
+                    written.extend(fingerprints)
+        if fingerprint_cache is not None:
+            fingerprint_cache.update(written)
+        logging.info(
+            f"Upsert executed successfully. Inserted: {inserted}, updated: {updated}, unchanged: {unchanged}"
+        )
+        return {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+    except asyncpg.exceptions.PostgresError as e:
+        logging.error(f"PostgreSQL error in upsert execution: {e}")
+        raise
+    except Exception as e:
+        logging.error(f"Unexpected error in upsert execution: {e}")
+        raise
+
+
+# Insert or update a stream of ATM record batches, applied once fully read
+async def upsert_atm_batches(batches: AsyncIterable) -> dict:
+    """
+    Insert or update ATM records arriving in batches. Used to write files
+    that are parsed while they are downloaded, so only one batch is held in
+    memory.
+
+    Each batch is copied with binary COPY into a temporary staging table as
+    soon as it is read, with no transaction open, so neither row locks nor
+    lock stripes are held while the rest of the file downloads. Once the last
+    batch is read, one transaction takes the lock stripes of all the keys of
+    the file, in ascending order like every other writer (see lock_atm_keys),
+    and applies the staging table with one statement. Duplicated natural keys
+    are collapsed, the last record of the file wins.
+
+    Parameters:
+    - batches (AsyncIterable): Batches of twelve-column ATM record tuples, or
+      columnar batches.
+
+    Returns:
+    - dict: The number of "inserted", "updated" and "unchanged" records.
+
+    Raises:
+    - asyncpg.exceptions.PostgresError: If the database rejects the write.
+    - Exception: Whatever reading the batches raised, unchanged.
+    """
+    result = {"inserted": 0, "updated": 0, "unchanged": 0}
+    skipped = staged = 0
+    stripes = set()
+    written = []
+    try:
+        async with acquire() as conn:
+            await conn.execute(CREATE_ATM_STREAM_STAGING_QUERY)
+            try:
+                async for batch in batches:
+                    chunk, fingerprints, unchanged = _skip_unchanged(_unique_batch(batch))
+                    skipped += unchanged
+                    if not len(chunk):
+                        continue
+                    logging.info(f"Staging {len(chunk)} records")
+                    stripes.update(atm_lock_stripe(key) for key in chunk.keys())
+                    await conn.copy_records_to_table(
+                        ATM_STREAM_STAGING_TABLE,
+                        records=zip(*chunk.columns, range(staged, staged + len(chunk))),
+                        columns=ATM_COLUMNS + ("seq",),
+                    )
+                    staged += len(chunk)
+                    written.extend(fingerprints)
+                if staged:
+                    async with conn.transaction():
+                        await conn.execute(LOCK_ATM_STRIPES_QUERY, ATM_LOCK_CLASS, sorted(stripes))
+                        result = await conn.fetchrow(APPLY_ATM_STREAM_STAGING_QUERY)
+            finally:
+                # The connection goes back to the pool with its session
+                await conn.execute(DROP_ATM_STREAM_STAGING_QUERY)
+        if fingerprint_cache is not None:
+            fingerprint_cache.update(written)
+        inserted, updated = result["inserted"], result["updated"]
+        unchanged = result["unchanged"] + skipped
+        logging.info(
+            f"Upsert executed successfully. Inserted: {inserted}, updated: {updated}, unchanged: {unchanged}"
+        )
+        return {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+    except asyncpg.exceptions.PostgresError as e:
+        logging.error(f"PostgreSQL error in upsert execution: {e}")
+        raise
+    except Exception as e:
+        # Raised as is: the caller tells a malformed or missing file, which
+        # fails the same way on every delivery, from a transient failure
+        logging.error(f"Unexpected error in upsert execution: {e}")
+        raise
+
+
+# Load a full snapshot of ATM records through binary COPY
+async def bulk_load_atm_records(records: Iterable) -> dict:
+    """
+    Insert or update a large set of ATM records by streaming them with binary
+    COPY into a temporary staging table, then applying the staging table to
+    the target table with one statement, all in one transaction holding the
+    lock stripes of the keys (see lock_atm_keys).
+
+    Parameters:
+    - records (Iterable): Tuples with the twelve ATM columns, natural key
+      first, or a columnar batch. Natural keys are expected to be unique.
+
+    Returns:
+    - dict: The number of "inserted", "updated" and "unchanged" records, and
+      the load throughput in "rows_per_second".
+
+    Raises:
+    - asyncpg.exceptions.PostgresError: If the database rejects the write.
+    """
+    try:
+        records, fingerprints, skipped = _skip_unchanged(records)
+        if not isinstance(records, (AtmBatch, list)):
+            records = list(records)
+        if not len(records):
+            return {"inserted": 0, "updated": 0, "unchanged": skipped, "rows_per_second": 0.0}
+        logging.info(f"Bulk loading {len(records)} records")
+        started = time.perf_counter()
+        async with acquire() as conn:
+            async with conn.transaction():
+                # All the stripes of the load at once, in ascending order
+                await lock_atm_keys(conn, records)
+                await conn.execute(CREATE_ATM_STAGING_QUERY)
+                await conn.copy_records_to_table(
+                    ATM_STAGING_TABLE, records=records, columns=ATM_COLUMNS
+                )
+                result = await conn.fetchrow(APPLY_ATM_STAGING_QUERY)
+        elapsed = time.perf_counter() - started
+        if fingerprint_cache is not None:
+            fingerprint_cache.update(fingerprints)
+        rows_per_second = len(records) / elapsed if elapsed > 0 else float(len(records))
+        unchanged = result["unchanged"] + skipped
+        logging.info(
+            f"Bulk load executed successfully. Inserted: {result['inserted']}, "
+            f"updated: {result['updated']}, unchanged: {unchanged}, {rows_per_second:.0f} rows/s"
+        )
+        return {
+            "inserted": result["inserted"],
+            "updated": result["updated"],
+            "unchanged": unchanged,
+            "rows_per_second": rows_per_second,
+        }
+    except asyncpg.exceptions.PostgresError as e:
+        logging.error(f"PostgreSQL error in bulk load execution: {e}")
+        raise
+    except Exception as e:
+        # Raised as is: the caller tells a malformed or missing file, which
+        # fails the same way on every delivery, from a transient failure
+        logging.error(f"Unexpected error in bulk load execution: {e}")
+        raise
+
+
+# Read queries build the response document in the database, one object per
+# row shaped like models.responseDTO.ResponseDTO, so rows are never
+# converted to Python objects
+_ATM_JSON_OBJECT = """
+    json_build_object('AutomatedTellerMachines', json_build_object(
+        'ATMIdentifier', atmidentifier,
+        'ATMAddress_StreetName', atmaddress_streetname,
+        'ATMAddress_BuildingNumber', atmaddress_buildingnumber,
+        'ATMTownName', atmtownname,
+        'ATMDistrictName', atmdistrictname,
+        'ATMCountrySubDivisionMajorName', atmcountrysubdivisionmajorname,
+        'ATMFromDatetime', to_char(atmfromdatetime, 'HH24:MI:SS'),
+        'ATMToDatetime', to_char(atmtodatetime, 'HH24:MI:SS'),
+        'ATMTimeType', atmtimetype,
+        'ATMAttentionHour', atmattentionhour,
+        'ATMServiceType', atmservicetype,
+        'ATMAccessType', atmaccesstype
+    ))
+"""
+_ATM_ORDER = ", ".join(ATM_COLUMNS[:NATURAL_KEY_LENGTH])
+
+
+def _atm_json_query(where: str, paged: bool = False) -> str:
+    page = "LIMIT $1 OFFSET $2" if paged else ""
+    return f"""
+    SELECT coalesce(json_agg({_ATM_JSON_OBJECT} ORDER BY {_ATM_ORDER}), '[]')::text
+    FROM (
+        SELECT *
+        FROM presential_service_channels.automated_teller_machines
+        {where}
+        ORDER BY {_ATM_ORDER}
+        {page}
+    ) atms
+"""
+
+
+ATMS_BY_IDENTIFIER_QUERY = _atm_json_query("WHERE atmidentifier = $1")
+ATMS_BY_TOWN_QUERY = _atm_json_query(
+    "WHERE atmtownname = $1 AND ($2::text IS NULL OR atmdistrictname = $2)"
+)
+ATMS_PAGE_QUERY = _atm_json_query("", paged=True)
+
+
+async def get_atms_by_identifier(atm_identifier: str) -> bytes:
+    """
+    Fetch the ATM records with the given identifier.
+
+    Returns:
+    - bytes: A JSON array of response objects.
+    """
+    return await fetch_json(ATMS_BY_IDENTIFIER_QUERY, atm_identifier)
+
+
+async def get_atms_by_town(town_name: str, district_name: str = None) -> bytes:
+    """
+    Fetch the ATM records of a town, optionally of one of its districts.
+
+    Returns:
+    - bytes: A JSON array of response objects.
+    """
+    return await fetch_json(ATMS_BY_TOWN_QUERY, town_name, district_name)
+
+
+async def list_atms(page: int, size: int) -> bytes:
+    """
+    Fetch one page of ATM records, ordered by natural key.
+
+    Parameters:
+    - page (int): The page number, starting at 1.
+    - size (int): The number of records per page.
+
+    Returns:
+    - bytes: A JSON array of response objects.
+    """
+    return await fetch_json(ATMS_PAGE_QUERY, size, (page - 1) * size)
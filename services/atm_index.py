@@ -0,0 +1,53 @@
+from typing import Dict, Iterable, Iterator, Optional
+
+# Natural key columns, in the order they lead every ATM record tuple:
+# atmidentifier, atmaddress_streetname, atmaddress_buildingnumber,
+# atmtownname, atmdistrictname, atmcountrysubdivisionmajorname
+NATURAL_KEY_LENGTH = 6
+
+
+def natural_key(record: tuple) -> tuple:
+    """
+    Returns the natural key of an ATM record tuple.
+    """
+    return record[:NATURAL_KEY_LENGTH]
+
+
+class AtmRecordIndex:
+    """
+    Hash index of ATM records keyed by their natural key.
+
+    The index is built once per file and gives O(1) lookups. When a key is
+    added more than once the last record wins, and it keeps the position of
+    the first occurrence.
+    """
+
+    def __init__(self, records: Iterable[tuple] = ()):
+        """
+        Args:
+            records (Iterable[tuple]): ATM record tuples, natural key first.
+        """
+        self._records: Dict[tuple, tuple] = {}
+        for record in records:
+            self.add(record)
+
+    def add(self, record: tuple) -> None:
+        """
+        Adds a record, replacing any record with the same natural key.
+        """
+        self._records[natural_key(record)] = record
+
+    def get(self, key: tuple) -> Optional[tuple]:
+        """
+        Returns the record with the given natural key, or None.
+        """
+        return self._records.get(key)
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[tuple]:
+        return iter(self._records.values())
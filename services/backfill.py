@@ -0,0 +1,346 @@
+import asyncio
+import fnmatch
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from services import alloyDB
+from services.decoder import AtmBatch, decode_atm_records, validate_atm_file
+
+# Configure logging to output detailed logs
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+GCS_SCHEME = "gs://"
+
+
+class BackfillFile(NamedTuple):
+    """
+    A file to replay, by name within its source, and its size.
+    """
+    name: str
+    size: int
+
+
+class DecodedFile(NamedTuple):
+    """
+    The columns of the valid records of a file, and the errors of the
+    invalid ones as (record index, message) pairs.
+    """
+    columns: List[list]
+    errors: List[Tuple[int, str]]
+
+
+def decode_file(content: bytes, validate: bool = True) -> DecodedFile:
+    """
+    Decodes the content of an ATM file the way the ingest pipeline does.
+    Runs in the parsing processes, so it only returns picklable values.
+
+    Raises:
+        json.JSONDecodeError: If the content is not valid JSON.
+        ValueError: If a record has a malformed timestamp (without validation).
+    """
+    if validate:
+        validated = validate_atm_file(content)
+        return DecodedFile(validated.batch.columns, validated.errors)
+    records = json.loads(content)
+    if isinstance(records, dict):
+        records = [records]
+    return DecodedFile(decode_atm_records(records).columns, [])
+
+
+def decode_local_file(path: str, validate: bool = True) -> DecodedFile:
+    with open(path, "rb") as file:
+        return decode_file(file.read(), validate)
+
+
+class Source:
+    """
+    Where the files to replay are read from: a local directory, or a prefix
+    of the Cloud Storage bucket (a name starting with gs://).
+    """
+
+    def __init__(self, location: str, pattern: str = "*"):
+        """
+        Raises:
+            ValueError: If a local location is not a directory, or a gs://
+            location names another bucket than the configured one.
+        """
+        self.location = location
+        self.pattern = pattern
+        self.local = not location.startswith(GCS_SCHEME)
+        if self.local:
+            if not os.path.isdir(location):
+                raise ValueError(f"{location} is not a directory, bucket prefixes are written gs://<bucket>/<prefix>")
+            return
+        from services.storage import bucket_name
+        bucket = location[len(GCS_SCHEME):].partition("/")[0]
+        if bucket != bucket_name:
+            raise ValueError(f"{location} is not in the configured bucket {bucket_name}")
+
+    @property
+    def prefix(self) -> str:
+        # gs://<bucket>/<prefix>, the bucket being the configured one
+        return self.location[len(GCS_SCHEME):].partition("/")[2]
+
+    def list(self) -> List[BackfillFile]:
+        """
+        Lists the files matching the pattern, in name order.
+        """
+        if self.local:
+            files = []
+            for root, _, names in os.walk(self.location):
+                for name in names:
+                    path = os.path.join(root, name)
+                    files.append(BackfillFile(os.path.relpath(path, self.location), os.path.getsize(path)))
+        else:
+            from services.storage import list_file_sizes
+            files = [BackfillFile(name, size or 0) for name, size in list_file_sizes(self.prefix)]
+        files = [file for file in files if fnmatch.fnmatch(os.path.basename(file.name), self.pattern)]
+        return sorted(files)
+
+    async def decode(self, file: BackfillFile, executor: Executor, validate: bool) -> DecodedFile:
+        """
+        Decodes a file in the executor. Local files are read by the worker
+        itself; bucket files are downloaded here first.
+        """
+        loop = asyncio.get_running_loop()
+        if self.local:
+            path = os.path.join(self.location, file.name)
+            return await loop.run_in_executor(executor, decode_local_file, path, validate)
+        from services.storage import download_file_async
+        downloaded = await download_file_async(file.name)
+        if not downloaded:
+            raise FileNotFoundError(f"Failed to download file content for {file.name}")
+        # Sent to the parsing processes, a cached file's memory map is copied to bytes
+        return await loop.run_in_executor(executor, decode_file, bytes(downloaded.content), validate)
+
+
+class Checkpoint:
+    """
+    Progress of a backfill, saved after every file so that an interrupted
+    run resumes where it stopped. Files that failed are retried on resume.
+    """
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = source
+        self.done: Dict[str, dict] = {}
+        self.failed: Dict[str, str] = {}
+        self.records_per_second: Optional[float] = None
+
+    @classmethod
+    def load(cls, path: str, source: str) -> "Checkpoint":
+        checkpoint = cls(path, source)
+        try:
+            with open(path, encoding="utf-8") as file:
+                saved = json.load(file)
+        except FileNotFoundError:
+            return checkpoint
+        if saved.get("source") != source:
+            raise ValueError(f"Checkpoint {path} belongs to another source: {saved.get('source')}")
+        checkpoint.done = saved.get("done", {})
+        checkpoint.failed = saved.get("failed", {})
+        checkpoint.records_per_second = saved.get("records_per_second")
+        return checkpoint
+
+    def mark_done(self, name: str, result: dict) -> None:
+        self.done[name] = result
+        self.failed.pop(name, None)
+        self.save()
+
+    def mark_failed(self, name: str, error: str) -> None:
+        self.failed[name] = error
+        self.save()
+
+    def save(self) -> None:
+        # Written aside and renamed, so an interruption never leaves it truncated
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({
+                "source": self.source,
+                "records_per_second": self.records_per_second,
+                "done": self.done,
+                "failed": self.failed,
+            }, file)
+        os.replace(temporary, self.path)
+
+
+class BackfillStats:
+    def __init__(self, files: List[BackfillFile]):
+        self.total_files = len(files)
+        self.total_bytes = sum(file.size for file in files)
+        self.files = 0
+        self.failed = 0
+        self.bytes = 0
+        self.records = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.elapsed if self.elapsed > 0 else 0.0
+
+    def eta(self) -> float:
+        if not self.bytes:
+            return 0.0
+        return self.elapsed * (self.total_bytes - self.bytes) / self.bytes
+
+
+async def run_backfill(
+    source: Source,
+    files: List[BackfillFile],
+    checkpoint: Checkpoint,
+    executor: Executor,
+    parse_ahead: int,
+    db_workers: int,
+    validate: bool = True,
+) -> BackfillStats:
+    """
+    Decodes the files in the executor and writes them with concurrent
+    database workers, through the upsert of the ingest pipeline.
+
+    Files are handed to the writers in listing order. With one database
+    worker they are also committed in that order, which matters when
+    several files carry the same ATMs: the last file wins.
+
+    Parameters:
+    - source (Source): Where to read the files from.
+    - files (list[BackfillFile]): The files to replay.
+    - checkpoint (Checkpoint): Updated as files are committed or fail.
+    - executor (Executor): Runs the decoding, usually a process pool.
+    - parse_ahead (int): Files decoded ahead of the writers.
+    - db_workers (int): Files written concurrently.
+    - validate (bool): Validate the records against the ingest schema.
+
+    Returns:
+    - BackfillStats: The totals of the run.
+    """
+    stats = BackfillStats(files)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=db_workers)
+
+    async def decode(file: BackfillFile) -> Tuple[BackfillFile, object]:
+        try:
+            return file, await source.decode(file, executor, validate)
+        except Exception as e:
+            return file, e
+
+    async def produce() -> None:
+        pending = deque()
+        for file in files:
+            pending.append(asyncio.ensure_future(decode(file)))
+            if len(pending) >= parse_ahead:
+                await queue.put(await pending.popleft())
+        while pending:
+            await queue.put(await pending.popleft())
+        for _ in range(db_workers):
+            await queue.put(None)
+
+    async def write() -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            file, decoded = item
+            try:
+                if isinstance(decoded, Exception):
+                    raise decoded
+                if decoded.errors:
+                    logging.error(f"Skipped {len(decoded.errors)} invalid records in {file.name}")
+                batch = AtmBatch(decoded.columns)
+                result = await alloyDB.upsert_atm_records(batch)
+            except Exception as e:
+                stats.failed += 1
+                stats.bytes += file.size
+                logging.error(f"Failed to replay {file.name}: {str(e)}")
+                checkpoint.mark_failed(file.name, str(e))
+                continue
+            stats.files += 1
+            stats.bytes += file.size
+            stats.records += len(batch)
+            stats.inserted += result["inserted"]
+            stats.updated += result["updated"]
+            stats.unchanged += result.get("unchanged", 0)
+            checkpoint.records_per_second = stats.records_per_second
+            checkpoint.mark_done(file.name, {
+                "records": len(batch),
+                "inserted": result["inserted"],
+                "updated": result["updated"],
+                "unchanged": result.get("unchanged", 0),
+            })
+            done = stats.files + stats.failed
+            logging.info(
+                f"[{done}/{stats.total_files}] {file.name}: {len(batch)} records "
+                f"({result['inserted']} inserted, {result['updated']} updated), "
+                f"{stats.records_per_second:,.0f} records/s, ETA {stats.eta():,.0f}s"
+            )
+
+    await asyncio.gather(produce(), *(write() for _ in range(db_workers)))
+    return stats
+
+
+class Estimate(NamedTuple):
+    files: int
+    bytes: int
+    records: int
+    parse_seconds: float
+    write_seconds: Optional[float]
+
+    @property
+    def seconds(self) -> Optional[float]:
+        # Decoding and writing overlap, the slower of the two sets the pace
+        if self.write_seconds is None:
+            return None
+        return max(self.parse_seconds, self.write_seconds)
+
+
+async def estimate_backfill(
+    source: Source,
+    files: List[BackfillFile],
+    sample: int,
+    parse_workers: int,
+    records_per_second: Optional[float],
+    validate: bool = True,
+) -> Estimate:
+    """
+    Estimates the duration of a backfill without writing anything.
+
+    A sample of the files is decoded here to measure the decoding rate and
+    the number of records per byte. The write rate is the overall rate of a
+    previous run (saved in the checkpoint) or given by the caller; without
+    it the write time is unknown. Sampled files deleted since the listing
+    are left out of the sample.
+    """
+    total_bytes = sum(file.size for file in files)
+    sampled_bytes = sampled_records = 0
+    started = time.perf_counter()
+    for file in files[:sample]:
+        if source.local:
+            decoded = decode_local_file(os.path.join(source.location, file.name), validate)
+        else:
+            from services.storage import download_file_async
+            downloaded = await download_file_async(file.name)
+            if not downloaded:
+                logging.warning(f"Sampled file {file.name} no longer exists, left out of the estimate")
+                continue
+            decoded = decode_file(bytes(downloaded.content), validate)
+        sampled_bytes += file.size
+        sampled_records += len(decoded.columns[0])
+    elapsed = time.perf_counter() - started
+    if not sampled_bytes:
+        return Estimate(len(files), total_bytes, 0, 0.0, 0.0 if not files else None)
+    records = round(total_bytes * sampled_records / sampled_bytes)
+    parse_seconds = total_bytes / (sampled_bytes / elapsed) / max(1, parse_workers)
+    write_seconds = records / records_per_second if records_per_second else None
+    return Estimate(len(files), total_bytes, records, parse_seconds, write_seconds)
@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Union
+
+# Configure logging to output detailed logs
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+TEMPORARY_SUFFIX = ".tmp"
+
+
+def entry_name(name: str, generation: int) -> str:
+    # Object names may hold slashes or be longer than a file name can be
+    return f"{hashlib.blake2b(name.encode('utf-8'), digest_size=16).hexdigest()}-{generation}"
+
+
+class BlobCache:
+    """
+    Bounded on-disk cache of downloaded objects, keyed by object name and
+    generation. A generation never changes content, so entries are never
+    stale: they are only evicted, least recently used first, once the
+    files exceed `max_bytes`.
+
+    Entries are written aside and renamed, so a reader never sees a partial
+    one, and read as read-only memory maps, so a hit copies nothing. A map
+    stays valid after its entry is evicted. The recency of the entries is
+    their modification time, which hits refresh, so it survives a restart.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        Raises:
+        - OSError: If the directory cannot be created or read.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _path(self, entry: str) -> str:
+        return os.path.join(self.directory, entry)
+
+    def _load(self) -> None:
+        found = []
+        with os.scandir(self.directory) as files:
+            for file in files:
+                if not file.is_file():
+                    continue
+                if file.name.endswith(TEMPORARY_SUFFIX):
+                    # Left by a crash in the middle of a write
+                    os.unlink(file.path)
+                    continue
+                stat = file.stat()
+                found.append((stat.st_mtime, file.name, stat.st_size))
+        for _, entry, size in sorted(found):
+            self._entries[entry] = size
+            self.size += size
+        self._remove(self._evict())
+
+    def _evict(self) -> List[str]:
+        # Called with the lock held; the files are removed after releasing it
+        evicted = []
+        while self.size > self.max_bytes and self._entries:
+            entry, size = self._entries.popitem(last=False)
+            self.size -= size
+            evicted.append(entry)
+        return evicted
+
+    def _remove(self, entries: List[str]) -> None:
+        for entry in entries:
+            try:
+                os.unlink(self._path(entry))
+            except FileNotFoundError:
+                pass
+
+    def get(self, name: str, generation: int) -> Optional[Union[mmap.mmap, bytes]]:
+        """
+        Returns the cached content of an object generation as a read-only
+        memory map, or None if it is not cached.
+        """
+        entry = entry_name(name, generation)
+        with self._lock:
+            if entry not in self._entries:
+                return None
+            self._entries.move_to_end(entry)
+            size = self._entries[entry]
+        path = self._path(entry)
+        try:
+            with open(path, "rb") as file:
+                # An empty file cannot be mapped
+                content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            # Removed from the directory behind the cache's back
+            with self._lock:
+                self.size -= self._entries.pop(entry, 0)
+            return None
+        return content
+
+    def put(self, name: str, generation: int, content: bytes) -> None:
+        """
+        Stores the content of an object generation, evicting the least
+        recently used entries beyond the size bound. Objects larger than
+        the bound are not stored.
+
+        Raises:
+        - OSError: If the entry cannot be written.
+        """
+        if len(content) > self.max_bytes:
+            return
+        entry = entry_name(name, generation)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=TEMPORARY_SUFFIX)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(content)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary, self._path(entry))
+        except BaseException:
+            try:
+                os.unlink(temporary)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._lock:
+            self.size += len(content) - self._entries.pop(entry, 0)
+            self._entries[entry] = len(content)
+            evicted = self._evict()
+        self._remove(evicted)
@@ -0,0 +1,66 @@
+import threading
+from os import getenv
+from typing import Callable, Generic, Optional, TypeVar
+from dotenv import load_dotenv
+
+# Load environment variables from a .env file.
+load_dotenv()
+
+credentials_path = getenv("GCP_CREDENTIALS")
+
+T = TypeVar("T")
+
+
+class SharedResource(Generic[T]):
+    """
+    A value created on first use and shared afterwards, such as a client.
+
+    Creation is guarded by a lock of its own, so concurrent first uses from
+    several threads create it once, while different resources are created
+    in parallel.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+
+    def get(self) -> T:
+        value = self._value
+        if value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+                value = self._value
+        return value
+
+    @property
+    def created(self) -> bool:
+        return self._value is not None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._value = None
+
+
+# The client libraries are imported on first use, they are slow to import
+def _load_credentials():
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_file(credentials_path)
+
+
+def _create_storage_client():
+    from google.cloud import storage
+    creds = credentials.get()
+    return storage.Client(credentials=creds, project=creds.project_id)
+
+
+def _create_subscriber_client():
+    from google.cloud import pubsub_v1
+    return pubsub_v1.SubscriberClient(credentials=credentials.get())
+
+
+# Service-account credentials, loaded once for every client
+credentials: SharedResource = SharedResource(_load_credentials)
+storage_client: SharedResource = SharedResource(_create_storage_client)
+subscriber_client: SharedResource = SharedResource(_create_subscriber_client)
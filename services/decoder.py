@@ -0,0 +1,257 @@
+import json
+from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Iterable, Iterator, List, NamedTuple, Tuple
+
+import orjson
+from pydantic import TypeAdapter, ValidationError
+
+from models.atmIngestDto import TIMESTAMP_FORMAT, AtmIngestRecord
+from services.atm_index import NATURAL_KEY_LENGTH
+from services.json_stream import iter_batches
+
+# Payload fields, in the column order of the ATM record tuples
+PAYLOAD_FIELDS = (
+    "atmidentifier",
+    "atmaddress_streetname",
+    "atmaddress_buildingnumber",
+    "atmtownname",
+    "atmdistrictname",
+    "atmcountrysubdivisionmajorname",
+    "atmfromdatetime",
+    "atmtodatetime",
+    "atmtimetype",
+    "atmattentionhour",
+    "atmservicetype",
+    "atmaccesstype",
+)
+
+_get_payload_fields = itemgetter(*PAYLOAD_FIELDS)
+
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parses a "YYYY-MM-DD HH:MM:SS.ffffff" timestamp.
+
+    Well-formed values are sliced at fixed offsets instead of going through
+    datetime.strptime, and results are memoized since opening hours repeat
+    heavily across records. Anything else is left to strptime, so invalid
+    values raise the same ValueError as before.
+    """
+    if value is None:
+        raise ValueError("Missing timestamp")
+    if (
+        len(value) > 20
+        and value[4] == "-" and value[7] == "-" and value[10] == " "
+        and value[13] == ":" and value[16] == ":" and value[19] == "."
+    ):
+        fraction = value[20:]
+        digits = value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19] + fraction
+        if len(fraction) <= 6 and digits.isascii() and digits.isdigit():
+            try:
+                return datetime(
+                    int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                    int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                    int(fraction.ljust(6, "0")),
+                )
+            except ValueError:
+                pass  # Out of range fields, let strptime report them
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def decode_atm_record(record: dict) -> tuple:
+    """
+    Converts a file record into an ATM record tuple, natural key first.
+    """
+    payload = record.get("payload", {})
+    try:
+        values = _get_payload_fields(payload)
+    except KeyError:
+        values = tuple(payload.get(field) for field in PAYLOAD_FIELDS)
+    (
+        identifier, street, building, town, district, subdivision,
+        from_datetime, to_datetime, time_type, attention_hour, service_type, access_type,
+    ) = values
+    return (
+        identifier, street, building, town, district, subdivision,
+        parse_timestamp(from_datetime), parse_timestamp(to_datetime),
+        time_type, attention_hour, service_type, access_type,
+    )
+
+
+class AtmBatch:
+    """
+    Columnar batch of ATM records: one list per column, in PAYLOAD_FIELDS
+    order, instead of one tuple per record.
+
+    The columns are the array parameters the upsert statement takes, and
+    iterating the batch yields record tuples for the code that needs rows.
+    """
+
+    __slots__ = ("columns",)
+
+    def __init__(self, columns: List[list]):
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, rows: List[tuple]) -> "AtmBatch":
+        if not rows:
+            return cls([[] for _ in PAYLOAD_FIELDS])
+        return cls([list(column) for column in zip(*rows)])
+
+    def __len__(self) -> int:
+        return len(self.columns[0])
+
+    def __iter__(self) -> Iterator[tuple]:
+        return zip(*self.columns)
+
+    def keys(self) -> Iterator[tuple]:
+        """
+        Iterates over the natural keys of the records.
+        """
+        return zip(*self.columns[:NATURAL_KEY_LENGTH])
+
+    def deduplicated(self) -> "AtmBatch":
+        """
+        Returns the batch with one record per natural key, the last one
+        winning, at the position of the first occurrence.
+        """
+        positions = {}
+        for position, key in enumerate(self.keys()):
+            positions[key] = position
+        if len(positions) == len(self):
+            return self
+        selected = list(positions.values())
+        return AtmBatch([[column[i] for i in selected] for column in self.columns])
+
+
+def decode_atm_records(records: Iterable[dict]) -> AtmBatch:
+    """
+    Decodes file records into a columnar batch.
+
+    Raises:
+        ValueError: If a record has a missing or malformed timestamp.
+    """
+    return AtmBatch.from_rows([decode_atm_record(record) for record in records])
+
+
+def iter_atm_batches(records: Iterable[dict], batch_size: int) -> Iterator[AtmBatch]:
+    """
+    Decodes a stream of file records into columnar batches of at most
+    batch_size records.
+    """
+    for batch in iter_batches(records, batch_size):
+        yield decode_atm_records(batch)
+
+
+class ValidatedBatch(NamedTuple):
+    """
+    The records of a batch that passed validation, and the errors of the
+    ones that did not, as (record index, message) pairs.
+    """
+
+    batch: AtmBatch
+    errors: List[Tuple[int, str]]
+
+
+_record_adapter = TypeAdapter(AtmIngestRecord)
+_records_adapter = TypeAdapter(List[AtmIngestRecord])
+
+
+def _validated_rows(records: List[dict]) -> List[tuple]:
+    return [_get_payload_fields(record["payload"]) for record in records]
+
+
+def _validate_one_by_one(records: list) -> ValidatedBatch:
+    rows = []
+    errors = []
+    for index, record in enumerate(records):
+        try:
+            payload = _record_adapter.validate_python(record)["payload"]
+        except ValidationError as e:
+            errors.append((index, _error_message(e)))
+            continue
+        rows.append(tuple(payload.get(field) for field in PAYLOAD_FIELDS))
+    return ValidatedBatch(AtmBatch.from_rows(rows), errors)
+
+
+def _error_message(error: ValidationError) -> str:
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}"
+
+
+def _fill_missing(records: List[dict]) -> List[dict]:
+    # Optional fields absent from a payload are reported as None
+    for record in records:
+        payload = record["payload"]
+        if len(payload) != len(PAYLOAD_FIELDS):
+            for field in PAYLOAD_FIELDS:
+                payload.setdefault(field, None)
+    return records
+
+
+def validate_atm_records(records: list) -> ValidatedBatch:
+    """
+    Validates decoded file records against the ingest schema and converts
+    them into a columnar batch.
+
+    The whole list is validated with one call. Only when it contains invalid
+    records are they validated one by one, so that the valid ones are kept
+    and an error is reported for each invalid one.
+    """
+    try:
+        validated = _records_adapter.validate_python(records)
+    except ValidationError:
+        return _validate_one_by_one(records)
+    return ValidatedBatch(AtmBatch.from_rows(_validated_rows(_fill_missing(validated))), [])
+
+
+def load_json(content: Any) -> Any:
+    """
+    Parses JSON from bytes or from any buffer, such as the memory map of a
+    cached file, which is parsed in place rather than copied to bytes.
+
+    Raises:
+        json.JSONDecodeError: If the content is not valid JSON.
+    """
+    if isinstance(content, (bytes, bytearray, str)):
+        return json.loads(content)
+    # orjson errors are json.JSONDecodeError too
+    return orjson.loads(memoryview(content))
+
+
+def _validate_loaded_file(records: Any) -> ValidatedBatch:
+    if isinstance(records, dict):
+        records = [records]  # Single record file
+    if not isinstance(records, list):
+        return ValidatedBatch(AtmBatch.from_rows([]), [(0, "File is not a list of records")])
+    return validate_atm_records(records)
+
+
+def validate_atm_file(content: bytes) -> ValidatedBatch:
+    """
+    Validates the raw content of an ATM file (a JSON array of records, or a
+    single record) straight from bytes and converts it into a columnar batch.
+    Other buffers, which pydantic cannot read, are parsed by load_json first.
+
+    Raises:
+        json.JSONDecodeError: If the content is not valid JSON.
+    """
+    if not isinstance(content, (bytes, bytearray, str)):
+        return _validate_loaded_file(load_json(content))
+    try:
+        validated = _records_adapter.validate_json(content)
+    except ValidationError:
+        return _validate_loaded_file(json.loads(content))
+    return ValidatedBatch(AtmBatch.from_rows(_validated_rows(_fill_missing(validated))), [])
+
+
+def iter_validated_batches(records: Iterable[dict], batch_size: int) -> Iterator[ValidatedBatch]:
+    """
+    Validates a stream of file records in batches of at most batch_size.
+    """
+    for batch in iter_batches(records, batch_size):
+        yield validate_atm_records(batch)
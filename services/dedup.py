@@ -0,0 +1,123 @@
+import time
+from enum import IntEnum
+from os import getenv
+from typing import Dict, List
+from services import in_memory_cache
+
+# "memory" (per-process cache), "shared" (shared by the processes of the host,
+# see services.shared_dedup) or "redis" (shared between replicas)
+dedup_backend_name = getenv("DEDUP_BACKEND", "memory")
+# Seconds a claim stays valid in the stores shared between processes, so the
+# messages of a process that died are processed again once it expires. Claims
+# are not renewed, so they last at least as long as the subscriber extends the
+# lease of a message (MAX_LEASE_SECONDS): a file still being processed is never
+# taken for abandoned.
+max_lease_seconds = int(getenv("MAX_LEASE_SECONDS", 3600))
+dedup_lease_seconds = max(int(getenv("DEDUP_LEASE_SECONDS", max_lease_seconds)), max_lease_seconds)
+# Delay before a message found in flight elsewhere is released for redelivery
+dedup_in_flight_retry_seconds = float(getenv("DEDUP_IN_FLIGHT_RETRY_SECONDS", 30))
+
+
+class Seen(IntEnum):
+    """
+    What the store knows of a message digest. NEW and DONE compare equal to
+    False and True.
+    """
+    # Not known, claimed by the caller
+    NEW = 0
+    # Processed and committed, the message can be acked
+    DONE = 1
+    # Claimed by a delivery still being processed, the message must be
+    # neither acked (the processing may still fail) nor processed again
+    IN_FLIGHT = 2
+
+
+class DedupBackend:
+    """
+    Store of the digests of the messages already processed.
+
+    A digest is claimed when its message arrives and committed once its work
+    is written, only committed digests make a redelivery a duplicate.
+    """
+
+    async def check_and_add_many(self, keys: List[bytes]) -> List[Seen]:
+        """
+        Claims the new keys and reports what was known of each one. Keys
+        repeated within the call are reported in flight after their first
+        occurrence.
+
+        Parameters:
+        - keys (list[bytes]): Message digests.
+
+        Returns:
+        - list[Seen]: For each key, NEW if the caller claimed it.
+        """
+        raise NotImplementedError
+
+    async def check_and_add(self, key: bytes) -> Seen:
+        return (await self.check_and_add_many([key]))[0]
+
+    async def commit(self, key: bytes) -> None:
+        """
+        Records a claimed key as processed, once its work is committed.
+        """
+        raise NotImplementedError
+
+    async def discard(self, key: bytes) -> None:
+        """
+        Forgets a key whose processing failed, so its redelivery is processed.
+        """
+        raise NotImplementedError
+
+
+class MemoryDedupBackend(DedupBackend):
+    """
+    Deduplication against the in-process cache only.
+
+    Claims are held here, apart from the cache: only committed digests enter
+    the cache, and so its journal and the snapshot written on shutdown (see
+    services.dedup_snapshot). A message still in flight when the process
+    stops is processed again when it is redelivered.
+    """
+
+    def __init__(self):
+        # Claimed digests and the time they were claimed
+        self.claimed: Dict[bytes, float] = {}
+
+    async def check_and_add_many(self, keys: List[bytes]) -> List[Seen]:
+        cache = in_memory_cache.cache
+        now = time.time()
+        seen = []
+        for key in keys:
+            claimed = self.claimed.get(key)
+            if claimed is not None and now - claimed < dedup_lease_seconds:
+                seen.append(Seen.IN_FLIGHT)
+            elif cache.seen(key, now):
+                seen.append(Seen.DONE)
+            else:
+                self.claimed[key] = now
+                seen.append(Seen.NEW)
+        return seen
+
+    async def commit(self, key: bytes) -> None:
+        self.claimed.pop(key, None)
+        in_memory_cache.cache.add(key)
+
+    async def discard(self, key: bytes) -> None:
+        self.claimed.pop(key, None)
+        in_memory_cache.cache.discard(key)
+
+
+def create_dedup_backend(name: str = None) -> DedupBackend:
+    """
+    Creates the deduplication backend selected by DEDUP_BACKEND.
+    """
+    name = name or dedup_backend_name
+    if name == "redis":
+        # Imported here so the Redis client is only created when it is used
+        from services.redis import RedisDedupBackend
+        return RedisDedupBackend()
+    if name == "shared":
+        from services.shared_dedup import SharedDedupBackend
+        return SharedDedupBackend()
+    return MemoryDedupBackend()
@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from os import getenv
+from typing import Iterator, List, NoReturn, Optional, Set, Tuple
+
+from services.in_memory_cache import DedupCache
+
+# Configure logging to output detailed logs
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+MAGIC = b"ATMDDUP2"
+# Magic and number of entries
+HEADER = struct.Struct("<8sQ")
+KEY_SIZE = 32
+# The snapshot is columnar: after the header, the fanout table (for each
+# 2-byte digest prefix, the index after the last entry with that prefix or a
+# smaller one), then the sorted digests, then their last seen times
+FANOUT = struct.Struct("<65536I")
+FANOUT_ENTRY = struct.Struct("<I")
+SEEN = struct.Struct("<d")
+# Log entry: digest and last seen time, a last seen of 0 discards the digest
+ENTRY = struct.Struct("<32sd")
+
+# Snapshot of the dedup cache, empty to disable it; its log is written next to it
+dedup_snapshot_path = getenv("DEDUP_SNAPSHOT_PATH", "dedup.snapshot")
+# Seconds between two appends of the cache changes to the log
+dedup_snapshot_interval = float(getenv("DEDUP_SNAPSHOT_INTERVAL_SECONDS", 5))
+# Log entries above which the log is compacted into a new snapshot
+dedup_snapshot_compact_entries = int(getenv("DEDUP_SNAPSHOT_COMPACT_ENTRIES", 100000))
+
+
+def log_path(path: str) -> str:
+    return f"{path}.log"
+
+
+def pack_entries(entries: List[Tuple[bytes, float]]) -> bytes:
+    return b"".join(ENTRY.pack(key, seen) for key, seen in entries if len(key) == KEY_SIZE)
+
+
+class Snapshot:
+    """
+    Read-only, memory-mapped snapshot of the dedup cache, used as its
+    fallback. Digests are sorted and indexed by their first two bytes, so
+    opening it costs nothing whatever its size and a lookup only reads a
+    few entries. Expiration is checked by the cache on lookup.
+    """
+
+    def __init__(self, path: str):
+        """
+        Raises:
+        - FileNotFoundError: If there is no snapshot at path.
+        - ValueError: If the file is not a dedup snapshot.
+        """
+        self.path = path
+        self.forgotten: Set[bytes] = set()
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < HEADER.size + FANOUT.size:
+                raise ValueError(f"{path} is not a dedup snapshot")
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        self._keys = HEADER.size + FANOUT.size
+        self._seen = self._keys + self.count * KEY_SIZE
+        if magic != MAGIC or size < self._seen + self.count * SEEN.size:
+            self._map.close()
+            raise ValueError(f"{path} is not a dedup snapshot")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _bucket(self, key: bytes) -> Tuple[int, int]:
+        prefix = key[0] << 8 | key[1]
+        end = FANOUT_ENTRY.unpack_from(self._map, HEADER.size + prefix * FANOUT_ENTRY.size)[0]
+        if not prefix:
+            return 0, end
+        return FANOUT_ENTRY.unpack_from(self._map, HEADER.size + (prefix - 1) * FANOUT_ENTRY.size)[0], end
+
+    def _key_at(self, index: int) -> bytes:
+        offset = self._keys + index * KEY_SIZE
+        return self._map[offset:offset + KEY_SIZE]
+
+    def lookup(self, key: bytes) -> Optional[float]:
+        if len(key) != KEY_SIZE or key in self.forgotten:
+            return None
+        low, high = self._bucket(key)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._key_at(low) == key:
+            return SEEN.unpack_from(self._map, self._seen + low * SEEN.size)[0]
+        return None
+
+    def forget(self, key: bytes) -> None:
+        self.forgotten.add(key)
+
+    def entries(self) -> Iterator[Tuple[bytes, float]]:
+        """
+        Iterates over the entries not forgotten, in digest order.
+        """
+        keys = self._map[self._keys:self._seen]
+        seen = array("d", self._map[self._seen:self._seen + self.count * SEEN.size])
+        for index, last_seen in enumerate(seen):
+            key = keys[index * KEY_SIZE:(index + 1) * KEY_SIZE]
+            if key not in self.forgotten:
+                yield key, last_seen
+
+    def close(self) -> None:
+        self._map.close()
+
+
+def write_snapshot(
+    path: str,
+    entries: List[Tuple[bytes, float]],
+    previous: Optional[Snapshot],
+    cutoff: float,
+    max_entries: int,
+) -> None:
+    """
+    Writes a snapshot of the entries merged with those of the previous
+    snapshot, the most recent last seen winning. Entries seen before the
+    cutoff are dropped, and only the `max_entries` most recent are kept.
+
+    The snapshot is written aside and renamed, so a crash never leaves it
+    truncated.
+    """
+    merged = {}
+    if previous is not None:
+        merged.update((key, seen) for key, seen in previous.entries() if seen > cutoff)
+    for key, seen in entries:
+        # Only digests are kept, other keys would not survive the fixed key size
+        if len(key) == KEY_SIZE and seen > cutoff and seen >= merged.get(key, 0.0):
+            merged[key] = seen
+    if len(merged) > max_entries:
+        recent = sorted(merged.items(), key=lambda entry: entry[1])[-max_entries:]
+        merged = dict(recent)
+    keys = sorted(merged)
+    fanout = [bisect_left(keys, (prefix + 1).to_bytes(2, "big")) for prefix in range(65535)]
+    fanout.append(len(keys))
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(keys)))
+        file.write(FANOUT.pack(*fanout))
+        file.write(b"".join(keys))
+        file.write(array("d", map(merged.__getitem__, keys)).tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def replay_log(path: str, cache: DedupCache, now: Optional[float] = None) -> int:
+    """
+    Applies the changes appended to the log at path since the last
+    snapshot, skipping expired ones. A partial entry left at its end by a
+    crash is ignored.
+
+    Returns:
+    - int: The number of entries read.
+    """
+    now = time.time() if now is None else now
+    try:
+        with open(path, "rb") as file:
+            content = file.read()
+    except FileNotFoundError:
+        return 0
+    content = content[:len(content) - len(content) % ENTRY.size]
+    for key, seen in ENTRY.iter_unpack(content):
+        if not seen:
+            cache.discard(key)
+        elif now - seen < cache.ttl:
+            cache.add(key, seen)
+    return len(content) // ENTRY.size
+
+
+class DedupPersistence:
+    """
+    Keeps the dedup cache on disk so that a restarted process still knows
+    the messages processed before it stopped.
+
+    Changes of the cache are journaled and appended to a log every
+    `interval` seconds. Once the log holds `compact_entries` entries, the
+    cache and the previous snapshot are merged into a new snapshot and the
+    log is emptied. At startup the snapshot is mapped as the fallback of
+    the cache, then the log replayed into the cache.
+    """
+
+    def __init__(self, cache: DedupCache, path: str, interval: float = 5, compact_entries: int = 100000):
+        self.cache = cache
+        self.path = path
+        self.log_path = log_path(path)
+        self.interval = interval
+        self.compact_entries = compact_entries
+        self.snapshot: Optional[Snapshot] = None
+        self.log_entries = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self) -> int:
+        """
+        Maps the snapshot, replays the log and starts journaling the changes
+        of the cache. A snapshot that cannot be read is ignored.
+
+        Returns:
+        - int: The number of entries in the snapshot.
+        """
+        started = time.perf_counter()
+        try:
+            self.snapshot = Snapshot(self.path)
+        except FileNotFoundError:
+            self.snapshot = None
+        except ValueError as e:
+            logging.error(f"Ignoring dedup snapshot: {str(e)}")
+            self.snapshot = None
+        self.cache.fallback = self.snapshot
+        self.log_entries = replay_log(self.log_path, self.cache)
+        self.cache.journal = []
+        loaded = len(self.snapshot) if self.snapshot else 0
+        logging.info(
+            f"Loaded {loaded} dedup snapshot entries and {self.log_entries} log entries "
+            f"in {time.perf_counter() - started:.3f}s"
+        )
+        return loaded
+
+    def flush(self) -> None:
+        """
+        Appends the journaled changes to the log.
+        """
+        journal, self.cache.journal = self.cache.journal, []
+        if not journal:
+            return
+        with open(self.log_path, "ab") as file:
+            file.write(pack_entries(journal))
+        self.log_entries += len(journal)
+
+    async def compact(self) -> None:
+        """
+        Writes a new snapshot off the event loop, swaps it in as the
+        fallback of the cache and empties the log. Changes made meanwhile
+        stay journaled for the next flush.
+        """
+        self.flush()
+        previous = self.snapshot
+        await asyncio.get_running_loop().run_in_executor(
+            None, write_snapshot, self.path, self.cache.items(), previous,
+            time.time() - self.cache.ttl, self.cache.max_entries,
+        )
+        # Everything in the log is in the snapshot now
+        open(self.log_path, "wb").close()
+        self.log_entries = 0
+        self.snapshot = Snapshot(self.path)
+        if previous is not None:
+            # Discarded while the snapshot was written; the keys discarded
+            # before are not in the new snapshot, they need not be kept
+            self.snapshot.forgotten = {
+                key for key in previous.forgotten if self.snapshot.lookup(key) is not None
+            }
+        self.cache.fallback = self.snapshot
+        if previous is not None:
+            previous.close()
+
+    async def run(self) -> NoReturn:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.flush()
+                if self.log_entries >= self.compact_entries:
+                    await self.compact()
+            except OSError as e:
+                logging.error(f"Failed to persist the dedup cache: {str(e)}")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """
+        Stops the periodic flush and writes a final snapshot.
+        """
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.compact()
+
+
+persistence: Optional[DedupPersistence] = None
+
+
+def start_dedup_persistence(cache: DedupCache) -> None:
+    """
+    Restores the cache from its snapshot and keeps it persisted, unless
+    DEDUP_SNAPSHOT_PATH is empty.
+    """
+    global persistence
+    if not dedup_snapshot_path:
+        return
+    persistence = DedupPersistence(
+        cache, dedup_snapshot_path, dedup_snapshot_interval, dedup_snapshot_compact_entries
+    )
+    persistence.load()
+    persistence.start()
+
+
+async def stop_dedup_persistence() -> None:
+    global persistence
+    if persistence:
+        await persistence.stop()
+        persistence = None
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+from typing import List, Tuple
+
+from services.atm_index import NATURAL_KEY_LENGTH
+from services.decoder import AtmBatch
+
+
+def row_fingerprint(row: tuple) -> int:
+    """
+    Fingerprint of the mutable columns of an ATM record tuple, the ones
+    following the natural key. Only meant to be compared within the process.
+    """
+    return hash(row[NATURAL_KEY_LENGTH:])
+
+
+class FingerprintCache:
+    """
+    Fingerprint of the last committed content of each natural key, bounded
+    by LRU eviction.
+
+    It lets the records a write would leave unchanged be dropped before they
+    reach the database. The cache only knows what this process wrote, so it
+    must not be enabled when anything else writes the table.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, int]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def split(self, batch: AtmBatch) -> Tuple[AtmBatch, List[Tuple[tuple, int]]]:
+        """
+        Drops the records whose content matches the cached fingerprint of
+        their natural key.
+
+        Args:
+            batch (AtmBatch): Records with unique natural keys.
+
+        Returns:
+            tuple: The changed records, and their (natural key, fingerprint)
+            pairs to pass to update once they are committed.
+        """
+        entries = self._entries
+        selected = []
+        fingerprints = []
+        for position, row in enumerate(batch):
+            key = row[:NATURAL_KEY_LENGTH]
+            fingerprint = row_fingerprint(row)
+            if entries.get(key) == fingerprint:
+                entries.move_to_end(key)
+                continue
+            selected.append(position)
+            fingerprints.append((key, fingerprint))
+        if len(selected) == len(batch):
+            return batch, fingerprints
+        return AtmBatch([[column[i] for i in selected] for column in batch.columns]), fingerprints
+
+    def update(self, fingerprints: List[Tuple[tuple, int]]) -> None:
+        """
+        Records the fingerprints of committed records.
+        """
+        entries = self._entries
+        for key, fingerprint in fingerprints:
+            entries[key] = fingerprint
+            entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
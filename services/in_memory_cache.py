@@ -1,33 +1,173 @@
 import time
 import asyncio
-from typing import Dict, Any, NoReturn
+from collections import OrderedDict
+from os import getenv
+from typing import Dict, List, NoReturn, Optional, Tuple
+
+
+class DedupCache:
+    """
+    Bounded set of processed message digests with LRU and TTL eviction.
+
+    Keys are raw digests (32 bytes for SHA-256) mapped to the time they were
+    last seen. The mapping is kept in last-seen order, so both the least
+    recently used and the oldest entries sit at its front and are evicted
+    incrementally, without scanning the whole cache.
+
+    Keys not found in the cache are looked up in `fallback` when it is set,
+    a read-only store of older entries (such as the snapshot loaded at
+    startup) whose expired entries are ignored when they are looked up.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Object with lookup(key) -> last seen or None, and forget(key)
+        self.fallback = None
+        # When set to a list, every change is appended to it as (key, last
+        # seen), a last seen of 0 meaning the key was discarded
+        self.journal: Optional[List[Tuple[bytes, float]]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _last_seen(self, key: bytes) -> Optional[float]:
+        timestamp = self._entries.get(key)
+        if timestamp is None and self.fallback is not None:
+            timestamp = self.fallback.lookup(key)
+        return timestamp
+
+    def __contains__(self, key: bytes) -> bool:
+        timestamp = self._last_seen(key)
+        return timestamp is not None and time.time() - timestamp < self.ttl
+
+    def seen(self, key: bytes, now: Optional[float] = None) -> bool:
+        """
+        Reports whether the key is present, recording it as seen now if so.
+        A missing key is not added.
+        """
+        now = time.time() if now is None else now
+        self.expire(now)
+        timestamp = self._last_seen(key)
+        if timestamp is not None and now - timestamp < self.ttl:
+            self.hits += 1
+            self.add(key, now)
+            return True
+        self.misses += 1
+        return False
+
+    def check_and_add(self, key: bytes) -> bool:
+        """
+        Records the key and reports whether it was already present.
+
+        The check and the insertion happen without yielding to the event loop,
+        so two concurrent deliveries of the same message cannot both miss.
+        """
+        now = time.time()
+        if self.seen(key, now):
+            return True
+        self.add(key, now)
+        return False
+
+    def add(self, key: bytes, now: Optional[float] = None) -> None:
+        """
+        Records the key as seen now, evicting the least recently used entry
+        when the cache is full.
+        """
+        now = time.time() if now is None else now
+        self._entries[key] = now
+        self._entries.move_to_end(key)
+        if self.journal is not None:
+            self.journal.append((key, now))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def discard(self, key: bytes) -> None:
+        """
+        Forgets the key, so that the message is processed again if redelivered.
+        """
+        self._entries.pop(key, None)
+        if self.fallback is not None:
+            self.fallback.forget(key)
+        if self.journal is not None:
+            self.journal.append((key, 0.0))
+
+    def items(self) -> List[Tuple[bytes, float]]:
+        """
+        Returns a copy of the entries, without the fallback ones, in
+        last-seen order.
+        """
+        return list(self._entries.items())
+
+    def expire(self, now: Optional[float] = None, limit: Optional[int] = None) -> int:
+        """
+        Evicts expired entries from the front of the cache.
+
+        Parameters:
+        - now (float, optional): Current time. Defaults to time.time().
+        - limit (int, optional): Maximum number of entries to evict.
+
+        Returns:
+        - int: The number of evicted entries.
+        """
+        now = time.time() if now is None else now
+        evicted = 0
+        while self._entries and (limit is None or evicted < limit):
+            key, timestamp = next(iter(self._entries.items()))
+            if now - timestamp < self.ttl:
+                break
+            del self._entries[key]
+            evicted += 1
+        self.evictions += evicted
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
 
 # Global variables
-cache: Dict[str, Dict[str, Any]] = {}
-expiration_time: int = 7 * 60 * 60  # 1 hour in seconds (default)
+expiration_time: int = 60 * 60  # 1 hour in seconds (default)
+max_entries: int = int(getenv("DEDUP_CACHE_MAX_ENTRIES", 100000))
+cleaning_interval: int = int(getenv("DEDUP_CLEANING_INTERVAL_SECONDS", 60))
+# Entries evicted per step of the periodic cleaning before yielding to the loop
+cleaning_batch_size: int = 1000
+cache = DedupCache(max_entries, expiration_time)
 
-async def add_message(message_hash: str) -> None:
-    cache[message_hash] = {"timestamp": time.time()}
+async def add_message(message_hash: bytes) -> None:
+    cache.add(message_hash)
 
-async def is_message_processed(message_hash: str) -> bool:
+async def is_message_processed(message_hash: bytes) -> bool:
     return message_hash in cache
 
+async def check_and_add(message_hash: bytes) -> bool:
+    return cache.check_and_add(message_hash)
+
 async def clean_old_messages() -> None:
-    global cache
-    current_time = time.time()
-    cache = {
-        k: v for k, v in cache.items()
-        if current_time - v["timestamp"] < expiration_time
-    }
+    while cache.expire(limit=cleaning_batch_size) == cleaning_batch_size:
+        await asyncio.sleep(0)
 
 async def clean_old_messages_periodically() -> NoReturn:
     while True:
         await clean_old_messages()
-        await asyncio.sleep(expiration_time)
+        await asyncio.sleep(cleaning_interval)
 
-def set_expiration_time(days: int)  -> None:
+def set_expiration_time(hours: int)  -> None:
     global expiration_time
-    expiration_time = days * 24 * 60 * 60
+    expiration_time = hours * 60 * 60
+    cache.ttl = expiration_time
+
+def cache_stats() -> Dict[str, int]:
+    return cache.stats()
 
 # Initialize the cleaning task
 cleaning_task = None
@@ -39,4 +179,4 @@ def start_cleaning_task() -> None:
 def stop_cleaning_task() -> None:
     global cleaning_task
     if cleaning_task:
-        cleaning_task.cancel()
\ No newline at end of file
+        cleaning_task.cancel()
@@ -0,0 +1,156 @@
+import logging
+import logging.handlers
+import queue
+from os import getenv
+from typing import Any, Callable, Dict, Optional
+
+# Longest rendering of a logged payload, in characters
+log_max_payload = int(getenv("LOG_MAX_PAYLOAD", 256))
+# Log one in N occurrences of each per-message event, e.g. "message=100,duplicate=10";
+# events not listed are always logged
+log_sample = getenv("LOG_SAMPLE", "")
+# Format and write log records on a background thread instead of the event loop
+log_queue = getenv("LOG_QUEUE", "true").lower() == "true"
+
+
+class Truncated:
+    """
+    Log argument rendering its value only when the record is emitted, and
+    cutting it to `limit` characters.
+    """
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = None):
+        self.value = value
+        self.limit = log_max_payload if limit is None else limit
+
+    def __str__(self) -> str:
+        value = self.value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            text = bytes(value[:self.limit]).decode("utf-8", "replace")
+            size = len(value)
+        else:
+            text = str(value)
+            size = len(text)
+        if size <= self.limit:
+            return text
+        return f"{text[:self.limit]}... ({size} chars)"
+
+
+class Lazy:
+    """
+    Log argument computed only when the record is emitted.
+    """
+    __slots__ = ("function", "args")
+
+    def __init__(self, function: Callable[..., Any], *args):
+        self.function = function
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.function(*self.args))
+
+
+def parse_sample_rates(value: str) -> Dict[str, int]:
+    """
+    Parses "event=N,event=N" sampling rates.
+
+    Raises:
+    - ValueError: If a rate is not a positive integer.
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        event, _, every = item.partition("=")
+        rate = int(every)
+        if rate < 1:
+            raise ValueError(f"Invalid log sampling rate for {event}: {every}")
+        rates[event.strip()] = rate
+    return rates
+
+
+class EventSampler:
+    """
+    Keeps one in `rates[event]` occurrences of each event, starting with
+    the first one.
+    """
+
+    def __init__(self, rates: Dict[str, int]):
+        self.rates = rates
+        self._counts: Dict[str, int] = {}
+
+    def sampled(self, event: str) -> bool:
+        every = self.rates.get(event, 1)
+        if every == 1:
+            return True
+        count = self._counts.get(event, 0)
+        self._counts[event] = count + 1
+        return count % every == 0
+
+
+sampler = EventSampler(parse_sample_rates(log_sample))
+
+
+def log_event(event: str, level: int, msg: str, *args) -> None:
+    """
+    Logs a per-message event with %-style arguments, which are only
+    formatted if the level is enabled and the occurrence is sampled.
+
+    Parameters:
+    - event (str): Name of the event, for sampling (see LOG_SAMPLE).
+    - level (int): Logging level.
+    - msg (str): Format string.
+    - args: Its arguments; wrap payloads in Truncated.
+    """
+    logger = logging.getLogger()
+    if logger.isEnabledFor(level) and sampler.sampled(event):
+        logger.log(level, msg, *args)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves the record as is: the message is formatted by
+    the listener thread, not by the caller. Arguments are read later, so
+    they must not be mutated after being logged.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+listener: Optional[logging.handlers.QueueListener] = None
+
+
+def start_queue_logging() -> None:
+    """
+    Moves the handlers of the root logger behind a queue, so that formatting
+    and I/O happen on a background thread. Does nothing if LOG_QUEUE is off
+    or it is already started.
+    """
+    global listener
+    root = logging.getLogger()
+    if not log_queue or listener is not None:
+        return
+    handlers = list(root.handlers)
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(records))
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+
+
+def stop_queue_logging() -> None:
+    """
+    Writes the queued records and puts the handlers back on the root logger.
+    """
+    global listener
+    if listener is None:
+        return
+    listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, DeferredQueueHandler):
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        root.addHandler(handler)
+    listener = None
@@ -0,0 +1,95 @@
+import codecs
+import json
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def iter_json_records(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Incrementally parses records from a stream of byte chunks.
+
+    Accepts a JSON array of records, a single JSON record, or newline
+    delimited JSON (NDJSON). Only the chunk being parsed and the records not
+    yet consumed are held in memory.
+
+    Args:
+        chunks (Iterable[bytes]): The raw file content, in chunks.
+
+    Yields:
+        dict: The parsed records, in file order.
+
+    Raises:
+        json.JSONDecodeError: If the content is not valid JSON.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    in_array = None  # Unknown until the first non-whitespace character
+    expect_separator = False
+    exhausted = False
+
+    while True:
+        # Skip whitespace and, inside an array, the separators between records
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char in _WHITESPACE:
+                pos += 1
+            elif in_array is None:
+                in_array = char == "["
+                pos += 1 if in_array else 0
+            elif in_array and expect_separator and char == ",":
+                expect_separator = False
+                pos += 1
+            elif in_array and char == "]":
+                return
+            else:
+                break
+
+        if pos < len(buffer):
+            if expect_separator:
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+            try:
+                record, end = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+                record = None  # The record is incomplete, read more data
+            else:
+                # A record ending exactly at the end of the buffer may be a
+                # truncated number or literal, only trust it at end of input
+                if end < len(buffer) or exhausted:
+                    pos = end
+                    expect_separator = bool(in_array)
+                    yield record
+                    continue
+
+        if exhausted:
+            if in_array:
+                raise json.JSONDecodeError("Unterminated array", buffer, pos)
+            return
+
+        # Drop the consumed prefix and read the next chunk
+        buffer = buffer[pos:]
+        pos = 0
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer += utf8.decode(b"", final=True)
+            exhausted = True
+        else:
+            buffer += utf8.decode(chunk)
+
+
+def iter_batches(items: Iterable, batch_size: int) -> Iterator[List]:
+    """
+    Groups items into lists of at most batch_size items.
+    """
+    items = iter(items)
+    while True:
+        batch = list(islice(items, batch_size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,289 @@
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Iterator, List, Sequence, Tuple
+
+# Histogram buckets in seconds, from a fast cache hit to a large file load
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """
+    A named metric with optional labels, rendered in the Prometheus text
+    exposition format.
+
+    Children are created on first use of a label combination and kept in a
+    dict, so recording a sample is a dict lookup plus an addition: cheap
+    enough to leave on. Updates happen on the event loop thread and need no
+    lock.
+
+    A metric can also be rendered with the snapshots of the same metric in
+    other processes, summed with its own values by label combination.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self.labels()  # Reported as zero before the first sample
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[Tuple[str, ...], object]:
+        """
+        The current values by label combination, picklable.
+        """
+        raise NotImplementedError
+
+    def _add(self, value: object, other: object) -> object:
+        return value + other
+
+    def _samples(self, values: Dict[Tuple[str, ...], object]) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self, remote: Sequence[Dict[str, dict]] = ()) -> List[str]:
+        """
+        Parameters:
+        - remote (list): Registry snapshots of other processes, see
+          Registry.snapshot.
+        """
+        values = self.snapshot()
+        for snapshot in remote:
+            for labels, value in snapshot.get(self.name, {}).items():
+                values[labels] = self._add(values[labels], value) if labels in values else value
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples(values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        return {labels: child.value for labels, child in self._children.items()}
+
+    def _samples(self, values: Dict[Tuple[str, ...], float]) -> Iterator[str]:
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float]]:
+        return {labels: (list(child.counts), child.sum) for labels, child in self._children.items()}
+
+    def _add(self, value: tuple, other: tuple) -> tuple:
+        return [count + more for count, more in zip(value[0], other[0])], value[1] + other[1]
+
+    def _samples(self, values: Dict[Tuple[str, ...], tuple]) -> Iterator[str]:
+        for label_values, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, label_values, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge(_Metric):
+    """
+    A gauge read when the metrics are rendered, from a callback returning
+    either a number or a mapping of label value to number (for a gauge with
+    one label).
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], object], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.read = read
+
+    def _new_child(self):
+        return None
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        value = self.read()
+        if isinstance(value, dict):
+            return {(label,): number for label, number in value.items()}
+        return {} if value is None else {(): value}
+
+    def _samples(self, values: Dict[Tuple[str, ...], float]) -> Iterator[str]:
+        for labels, number in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(number)}"
+
+
+class Registry:
+    """
+    The metrics of the process, rendered together with the snapshots other
+    processes reported (the subscriber workers, see services.supervisor).
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._remote: Dict[Hashable, Dict[str, dict]] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        The values of every metric, to be sent to the rendering process.
+        """
+        return {metric.name: metric.snapshot() for metric in self._metrics}
+
+    def set_remote(self, source: Hashable, snapshot: Dict[str, dict]) -> None:
+        """
+        Replaces the last snapshot reported by another process.
+        """
+        self._remote[source] = snapshot
+
+    def drop_remote(self, source: Hashable) -> None:
+        self._remote.pop(source, None)
+
+    def render(self) -> str:
+        lines = []
+        remote = list(self._remote.values())
+        for metric in self._metrics:
+            lines.extend(metric.render(remote))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    "atm_ingest_stage_duration_seconds",
+    "Time spent in each stage of message and file processing.",
+    ("stage",),
+))
+messages_total = registry.register(Counter(
+    "atm_ingest_messages_total", "Pub/Sub messages received."
+))
+files_total = registry.register(Counter(
+    "atm_ingest_files_total", "Files processed, by outcome.", ("outcome",)
+))
+records_total = registry.register(Counter(
+    "atm_ingest_records_total", "ATM records written, by operation.", ("operation",)
+))
+dedup_hits_total = registry.register(Counter(
+    "atm_ingest_dedup_hits_total", "Messages skipped as already processed."
+))
+errors_total = registry.register(Counter(
+    "atm_ingest_errors_total", "Processing errors, by exception type.", ("type",)
+))
+blob_cache_requests_total = registry.register(Counter(
+    "atm_blob_cache_requests_total", "Blob cache lookups of downloaded files, by outcome.", ("outcome",)
+))
+db_acquire_seconds = registry.register(Histogram(
+    "atm_db_pool_acquire_duration_seconds", "Time spent waiting for a pooled database connection."
+))
+
+
+def record_error(error: BaseException) -> None:
+    errors_total.labels(type(error).__name__).inc()
+
+
+def register_gauge(name: str, documentation: str, read: Callable[[], object], labelnames: Sequence[str] = ()) -> Gauge:
+    return registry.register(Gauge(name, documentation, read, labelnames))
+
+
+def render() -> str:
+    return registry.render()
+
+
+def timed_stage(stage: str, handler: Callable) -> Callable:
+    """
+    Wraps a coroutine function so each call is observed in stage_seconds.
+    """
+    histogram = stage_seconds.labels(stage)
+
+    async def timed(*args, **kwargs):
+        with histogram.time():
+            return await handler(*args, **kwargs)
+
+    return timed
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, List, NamedTuple, Optional
+
+# Configure logging to output detailed logs
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class Stage(NamedTuple):
+    """
+    A pipeline stage.
+
+    Attributes:
+    - name (str): Stage name, used in logs.
+    - handler (Callable): Coroutine function called with each item.
+    - workers (int): Number of concurrent workers for the stage.
+    """
+
+    name: str
+    handler: Callable[[Any], Awaitable[None]]
+    workers: int = 1
+
+
+class Pipeline:
+    """
+    Staged processing pipeline with bounded queues between stages.
+
+    Every stage runs a fixed number of workers, each one with its own bounded
+    queue. Items are routed to a worker by the hash of their key, at every
+    stage, so all items sharing a key go through the same worker queues in
+    submission order: items with the same key are never processed out of
+    order, while items with different keys are processed concurrently.
+
+    A full queue blocks the upstream worker (or `submit`), which gives
+    backpressure all the way back to the intake.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        key: Callable[[Any], Hashable],
+        queue_size: int = 16,
+        on_error: Optional[Callable[[Any, Exception], Awaitable[None]]] = None,
+    ):
+        """
+        Parameters:
+        - stages (list[Stage]): Stages, in processing order.
+        - key (Callable): Returns the ordering key of an item.
+        - queue_size (int): Capacity of each worker queue.
+        - on_error (Callable, optional): Coroutine function called with the item
+          and the exception when a stage handler fails. The item does not reach
+          the following stages.
+        """
+        self.stages = stages
+        self.key = key
+        self.queue_size = queue_size
+        self.on_error = on_error
+        self._queues: List[List[asyncio.Queue]] = []
+        self._tasks: List[asyncio.Task] = []
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def start(self) -> None:
+        """
+        Create the stage queues and start the workers.
+        """
+        self._queues = [
+            [asyncio.Queue(maxsize=self.queue_size) for _ in range(stage.workers)]
+            for stage in self.stages
+        ]
+        for index, stage in enumerate(self.stages):
+            for queue in self._queues[index]:
+                self._tasks.append(asyncio.create_task(self._worker(index, queue)))
+
+    async def stop(self) -> None:
+        """
+        Cancel the workers. Items still queued are dropped.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, item: Any) -> None:
+        """
+        Submit an item to the first stage, waiting while its queue is full.
+        """
+        self._pending += 1
+        self._idle.clear()
+        await self._route(0, item)
+
+    async def join(self) -> None:
+        """
+        Wait until every submitted item has left the pipeline.
+        """
+        await self._idle.wait()
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of submitted items that have not left the pipeline yet.
+        """
+        return self._pending
+
+    async def _route(self, index: int, item: Any) -> None:
+        queues = self._queues[index]
+        await queues[hash(self.key(item)) % len(queues)].put(item)
+
+    def _done(self) -> None:
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
+
+    async def _worker(self, index: int, queue: asyncio.Queue) -> None:
+        stage = self.stages[index]
+        last = index == len(self.stages) - 1
+        while True:
+            item = await queue.get()
+            try:
+                await stage.handler(item)
+            except Exception as e:
+                logging.error(f"Pipeline stage {stage.name} failed: {str(e)}")
+                if self.on_error:
+                    try:
+                        await self.on_error(item, e)
+                    except Exception as handler_error:
+                        logging.error(f"Pipeline error handler failed: {str(handler_error)}")
+                self._done()
+                continue
+            if last:
+                self._done()
+            else:
+                await self._route(index + 1, item)
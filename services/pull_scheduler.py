@@ -0,0 +1,81 @@
+class PullScheduler:
+    """
+    Chooses the size of each synchronous pull and the pause before it.
+
+    The batch size doubles after every full pull while the messages in
+    flight stay below `max_in_flight`, and halves when they reach it, so
+    pulls grow while processing keeps up and shrink under backpressure. A
+    pull is never sized above the room left below `max_in_flight`.
+
+    The next pull starts right away after any pull that returned messages.
+    Only an empty or failed pull is followed by a pause, which doubles on
+    every consecutive one, from `min_backoff` up to `max_backoff` seconds.
+    """
+
+    def __init__(
+        self,
+        min_batch: int = 1,
+        max_batch: int = 1000,
+        max_in_flight: int = 1000,
+        min_backoff: float = 0.1,
+        max_backoff: float = 10.0,
+    ):
+        """
+        Parameters:
+        - min_batch (int): Smallest pull size, also the initial one.
+        - max_batch (int): Largest pull size.
+        - max_in_flight (int): Received messages not yet acked or nacked above
+          which pulls shrink.
+        - min_backoff (float): Pause after the first empty or failed pull.
+        - max_backoff (float): Longest pause.
+        """
+        self.min_batch = max(1, min_batch)
+        self.max_batch = max(self.min_batch, max_batch)
+        self.max_in_flight = max_in_flight
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._batch = self.min_batch
+        self._requested = self.min_batch
+        self._in_flight = 0
+        self._backoff = 0.0
+
+    def next_batch_size(self) -> int:
+        """
+        Returns:
+        - int: The number of messages to request in the next pull.
+        """
+        room = self.max_in_flight - self._in_flight
+        self._requested = max(self.min_batch, min(self._batch, room))
+        return self._requested
+
+    def on_pull(self, received: int, in_flight: int) -> float:
+        """
+        Adapts to the outcome of a pull.
+
+        Parameters:
+        - received (int): Messages returned by the pull.
+        - in_flight (int): Messages in flight once they were handed over.
+
+        Returns:
+        - float: Seconds to wait before the next pull.
+        """
+        self._in_flight = in_flight
+        if not received:
+            return self._back_off()
+        self._backoff = 0.0
+        if in_flight >= self.max_in_flight:
+            self._batch = max(self.min_batch, self._batch // 2)
+        elif received >= self._requested:
+            self._batch = min(self.max_batch, self._batch * 2)
+        return 0.0
+
+    def on_error(self) -> float:
+        """
+        Returns:
+        - float: Seconds to wait before retrying after a failed pull.
+        """
+        return self._back_off()
+
+    def _back_off(self) -> float:
+        self._backoff = min(self.max_backoff, max(self.min_backoff, self._backoff * 2))
+        return self._backoff
@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from os import getenv
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, NamedTuple, Optional, Set
+
+from services.decoder import AtmBatch
+
+# Tag of every cached listing page, all of them stale after any write
+LISTING_TAG = ("page",)
+
+
+class CachedResponse(NamedTuple):
+    """
+    A serialized response body and its entity tag.
+    """
+    body: bytes
+    etag: str
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class ReadCache:
+    """
+    Read-through cache of serialized query results with TTL and LRU eviction.
+
+    Entries carry tags naming the rows they were built from, so a write can
+    drop exactly the entries it makes stale. Concurrent misses of the same
+    key share one load, and a load that overlaps an invalidation is returned
+    but not stored, so it cannot bring back data older than the write.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._tagged: Dict[Hashable, Set[Hashable]] = {}
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, response, _ = entry
+        if time.monotonic() >= expires:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        tags: Iterable[Hashable],
+        load: Callable[[], Awaitable[bytes]],
+    ) -> CachedResponse:
+        """
+        Returns the cached response for the key, loading and caching it on a
+        miss.
+
+        Parameters:
+        - key (Hashable): The cache key.
+        - tags (Iterable): Tags invalidating the entry.
+        - load (Callable): Coroutine function returning the response body.
+
+        Returns:
+        - CachedResponse: The response body and its entity tag.
+        """
+        response = self.get(key)
+        if response is not None:
+            self.hits += 1
+            return response
+        pending = self._loading.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        generation = self._generation
+        try:
+            body = await load()
+            response = CachedResponse(body, make_etag(body))
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Waiters get the error, nobody else needs it
+            raise
+        finally:
+            del self._loading[key]
+        if generation == self._generation:
+            self._store(key, tags, response)
+        future.set_result(response)
+        return response
+
+    def invalidate(self, tags: Iterable[Hashable]) -> int:
+        """
+        Drops the entries carrying any of the tags.
+
+        Returns:
+        - int: The number of dropped entries.
+        """
+        self._generation += 1
+        dropped = 0
+        for tag in tags:
+            for key in self._tagged.pop(tag, ()):
+                if key in self._entries:
+                    self._remove(key)
+                    dropped += 1
+        return dropped
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+        self._tagged.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _store(self, key: Hashable, tags: Iterable[Hashable], response: CachedResponse) -> None:
+        if key in self._entries:
+            self._remove(key)
+        tags = tuple(tags)
+        self._entries[key] = (time.monotonic() + self.ttl, response, tags)
+        for tag in tags:
+            self._tagged.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+
+def atm_tag(identifier: str) -> tuple:
+    return ("atm", identifier)
+
+
+def town_tag(town_name: str) -> tuple:
+    return ("town", town_name)
+
+
+def atm_batch_tags(batch: AtmBatch) -> Set[tuple]:
+    """
+    Tags of the cached responses a write of the batch makes stale.
+    """
+    identifiers, towns = batch.columns[0], batch.columns[3]
+    tags = {atm_tag(identifier) for identifier in identifiers}
+    tags.update(town_tag(town) for town in towns)
+    tags.add(LISTING_TAG)
+    return tags
+
+
+# Global variables
+read_cache_ttl: float = float(getenv("READ_CACHE_TTL_SECONDS", 30))
+read_cache_max_entries: int = int(getenv("READ_CACHE_MAX_ENTRIES", 10000))
+# The cache lives in this process: writes committed by other replicas are
+# only seen once the entries expire
+read_cache = ReadCache(read_cache_max_entries, read_cache_ttl)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+# Configure logging to output detailed logs
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Startup times are measured from here, the first module imported by main
+process_started = time.perf_counter()
+
+
+class Readiness:
+    """
+    Startup state of the service dependencies, reported by /ready.
+
+    Each dependency is warmed by warm, which retries it with a growing
+    pause until it succeeds, and records how long after the process start
+    it became ready. The time to the first processed message is recorded
+    too, as the measure of a cold start.
+    """
+
+    def __init__(self, started: float = None, retry_min: float = 1.0, retry_max: float = 30.0):
+        self.started = process_started if started is None else started
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self._dependencies: Dict[str, dict] = {}
+        self.first_message_seconds: Optional[float] = None
+
+    def elapsed(self) -> float:
+        return round(time.perf_counter() - self.started, 3)
+
+    def expect(self, *names: str) -> None:
+        """
+        Registers dependencies not warm yet, so that the service is not
+        reported ready before they are.
+        """
+        for name in names:
+            self._dependencies.setdefault(name, {"ready": False})
+
+    def mark_ready(self, name: str, seconds: float = None) -> None:
+        state = {"ready": True, "ready_after_seconds": self.elapsed()}
+        if seconds is not None:
+            state["seconds"] = round(seconds, 3)
+        self._dependencies[name] = state
+        if self.ready:
+            logging.info(f"Service ready {self.elapsed():.3f}s after start")
+
+    async def warm(self, name: str, init: Callable[[], Awaitable[None]]) -> None:
+        """
+        Runs init until it succeeds, then marks the dependency ready.
+
+        Parameters:
+        - name (str): The dependency, as reported by /ready.
+        - init (Callable): Coroutine function initializing it.
+        """
+        self.expect(name)
+        delay = self.retry_min
+        while True:
+            started = time.perf_counter()
+            try:
+                await init()
+            except Exception as e:
+                logging.error(f"Failed to initialize {name}, retrying in {delay:.0f}s: {str(e)}")
+                self._dependencies[name] = {"ready": False, "error": str(e)}
+                await asyncio.sleep(delay)
+                delay = min(self.retry_max, delay * 2)
+                continue
+            seconds = time.perf_counter() - started
+            logging.info(f"{name} initialized in {seconds:.3f}s")
+            self.mark_ready(name, seconds)
+            return
+
+    def message_processed(self) -> None:
+        if self.first_message_seconds is None:
+            self.first_message_seconds = self.elapsed()
+            logging.info(f"First message processed {self.first_message_seconds:.3f}s after start")
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._dependencies) and all(state["ready"] for state in self._dependencies.values())
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": self.elapsed(),
+            "first_message_seconds": self.first_message_seconds,
+            "dependencies": {name: dict(state) for name, state in self._dependencies.items()},
+        }
+
+
+readiness = Readiness()
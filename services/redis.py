@@ -0,0 +1,145 @@
+import logging
+import time
+from os import getenv
+from typing import Dict, List
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from services import in_memory_cache
+from services import dedup
+from services.dedup import DedupBackend, Seen, dedup_lease_seconds
+from services.in_memory_cache import DedupCache
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:
+    import aioredis
+
+# Configure logging to output detailed logs
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Load environment variables from a .env file.
+load_dotenv()
+
+redis_url = getenv("REDIS_URL", "redis://localhost:6379")
+# Size of the local cache kept in front of Redis
+l1_max_entries = int(getenv("DEDUP_L1_MAX_ENTRIES", 10000))
+key_prefix = b"dedup:"
+# Value of a claimed key; committed keys hold "1", as every key did before claims
+CLAIMED = b"claimed"
+COMMITTED = b"1"
+
+# Connections are opened on first use
+redis_client = aioredis.from_url(redis_url)
+
+
+async def check_redis_connection() -> None:
+    """
+    Checks that Redis is reachable.
+
+    Raises:
+        HTTPException: If Redis does not answer the ping.
+    """
+    try:
+        await redis_client.ping()
+        logging.info("Redis connection successfull.")
+    except Exception:
+        logging.error("Redis connection check failed", exc_info=True)
+        raise HTTPException(status_code=500, detail="Redis connection check failed")
+
+
+class RedisDedupBackend(DedupBackend):
+    """
+    Deduplication shared by every replica through Redis.
+
+    A whole batch of keys is claimed with one pipelined round trip of
+    `SET key claimed NX EX lease` followed by `GET key`: a key that was set
+    is new work, an existing claim is a message in flight in some replica,
+    and a committed key (set for the dedup TTL once the file is written) was
+    processed. Claims expire after DEDUP_LEASE_SECONDS, so the messages of a
+    replica that died are processed again.
+
+    Committed keys are also kept in a small local cache, which answers
+    redeliveries to the same replica without a round trip, as do the claims
+    of this replica. When Redis cannot be reached these decide alone, so
+    messages keep flowing at the risk of processing a redelivery twice.
+
+    A local claim is only trusted for DEDUP_IN_FLIGHT_RETRY_SECONDS, after
+    which Redis is asked again: a file handed over to another worker process
+    is committed or discarded by that process, not by the one that claimed it.
+    """
+
+    def __init__(self, max_entries: int = None):
+        self.l1 = DedupCache(max_entries or l1_max_entries, in_memory_cache.expiration_time)
+        # Claimed keys and the time their local claim expires, oldest first
+        self.claimed: Dict[bytes, float] = {}
+
+    def _expire_claims(self, now: float) -> None:
+        # Every claim lasts as long, so the expired ones lead the dict
+        while self.claimed:
+            key = next(iter(self.claimed))
+            if self.claimed[key] > now:
+                return
+            del self.claimed[key]
+
+    def _local(self, key: bytes):
+        if key in self.claimed:
+            return Seen.IN_FLIGHT
+        if key in self.l1:
+            return Seen.DONE
+        return None
+
+    async def check_and_add_many(self, keys: List[bytes]) -> List[Seen]:
+        self.l1.ttl = in_memory_cache.expiration_time
+        now = time.monotonic()
+        self._expire_claims(now)
+        deadline = now + dedup.dedup_in_flight_retry_seconds
+        seen = []
+        misses = []
+        for i, key in enumerate(keys):
+            local = self._local(key)
+            if local is None:
+                # Later occurrences in the batch are in flight
+                self.claimed[key] = deadline
+                misses.append(i)
+                local = Seen.NEW
+            seen.append(local)
+        if not misses:
+            return seen
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for i in misses:
+                    pipe.set(key_prefix + keys[i], CLAIMED, nx=True, ex=dedup_lease_seconds)
+                    pipe.get(key_prefix + keys[i])
+                results = await pipe.execute()
+        except Exception as e:
+            logging.error(f"Redis dedup check failed, using the local cache only: {str(e)}")
+            return seen
+        for i, created, value in zip(misses, results[::2], results[1::2]):
+            if created:
+                continue
+            self.claimed.pop(keys[i], None)
+            if value == COMMITTED:
+                self.l1.add(keys[i])
+                seen[i] = Seen.DONE
+            else:
+                # Claimed by another replica, or its claim expired meanwhile
+                seen[i] = Seen.IN_FLIGHT
+        return seen
+
+    async def commit(self, key: bytes) -> None:
+        self.claimed.pop(key, None)
+        self.l1.add(key)
+        try:
+            await redis_client.set(key_prefix + key, COMMITTED, ex=int(in_memory_cache.expiration_time))
+        except Exception as e:
+            logging.error(f"Redis dedup commit failed: {str(e)}")
+
+    async def discard(self, key: bytes) -> None:
+        self.claimed.pop(key, None)
+        self.l1.discard(key)
+        try:
+            await redis_client.delete(key_prefix + key)
+        except Exception as e:
+            logging.error(f"Redis dedup discard failed: {str(e)}")
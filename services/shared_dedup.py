@@ -0,0 +1,203 @@
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from os import getenv
+from typing import Iterator, List, Optional, Tuple
+
+from services import in_memory_cache
+from services.dedup import DedupBackend, Seen, dedup_lease_seconds
+
+MAGIC = b"ATMDEDUP"
+# Magic, number of sets, ways per set
+HEADER = struct.Struct("<8sII")
+# Time and message digest. The time is the last time a committed digest was
+# seen, or minus the time a digest still in flight was claimed (0 for an
+# empty slot)
+SLOT = struct.Struct("<d32s")
+KEY_SIZE = 32
+
+# Path of the table shared by the subscriber processes of the host
+dedup_shared_path = getenv("DEDUP_SHARED_PATH", os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "atm-dedup"
+))
+# Slots of the table; keep it at least twice the number of digests kept
+dedup_shared_capacity = int(getenv("DEDUP_SHARED_CAPACITY", 1 << 20))
+dedup_shared_ways = 8
+
+
+class SharedDedupTable:
+    """
+    Set of message digests in a memory-mapped file, shared by the processes
+    that map it.
+
+    The table is set-associative: a digest can only live in the `ways`
+    slots of the set its first bytes select. A lookup reads that set only,
+    and an insertion takes an empty or expired slot of the set, or evicts
+    its least recently seen digest.
+
+    A digest is claimed when its message arrives and committed once the
+    message is processed. A claim only lasts `lease` seconds, so the claims
+    of a worker that crashed expire and the redelivered messages are
+    processed again; a committed digest lasts `ttl` seconds. Each set is guarded by a lock on its
+    byte range of the file (fcntl), so processes only wait for each other
+    when they touch the same set.
+
+    The locks are held per process: the table must be used from one thread
+    of each process, the event loop thread.
+    """
+
+    def __init__(self, path: str):
+        """
+        Opens an existing table, see create.
+
+        Raises:
+        - FileNotFoundError: If there is no table at path.
+        - ValueError: If the file is not a table.
+        """
+        self.path = path
+        self._file = open(path, "r+b")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0)
+            magic, self.sets, self.ways = HEADER.unpack_from(self._map, 0)
+        except (ValueError, struct.error):
+            self._file.close()
+            raise ValueError(f"{path} is not a dedup table")
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a dedup table")
+        self._set_size = self.ways * SLOT.size
+
+    @classmethod
+    def create(cls, path: str, capacity: int, ways: int = 8) -> "SharedDedupTable":
+        """
+        Creates an empty table of at least capacity slots, replacing any
+        previous file at path, and opens it.
+        """
+        sets = max(1, -(-capacity // ways))
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(HEADER.pack(MAGIC, sets, ways))
+            file.truncate(HEADER.size + sets * ways * SLOT.size)
+        os.replace(temporary, path)
+        return cls(path)
+
+    @property
+    def capacity(self) -> int:
+        return self.sets * self.ways
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def _set_offset(self, key: bytes) -> int:
+        return HEADER.size + int.from_bytes(key[:8], "little") % self.sets * self._set_size
+
+    @contextmanager
+    def _locked(self, offset: int) -> Iterator[None]:
+        fd = self._file.fileno()
+        fcntl.lockf(fd, fcntl.LOCK_EX, self._set_size, offset)
+        try:
+            yield
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, self._set_size, offset)
+
+    @staticmethod
+    def _live(seen: float, now: float, ttl: float, lease: float) -> bool:
+        if seen > 0:
+            return now - seen < ttl
+        return seen < 0 and now + seen < lease
+
+    def _slot_of(self, key: bytes, offset: int, now: float, ttl: float, lease: float) -> Tuple[int, float]:
+        # The slot holding the digest and its time, or else the slot to
+        # take for it and 0
+        victim = offset
+        victim_seen = float("inf")
+        for slot in range(offset, offset + self._set_size, SLOT.size):
+            seen, stored = SLOT.unpack_from(self._map, slot)
+            if stored == key and seen:
+                return slot, seen
+            # Prefer a free slot, then the least recently seen digest
+            rank = abs(seen) if self._live(seen, now, ttl, lease) else float("-inf")
+            if rank < victim_seen:
+                victim, victim_seen = slot, rank
+        return victim, 0.0
+
+    def claim(self, key: bytes, ttl: float, lease: float, now: Optional[float] = None) -> Seen:
+        """
+        Claims the digest for lease seconds, unless it was committed less
+        than ttl seconds ago (DONE) or claimed less than lease seconds ago
+        (IN_FLIGHT).
+        """
+        key = key[:KEY_SIZE].ljust(KEY_SIZE, b"\0")
+        now = time.time() if now is None else now
+        offset = self._set_offset(key)
+        with self._locked(offset):
+            slot, seen = self._slot_of(key, offset, now, ttl, lease)
+            if self._live(seen, now, ttl, lease):
+                if seen < 0:
+                    return Seen.IN_FLIGHT
+                SLOT.pack_into(self._map, slot, now, key)
+                return Seen.DONE
+            SLOT.pack_into(self._map, slot, -now, key)
+            return Seen.NEW
+
+    def commit(self, key: bytes, ttl: float, lease: float, now: Optional[float] = None) -> None:
+        """
+        Records the digest as processed now, claimed or not.
+        """
+        key = key[:KEY_SIZE].ljust(KEY_SIZE, b"\0")
+        now = time.time() if now is None else now
+        offset = self._set_offset(key)
+        with self._locked(offset):
+            slot, _ = self._slot_of(key, offset, now, ttl, lease)
+            SLOT.pack_into(self._map, slot, now, key)
+
+    def contains(self, key: bytes, ttl: float, now: Optional[float] = None) -> bool:
+        """
+        Reports whether the digest was committed less than ttl seconds ago.
+        """
+        key = key[:KEY_SIZE].ljust(KEY_SIZE, b"\0")
+        now = time.time() if now is None else now
+        offset = self._set_offset(key)
+        with self._locked(offset):
+            for slot in range(offset, offset + self._set_size, SLOT.size):
+                seen, stored = SLOT.unpack_from(self._map, slot)
+                if stored == key and seen:
+                    return seen > 0 and now - seen < ttl
+        return False
+
+    def discard(self, key: bytes) -> None:
+        key = key[:KEY_SIZE].ljust(KEY_SIZE, b"\0")
+        offset = self._set_offset(key)
+        with self._locked(offset):
+            for slot in range(offset, offset + self._set_size, SLOT.size):
+                seen, stored = SLOT.unpack_from(self._map, slot)
+                if stored == key and seen:
+                    SLOT.pack_into(self._map, slot, 0.0, bytes(KEY_SIZE))
+                    return
+
+
+class SharedDedupBackend(DedupBackend):
+    """
+    Deduplication against the table shared by the subscriber processes of
+    the host, with the expiration time of the in-process cache and claims
+    lasting DEDUP_LEASE_SECONDS.
+    """
+
+    def __init__(self, path: str = None):
+        self.table = SharedDedupTable(path or dedup_shared_path)
+
+    async def check_and_add_many(self, keys: List[bytes]) -> List[Seen]:
+        ttl = in_memory_cache.expiration_time
+        now = time.time()
+        return [self.table.claim(key, ttl, dedup_lease_seconds, now) for key in keys]
+
+    async def commit(self, key: bytes) -> None:
+        self.table.commit(key, in_memory_cache.expiration_time, dedup_lease_seconds)
+
+    async def discard(self, key: bytes) -> None:
+        self.table.discard(key)
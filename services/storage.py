@@ -1,9 +1,20 @@
 import asyncio
+import base64
 import logging
-from google.cloud import storage
-from google.oauth2 import service_account
+import mmap
+from functools import partial
+from typing import TYPE_CHECKING, Iterator, List, NamedTuple, Optional, Tuple, Union
+import google_crc32c
+from google.api_core.exceptions import NotFound
+from google.resumable_media import DataCorruption
 from os import getenv
 from dotenv import load_dotenv
+from services.blob_cache import BlobCache
+from services.clients import storage_client
+from services.metrics import blob_cache_requests_total
+
+if TYPE_CHECKING:
+    from google.cloud import storage
 
 # Configure logging to output detailed logs
 logging.basicConfig(
@@ -13,14 +24,72 @@ logging.basicConfig(
 # Load environment variables from a .env file.
 load_dotenv()
 
-# Load credentials and bucket name from environment variables.
-credentials_path = getenv("GCP_CREDENTIALS")
+# Load the bucket name from environment variables.
 bucket_name = getenv("BUCKET_NAME")
+# Size of each read when streaming a file.
+stream_chunk_size = int(getenv("STREAM_CHUNK_SIZE", 1024 * 1024))
+# Objects above this size are downloaded as parallel ranged reads.
+parallel_download_threshold = int(getenv("PARALLEL_DOWNLOAD_THRESHOLD", 32 * 1024 * 1024))
+download_range_size = int(getenv("DOWNLOAD_RANGE_SIZE", 8 * 1024 * 1024))
+# Directory of the downloaded files kept for retries and replays, empty to disable it.
+blob_cache_dir = getenv("BLOB_CACHE_DIR", "blob_cache")
+# Size above which the least recently used cached files are evicted.
+blob_cache_max_bytes = int(getenv("BLOB_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Created on first use with the shared client, see get_bucket.
+bucket = None
+# Opened on first use, see get_blob_cache.
+blob_cache: Optional[BlobCache] = None
+blob_cache_failed = False
+
+
+def get_bucket() -> "storage.Bucket":
+    """
+    Returns the configured bucket. The Cloud Storage client is created, and
+    the credentials loaded, on first use, which blocks.
+
+    Returns:
+        storage.Bucket: The bucket named by BUCKET_NAME.
+    """
+    global bucket
+    if bucket is None:
+        bucket = storage_client.get().bucket(bucket_name)
+    return bucket
+
+
+def open_blob_cache(directory: str, max_bytes: int) -> Optional[BlobCache]:
+    """
+    Opens the blob cache in the given directory, replacing the one opened
+    so far. Files are downloaded without it if it cannot be opened.
+    Args:
+        directory (str): Directory of the cached files, empty to disable the cache.
+        max_bytes (int): Size bound of the cached files.
+
+    Returns:
+        BlobCache: The cache, or None if it is disabled or cannot be opened.
+    """
+    global blob_cache, blob_cache_failed
+    blob_cache = None
+    blob_cache_failed = not directory
+    if directory:
+        try:
+            blob_cache = BlobCache(directory, max_bytes)
+        except OSError as e:
+            logging.error(f"Downloading without the blob cache, cannot open {directory}: {str(e)}")
+            blob_cache_failed = True
+    return blob_cache
+
+
+def get_blob_cache() -> Optional[BlobCache]:
+    """
+    Returns the blob cache configured by BLOB_CACHE_DIR, opened on first use.
 
-# Initialize the Google Cloud Storage client with the specified credentials.
-credentials = service_account.Credentials.from_service_account_file(credentials_path)
-client = storage.Client(credentials=credentials, project=credentials.project_id)
-bucket = client.bucket(bucket_name)
+    Returns:
+        BlobCache: The cache, or None if it is disabled or cannot be opened.
+    """
+    if blob_cache is None and not blob_cache_failed:
+        open_blob_cache(blob_cache_dir, blob_cache_max_bytes)
+    return blob_cache
 
 
 async def upload_file(file_content: bytes, file_name: str, content_type: str) -> str:
@@ -34,54 +103,197 @@ async def upload_file(file_content: bytes, file_name: str, content_type: str) ->
     Returns:
         str: The name of the file after it has been uploaded.
     """
-    blob = bucket.blob(file_name)
+    blob = get_bucket().blob(file_name)
     loop = asyncio.get_running_loop()
     func = lambda: blob.upload_from_string(file_content, content_type)
     await loop.run_in_executor(None, func)
     return file_name
 
 
-def download_file(file_path: str) -> bytes:
+class DownloadedFile(NamedTuple):
+    """
+    The content of a downloaded file along with its metadata. Content read
+    from the blob cache is a read-only memory map, see services.decoder.load_json.
+    """
+
+    content: Union[bytes, mmap.mmap]
+    size: int
+    generation: int
+
+
+def _download_range(blob: "storage.Blob", start: int, end: int) -> bytes:
+    # Checksums cover the whole object, they are validated once all ranges are joined
+    return blob.download_as_bytes(start=start, end=end, checksum=None)
+
+
+async def _cached_file(cache: Optional[BlobCache], file_path: str, generation: int) -> Optional[DownloadedFile]:
+    if cache is None:
+        return None
+    # Opening and mapping the cached file blocks, like writing it
+    content = await asyncio.get_running_loop().run_in_executor(None, cache.get, file_path, generation)
+    blob_cache_requests_total.labels("miss" if content is None else "hit").inc()
+    if content is None:
+        return None
+    logging.info(f"File {file_path} generation {generation} read from the blob cache.")
+    return DownloadedFile(content, len(content), generation)
+
+
+def _cache_file(cache: BlobCache, file_path: str, generation: int, content: bytes) -> None:
+    try:
+        cache.put(file_path, generation, content)
+    except OSError as e:
+        logging.warning(f"Failed to cache {file_path} generation {generation}: {str(e)}")
+
+
+async def download_file_async(
+    file_path: str, generation: Optional[int] = None, size: Optional[int] = None
+) -> Optional[DownloadedFile]:
     """
-    Downloads a file from Google Cloud Storage.
+    Asynchronously downloads a file from Google Cloud Storage.
+
+    A file is downloaded with a single request, with no metadata request or
+    existence pre-check: its generation and checksum come from the headers of
+    the response, and a missing object is reported by that same request. When
+    the caller knows both the generation and the size, from the notification,
+    objects larger than PARALLEL_DOWNLOAD_THRESHOLD are read as
+    DOWNLOAD_RANGE_SIZE ranges in parallel, pinned to that generation.
+
+    Downloaded files are kept in the blob cache (BLOB_CACHE_DIR), so a file
+    processed again, after a failure or in a replay, is not downloaded again.
+    When the caller knows the generation, a cached file costs no request at
+    all.
     Args:
         file_path (str): The full path of the file in the bucket.
-        bucket_name (str): The name of the bucket containing the file. Defaults to BUCKET_NAME from env.
+        generation (int): The generation expected, if known.
+        size (int): The size of that generation in bytes, if known.
 
     Returns:
-        bytes: The content of the file, or None if the file does not exist.
+        DownloadedFile: The content, size and generation of the file, or None
+        if the file does not exist.
+
+    Raises:
+        OSError: If the content read does not match the object checksum.
+        Other errors of the storage client (timeouts, connection errors) are
+        raised as is, so that the caller can retry the download.
     """
+    loop = asyncio.get_running_loop()
     try:
-        blob = bucket.blob(file_path)
-
+        cache = get_blob_cache()
+        if generation is not None:
+            cached = await _cached_file(cache, file_path, generation)
+            if cached:
+                return cached
         logging.info(
             f"Attempting to download blob: {file_path} from bucket: {bucket_name}"
         )
+        if generation is not None and size is not None and size > parallel_download_threshold:
+            blob = get_bucket().blob(file_path, generation=generation)
+            ranges = [
+                (start, min(start + download_range_size, size) - 1)
+                for start in range(0, size, download_range_size)
+            ]
+            parts = await asyncio.gather(
+                *(
+                    loop.run_in_executor(None, _download_range, blob, start, end)
+                    for start, end in ranges
+                )
+            )
+            file_bytes = b"".join(parts)
+            # Every ranged response carries the checksum of the whole object
+            if blob.crc32c and blob.crc32c != base64.b64encode(
+                google_crc32c.Checksum(file_bytes).digest()
+            ).decode("ascii"):
+                # A corrupted transfer, not a malformed file: retried
+                raise IOError(f"Checksum mismatch for {file_path}")
+        else:
+            # The client checks the content against the checksum it is sent with
+            blob = get_bucket().blob(file_path)
+            try:
+                file_bytes = await loop.run_in_executor(
+                    None, partial(blob.download_as_bytes, checksum="crc32c")
+                )
+            except DataCorruption as e:
+                raise IOError(f"Checksum mismatch for {file_path}") from e
 
-        if not blob.exists():
-            logging.error(f"Blob {file_path} does not exist in bucket {bucket_name}.")
-            return None
-
-        logging.info(f"Blob {file_path} exists in bucket {bucket_name}. Downloading...")
-        file_bytes = blob.download_as_bytes()
         logging.info(
             f"File {file_path} downloaded successfully from bucket {bucket_name}."
         )
-        return file_bytes
+        if cache is not None:
+            await loop.run_in_executor(None, _cache_file, cache, file_path, blob.generation, file_bytes)
+        return DownloadedFile(file_bytes, len(file_bytes), blob.generation)
+    except NotFound:
+        logging.error(f"Blob {file_path} does not exist in bucket {bucket_name}.")
+        return None
     except Exception as e:
         logging.error(
             f"An error occurred while downloading {file_path} from bucket {bucket_name}: {str(e)}",
             exc_info=True,
         )
-        return None
+        raise
+
+
+def download_file(file_path: str) -> bytes:
+    """
+    Downloads a file from Google Cloud Storage. Synchronous wrapper around
+    download_file_async, not to be called from a running event loop.
+    Args:
+        file_path (str): The full path of the file in the bucket.
+
+    Returns:
+        bytes: The content of the file, or None if the file does not exist.
+    """
+    downloaded = asyncio.run(download_file_async(file_path))
+    return bytes(downloaded.content) if downloaded else None
 
 
-def list_files() -> list:
+def iter_file_chunks(file_path: str, chunk_size: int = None) -> Iterator[bytes]:
+    """
+    Reads a file from Google Cloud Storage in chunks, so that only one chunk
+    is held in memory at a time.
+    Args:
+        file_path (str): The full path of the file in the bucket.
+        chunk_size (int): The size of each read. Defaults to STREAM_CHUNK_SIZE from env.
+
+    Yields:
+        bytes: The file content, chunk by chunk.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    chunk_size = chunk_size or stream_chunk_size
+    logging.info(f"Streaming blob: {file_path} from bucket: {bucket_name}")
+    try:
+        with get_bucket().blob(file_path).open("rb", chunk_size=chunk_size) as reader:
+            while True:
+                chunk = reader.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+    except NotFound as e:
+        raise FileNotFoundError(f"Blob {file_path} does not exist in bucket {bucket_name}") from e
+
+
+def list_files(prefix: str = None) -> list:
     """
     Lists all files stored in the specified Google Cloud Storage bucket.
+    Args:
+        prefix (str): Only list the files whose name starts with it.
 
     Returns:
         list: A list of file names in the bucket.
     """
-    blobs = bucket.list_blobs(bucket_name)
+    blobs = get_bucket().list_blobs(prefix=prefix)
     return [blob.name for blob in blobs]
+
+
+def list_file_sizes(prefix: str = None) -> List[Tuple[str, int]]:
+    """
+    Lists the files stored in the bucket along with their size.
+    Args:
+        prefix (str): Only list the files whose name starts with it.
+
+    Returns:
+        list: (file name, size in bytes) pairs, in name order.
+    """
+    blobs = get_bucket().list_blobs(prefix=prefix)
+    return [(blob.name, blob.size) for blob in blobs]
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import logging
+import os
+from multiprocessing import get_context
+from os import getenv
+from typing import List, NamedTuple, Optional
+
+from services.shared_dedup import SharedDedupTable, dedup_shared_capacity, dedup_shared_path, dedup_shared_ways
+
+# Configure logging to output detailed logs
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Subscriber worker processes; 1 keeps the subscriber in the HTTP process
+subscriber_workers = int(getenv("SUBSCRIBER_WORKERS", 1))
+# Seconds between two checks of the worker processes
+supervisor_check_interval = float(getenv("SUPERVISOR_CHECK_INTERVAL", 5))
+# Seconds between two reports of the metrics of a worker to the HTTP process
+worker_metrics_interval = float(getenv("WORKER_METRICS_INTERVAL", 5))
+
+
+class Shard(NamedTuple):
+    """
+    The part of the files a subscriber worker process owns, and the inbound
+    queues of every worker, through which files are handed to their owner.
+    Events for the HTTP process (metrics, read cache invalidations) go to
+    the supervisor through `events`.
+    """
+    index: int
+    count: int
+    queues: list
+    events: object = None
+
+
+def shard_of(file_name: str, count: int) -> int:
+    """
+    Returns the worker owning a file. Stable across processes, unlike hash().
+    """
+    digest = hashlib.blake2b(file_name.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % count
+
+
+def run_worker(shard: Shard) -> None:
+    """
+    Entry point of a subscriber worker process.
+    """
+    asyncio.run(_run_worker(shard))
+
+
+async def _run_worker(shard: Shard) -> None:
+    # Imported here so the supervising process never creates a subscriber
+    from services.alloyDB import init_db_pool
+    from services.clients import subscriber_client
+    from services.in_memory_cache import set_expiration_time
+    from services.storage import blob_cache_dir, blob_cache_max_bytes, get_bucket, open_blob_cache
+    from controllers.extractTyc import initialize_pubsub_service
+    from services.ingest_log import start_queue_logging
+    # Registers the gauges reported along with the worker's counters
+    import controllers.metrics  # noqa: F401
+
+    start_queue_logging()
+    if blob_cache_dir:
+        # A file is always processed by the same worker, so each caches its own files
+        open_blob_cache(os.path.join(blob_cache_dir, f"worker-{shard.index}"), blob_cache_max_bytes // shard.count)
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        init_db_pool(),
+        loop.run_in_executor(None, get_bucket),
+        loop.run_in_executor(None, subscriber_client.get),
+    )
+    set_expiration_time(int(getenv("CLEANING_INTERVAL_HOURS", 1)))
+    await initialize_pubsub_service(shard)
+    logging.info(f"Subscriber worker {shard.index + 1}/{shard.count} started (pid {os.getpid()})")
+    await _report_metrics(shard)
+
+
+async def _report_metrics(shard: Shard) -> None:
+    from services.metrics import registry
+
+    while True:
+        shard.events.put(("metrics", shard.index, registry.snapshot()))
+        await asyncio.sleep(worker_metrics_interval)
+
+
+class Supervisor:
+    """
+    Runs the subscriber in `workers` processes of this host and restarts
+    the ones that exit.
+
+    Every worker pulls from the subscription. Messages are deduplicated
+    against a table shared by all the workers (unless DEDUP_BACKEND selects
+    Redis, which is shared already), then each file is processed by the
+    worker its name hashes to, so one object is never in flight in two
+    processes.
+
+    The HTTP app stays in the supervising process: the workers report their
+    metrics to it, rendered with its own by /metrics, and the read cache
+    entries their writes make stale, which it drops.
+    """
+
+    def __init__(self, workers: int, dedup_path: str = None):
+        self.workers = workers
+        self.dedup_path = dedup_path or dedup_shared_path
+        self._context = get_context("spawn")
+        self._queues: list = []
+        self._events = None
+        self._processes: List[Optional[object]] = []
+        self._table: Optional[SharedDedupTable] = None
+        self._task: Optional[asyncio.Task] = None
+        self._events_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if getenv("DEDUP_BACKEND", "memory") == "memory":
+            self._table = SharedDedupTable.create(self.dedup_path, dedup_shared_capacity, dedup_shared_ways)
+            # Spawned workers inherit the environment and select the shared table
+            os.environ["DEDUP_BACKEND"] = "shared"
+            os.environ["DEDUP_SHARED_PATH"] = self.dedup_path
+        self._queues = [self._context.Queue() for _ in range(self.workers)]
+        self._events = self._context.Queue()
+        self._processes = [self._spawn(index) for index in range(self.workers)]
+        self._task = asyncio.create_task(self._monitor())
+        self._events_task = asyncio.create_task(self._receive_events())
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=run_worker,
+            args=(Shard(index, self.workers, self._queues, self._events),),
+            name=f"subscriber-{index}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    async def _monitor(self) -> None:
+        while True:
+            await asyncio.sleep(supervisor_check_interval)
+            self.check_workers()
+
+    async def _receive_events(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await loop.run_in_executor(None, self._events.get)
+            if event is None:
+                return
+            self.handle_event(event)
+
+    def handle_event(self, event: tuple) -> None:
+        """
+        Applies an event sent by a worker: ("metrics", worker index,
+        registry snapshot) or ("invalidate", read cache tags).
+        """
+        from services.metrics import registry
+        from services.read_cache import read_cache
+
+        kind = event[0]
+        if kind == "metrics":
+            registry.set_remote(("worker", event[1]), event[2])
+        elif kind == "invalidate":
+            read_cache.invalidate(event[1])
+        else:
+            logging.warning(f"Unknown worker event {kind}")
+
+    def check_workers(self) -> None:
+        """
+        Restarts the workers that exited. Their unacked messages are
+        redelivered by Pub/Sub once their ack deadline expires.
+        """
+        for index, process in enumerate(self._processes):
+            if not process.is_alive():
+                logging.error(f"Subscriber worker {index} exited with code {process.exitcode}, restarting it")
+                # Its counters start over in the new process
+                from services.metrics import registry
+                registry.drop_remote(("worker", index))
+                self._processes[index] = self._spawn(index)
+
+    async def stop(self, timeout: float = 10) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join(timeout)
+        if self._events_task:
+            self._events.put(None)
+            await asyncio.gather(self._events_task, return_exceptions=True)
+            self._events_task = None
+            self._events.close()
+        for queue in self._queues:
+            queue.close()
+        self._processes = []
+        if self._table:
+            self._table.close()
+            self._table = None
@@ -1,3 +1,5 @@
+import hashlib
+from datetime import datetime
 from unittest import mock
 from unittest.mock import AsyncMock, MagicMock, Mock, patch
 import asyncpg
@@ -14,6 +16,19 @@ def pytest_configure():
     os.environ["DB_HOST"] = "localhost"
     os.environ["DB_PORT"] = "5432"
     os.environ["DB_NAME"] = "test_db"
+
+# -------Test data-------
+def atm_record(identifier, attention_hour="08:00:00 - 15:00:00", street="Av. Vicuña Mackenna Ote"):
+    """An ATM record tuple, natural key first, as the decoder builds them."""
+    return (
+        identifier, street, "6100", "Talca", "Las Condes", "Región de Los Ríos",
+        datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 15), "CONT", attention_hour, "DPST", "BRAN",
+    )
+
+def digest(value) -> bytes:
+    """A 32-byte message digest, as the dedup stores hold them."""
+    return hashlib.sha256(str(value).encode("utf-8")).digest()
+
 # -------Alloydb Mocks-------
 @pytest.fixture
 async def db_mocks(mocker):
@@ -45,8 +60,65 @@ async def bulk_db_mocks(mocker):
 # -------Redis Mocks-------
 @pytest.fixture
 def mock_redis_client():
-    with mock.patch("services.redis.redis_client") as mock_client:
+    with mock.patch("services.redis.redis_client", new_callable=AsyncMock) as mock_client:
         yield mock_client
+
+class FakeRedisPipeline:
+    def __init__(self, store):
+        self.store = store
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+    def set(self, key, value, nx=False, ex=None):
+        self.commands.append(("set", key, value, nx, ex))
+
+    def get(self, key):
+        self.commands.append(("get", key))
+
+    async def execute(self):
+        results = []
+        for command, key, *args in self.commands:
+            if command == "get":
+                results.append(self.store[key][0] if key in self.store else None)
+                continue
+            value, nx, ex = args
+            if nx and key in self.store:
+                results.append(None)
+            else:
+                self.store[key] = (value, ex)
+                results.append(True)
+        self.commands = []
+        return results
+
+class FakeRedis:
+    """In-process stand-in for the Redis commands used by the services."""
+    def __init__(self):
+        self.store = {}
+        self.pipelines = 0
+
+    async def ping(self):
+        return True
+
+    def pipeline(self, transaction=True):
+        self.pipelines += 1
+        return FakeRedisPipeline(self.store)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = (value, ex)
+
+    async def delete(self, key):
+        self.store.pop(key, None)
+
+@pytest.fixture
+def fake_redis():
+    fake = FakeRedis()
+    with mock.patch("services.redis.redis_client", fake):
+        yield fake
 with mock.patch(
     "google.oauth2.service_account.Credentials.from_service_account_file"
 ) as mock_creds:
@@ -72,8 +144,15 @@ def mock_service_account():
 
 @pytest.fixture
 def mock_bucket():
+    # Downloads are not cached unless a test opens the blob cache itself
     with mock.patch.object(
         storage_module, "bucket", new_callable=mock.Mock
-    ) as mock_bucket:
+    ) as mock_bucket, mock.patch.object(storage_module, "blob_cache_dir", ""), \
+            mock.patch.object(storage_module, "blob_cache", None), \
+            mock.patch.object(storage_module, "blob_cache_failed", False):
         yield mock_bucket
 
+@pytest.fixture
+def blob_cache(mock_bucket, tmp_path):
+    return storage_module.open_blob_cache(str(tmp_path / "blobs"), 1024)
+
@@ -0,0 +1,13 @@
+import pytest
+from unittest import mock
+from services.ack_manager import AckManager
+
+
+@pytest.mark.asyncio
+async def test_failed_ack_request_is_logged():
+    acknowledge = mock.Mock(side_effect=Exception("Deadline exceeded"))
+    manager = AckManager(acknowledge, mock.Mock())
+    await manager.ack("a")
+    with mock.patch("logging.error") as mock_log_error:
+        await manager.flush()
+    mock_log_error.assert_called_once_with("Failed to send 1 ack ids: Deadline exceeded")
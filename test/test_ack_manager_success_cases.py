@@ -0,0 +1,93 @@
+import pytest
+from unittest import mock
+from services.ack_manager import AckManager
+
+
+@pytest.mark.asyncio
+async def test_acks_and_nacks_are_batched():
+    acknowledge, modify_ack_deadline = mock.Mock(), mock.Mock()
+    manager = AckManager(acknowledge, modify_ack_deadline, ack_deadline=60)
+    for ack_id in ("a", "b", "c"):
+        manager.lease(ack_id)
+    await manager.ack("a")
+    await manager.ack("b")
+    await manager.nack("c")
+    await manager.flush()
+
+    acknowledge.assert_called_once_with(["a", "b"])
+    modify_ack_deadline.assert_called_once_with(["c"], 0)
+    assert manager.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_leases_are_extended_until_acked():
+    acknowledge, modify_ack_deadline = mock.Mock(), mock.Mock()
+    manager = AckManager(acknowledge, modify_ack_deadline, ack_deadline=60)
+    with mock.patch("time.monotonic", return_value=1000.0):
+        manager.lease("a")
+        manager.lease("b")
+    await manager.ack("b")
+    with mock.patch("time.monotonic", return_value=1031.0):
+        await manager.flush()
+
+    acknowledge.assert_called_once_with(["b"])
+    modify_ack_deadline.assert_called_once_with(["a"], 60)
+
+
+@pytest.mark.asyncio
+async def test_leases_stop_after_max_lease():
+    modify_ack_deadline = mock.Mock()
+    manager = AckManager(mock.Mock(), modify_ack_deadline, ack_deadline=60, max_lease=100)
+    with mock.patch("time.monotonic", return_value=1000.0):
+        manager.lease("a")
+    with mock.patch("time.monotonic", return_value=1100.0):
+        await manager.flush()
+
+    modify_ack_deadline.assert_not_called()
+    assert manager.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_pending_acks():
+    acknowledge = mock.Mock()
+    manager = AckManager(acknowledge, mock.Mock(), flush_interval=60)
+    manager.start()
+    await manager.ack("a")
+    await manager.stop()
+    acknowledge.assert_called_once_with(["a"])
+
+
+@pytest.mark.asyncio
+async def test_released_messages_are_no_longer_extended():
+    modify_ack_deadline = mock.Mock()
+    manager = AckManager(mock.Mock(), modify_ack_deadline, ack_deadline=60)
+    manager.lease("a")
+    manager.release("a")
+    await manager.flush()
+
+    modify_ack_deadline.assert_not_called()
+    assert manager.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_new_leases_are_extended_on_the_next_flush():
+    modify_ack_deadline = mock.Mock()
+    manager = AckManager(mock.Mock(), modify_ack_deadline, ack_deadline=60)
+    with mock.patch("time.monotonic", return_value=1000.0):
+        manager.lease("a")
+        await manager.flush()
+    modify_ack_deadline.assert_called_once_with(["a"], 60)
+
+    with mock.patch("time.monotonic", return_value=1020.0):
+        manager.lease("b")
+        await manager.flush()
+    modify_ack_deadline.assert_called_with(["b"], 60)
+
+    # Each lease is extended half a deadline after its own last extension
+    with mock.patch("time.monotonic", return_value=1030.0):
+        await manager.flush()
+    modify_ack_deadline.assert_called_with(["a"], 60)
+    with mock.patch("time.monotonic", return_value=1050.0):
+        await manager.flush()
+    modify_ack_deadline.assert_called_with(["b"], 60)
+    assert modify_ack_deadline.call_count == 4
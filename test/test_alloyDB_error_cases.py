@@ -1,8 +1,10 @@
+import json
 import pytest
 import asyncpg
 from unittest.mock import AsyncMock
 from fastapi import HTTPException
-from services.alloyDB import execute_query, execute_bulk_query
+from services import alloyDB
+from services.alloyDB import execute_query, execute_bulk_query, upsert_atm_batches, upsert_atm_records
 
 @pytest.mark.asyncio
 async def test_general_exception_handling_in_execute_query(mocker):
@@ -64,3 +66,49 @@ async def test_execute_bulk_query_general_exception(bulk_db_mocks):
     assert excinfo.value.status_code == 500
     assert "Bulk query execution failed" in str(excinfo.value.detail)
 
+@pytest.mark.asyncio
+async def test_upsert_atm_records_postgres_error(db_mocks):
+    mock_conn = await db_mocks
+    mock_conn.fetchrow = AsyncMock(side_effect=asyncpg.exceptions.PostgresError("Database error"))
+    record = ("ATM0001", "Street", "1", "Town", "District", "Region", None, None, "CONT", None, "DPST", "BRAN")
+
+    with pytest.raises(asyncpg.exceptions.PostgresError) as excinfo:
+        await upsert_atm_records([record])
+
+    assert "Database error" in str(excinfo.value)
+
+
+@pytest.mark.asyncio
+async def test_upsert_atm_batches_keeps_the_reader_error(db_mocks):
+    mock_conn = await db_mocks
+
+    async def malformed_file():
+        raise json.JSONDecodeError("Expecting value", "[{", 2)
+        yield
+
+    # A malformed file must stay a ValueError, which is not retried
+    with pytest.raises(json.JSONDecodeError):
+        await upsert_atm_batches(malformed_file())
+    # The staging table does not outlive the failed file
+    assert mock_conn.execute.call_args.args == (alloyDB.DROP_ATM_STREAM_STAGING_QUERY,)
+    mock_conn.transaction.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_prepare_connection_tolerates_missing_table(caplog):
+    import asyncpg
+    from services import alloyDB
+    mock_conn = AsyncMock()
+    mock_conn.fetchrow.side_effect = asyncpg.exceptions.UndefinedTableError("relation does not exist")
+    await alloyDB.prepare_connection(mock_conn)
+    assert "Could not prepare ingest statement" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_fetch_json_postgres_error(db_mocks):
+    from services import alloyDB
+    mock_conn = await db_mocks
+    mock_conn.fetchval = AsyncMock(side_effect=asyncpg.exceptions.PostgresError("boom"))
+    with pytest.raises(HTTPException) as exc_info:
+        await alloyDB.get_atms_by_town("Talca")
+    assert exc_info.value.status_code == 500
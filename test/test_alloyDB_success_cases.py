@@ -1,6 +1,12 @@
+import asyncio
+import os
+import asyncpg
 import pytest
 from unittest.mock import AsyncMock
-from services.alloyDB import execute_query, execute_bulk_query, init_db_pool
+from unittest import mock
+from services import alloyDB
+from services.alloyDB import execute_query, execute_bulk_query, init_db_pool, upsert_atm_records, upsert_atm_batches, bulk_load_atm_records
+from conftest import atm_record
 
 @pytest.mark.asyncio
 async def test_execute_query(db_mocks):
@@ -31,3 +37,245 @@ async def test_pool_initialization(mocker):
     assert alloyDB.pool is not None
     mock_create_pool.assert_called_once()
 
+@pytest.mark.asyncio
+async def test_pool_initialization_settings(mocker):
+    mock_create_pool = mocker.patch('asyncpg.create_pool', new_callable=AsyncMock)
+    mocker.patch.object(alloyDB, 'pool_min_size', 2)
+    mocker.patch.object(alloyDB, 'pool_max_size', 8)
+    mocker.patch.object(alloyDB, 'pool', None)
+    await init_db_pool()
+    kwargs = mock_create_pool.call_args.kwargs
+    assert kwargs["min_size"] == 2
+    assert kwargs["max_size"] == 8
+    assert kwargs["statement_cache_size"] == alloyDB.statement_cache_size
+    assert kwargs["init"] is alloyDB.prepare_connection
+
+@pytest.mark.asyncio
+async def test_prepare_connection_runs_ingest_statements():
+    mock_conn = AsyncMock()
+    await alloyDB.prepare_connection(mock_conn)
+    query, *args = mock_conn.fetchrow.call_args.args
+    assert query == alloyDB.UPSERT_ATM_QUERY
+    assert args == [[]] * 12
+
+@pytest.mark.asyncio
+async def test_acquire_records_pool_metrics(db_mocks, mocker):
+    mock_conn = await db_mocks
+    mocker.patch.dict(alloyDB.pool_metrics, {
+        "acquired": 0, "in_use": 0, "max_in_use": 0,
+        "acquire_wait_seconds_total": 0.0, "acquire_wait_seconds_max": 0.0,
+    })
+    alloyDB.pool.get_size.return_value = 4
+    alloyDB.pool.get_idle_size.return_value = 3
+    async with alloyDB.acquire() as conn:
+        assert conn is mock_conn
+        assert alloyDB.pool_metrics["in_use"] == 1
+    stats = alloyDB.pool_stats()
+    assert stats["acquired"] == 1
+    assert stats["in_use"] == 0
+    assert stats["max_in_use"] == 1
+    assert stats["size"] == 4
+    assert stats["idle"] == 3
+    assert stats["acquire_wait_seconds_mean"] >= 0
+
+@pytest.mark.asyncio
+async def test_upsert_atm_records_one_statement_per_chunk(db_mocks):
+    mock_conn = await db_mocks
+    mock_conn.fetchrow = AsyncMock(side_effect=[
+        {"inserted": 1, "updated": 1, "unchanged": 0},
+        {"inserted": 1, "updated": 0, "unchanged": 0},
+    ])
+    records = [atm_record("ATM0001"), atm_record("ATM0002"), atm_record("ATM0003")]
+
+    result = await upsert_atm_records(records, chunk_size=2)
+
+    assert result == {"inserted": 2, "updated": 1, "unchanged": 0}
+    assert mock_conn.fetchrow.await_count == 2
+    mock_conn.transaction.assert_called_once()
+    first_chunk_columns = mock_conn.fetchrow.call_args_list[0].args[1:]
+    assert len(first_chunk_columns) == 12
+    # Chunks follow the lock stripes of the keys, lowest first
+    by_stripe = sorted(records, key=lambda record: alloyDB.atm_lock_stripe(record[:6]))
+    assert first_chunk_columns[0] == [record[0] for record in by_stripe[:2]]
+
+@pytest.mark.asyncio
+async def test_upsert_atm_records_locks_stripes_in_ascending_order(db_mocks):
+    mock_conn = await db_mocks
+    mock_conn.fetchrow = AsyncMock(return_value={"inserted": 1, "updated": 0, "unchanged": 0})
+    records = [atm_record(f"ATM{index:04d}") for index in range(40)]
+    with mock.patch.object(alloyDB, "atm_lock_stripes", 8):
+        await upsert_atm_records(records, chunk_size=7)
+
+    locks = [c.args for c in mock_conn.execute.call_args_list if c.args[0] == alloyDB.LOCK_ATM_STRIPES_QUERY]
+    assert len(locks) == mock_conn.fetchrow.await_count == 6
+    stripes = [stripe for _, lock_class, chunk_stripes in locks for stripe in chunk_stripes]
+    assert all(lock_class == alloyDB.ATM_LOCK_CLASS for _, lock_class, _ in locks)
+    assert stripes == sorted(stripes)
+
+@pytest.mark.asyncio
+async def test_upsert_atm_records_last_duplicate_wins(db_mocks):
+    mock_conn = await db_mocks
+    mock_conn.fetchrow = AsyncMock(return_value={"inserted": 1, "updated": 0, "unchanged": 0})
+    records = [atm_record("ATM0001", "08:00:00 - 15:00:00"), atm_record("ATM0001", "09:00:00 - 18:00:00")]
+
+    await upsert_atm_records(records)
+
+    columns = mock_conn.fetchrow.call_args.args[1:]
+    assert columns[0] == ["ATM0001"]
+    assert columns[9] == ["09:00:00 - 18:00:00"]
+
+@pytest.mark.asyncio
+async def test_bulk_load_atm_records_copies_into_staging(db_mocks):
+    mock_conn = await db_mocks
+    mock_conn.fetchrow = AsyncMock(return_value={"inserted": 2, "updated": 1, "unchanged": 0})
+    records = [atm_record("ATM0001"), atm_record("ATM0002"), atm_record("ATM0003")]
+
+    result = await bulk_load_atm_records(records)
+
+    assert result["inserted"] == 2 and result["updated"] == 1
+    assert result["rows_per_second"] > 0
+    assert "CREATE TEMPORARY TABLE" in mock_conn.execute.call_args.args[0]
+    mock_conn.copy_records_to_table.assert_awaited_once_with(
+        alloyDB.ATM_STAGING_TABLE, records=records, columns=alloyDB.ATM_COLUMNS
+    )
+    mock_conn.fetchrow.assert_awaited_once_with(alloyDB.APPLY_ATM_STAGING_QUERY)
+
+@pytest.mark.asyncio
+async def test_upsert_atm_batches_stages_the_file_before_locking(db_mocks):
+    mock_conn = await db_mocks
+    mock_conn.fetchrow = AsyncMock(return_value={"inserted": 3, "updated": 0, "unchanged": 0})
+    first = [atm_record("ATM0001"), atm_record("ATM0002")]
+    second = [atm_record("ATM0003"), atm_record("ATM0001", "09:00:00 - 18:00:00")]
+
+    async def batches():
+        yield first
+        # Nothing is locked while the file is still being read
+        mock_conn.transaction.assert_not_called()
+        yield second
+
+    result = await upsert_atm_batches(batches())
+
+    assert result == {"inserted": 3, "updated": 0, "unchanged": 0}
+    copies = mock_conn.copy_records_to_table.call_args_list
+    assert [list(c.kwargs["records"]) for c in copies] == [
+        [first[0] + (0,), first[1] + (1,)],
+        [second[0] + (2,), second[1] + (3,)],
+    ]
+    mock_conn.transaction.assert_called_once()
+    # One lock call for the whole file, its stripes in ascending order
+    locks = [c.args for c in mock_conn.execute.call_args_list if c.args[0] == alloyDB.LOCK_ATM_STRIPES_QUERY]
+    stripes = sorted({alloyDB.atm_lock_stripe(record[:6]) for record in first + second})
+    assert locks == [(alloyDB.LOCK_ATM_STRIPES_QUERY, alloyDB.ATM_LOCK_CLASS, stripes)]
+    mock_conn.fetchrow.assert_awaited_once_with(alloyDB.APPLY_ATM_STREAM_STAGING_QUERY)
+    assert mock_conn.execute.call_args.args == (alloyDB.DROP_ATM_STREAM_STAGING_QUERY,)
+
+@pytest.mark.asyncio
+async def test_upsert_atm_records_switches_to_bulk_load_above_threshold(db_mocks):
+    mock_conn = await db_mocks
+    mock_conn.fetchrow = AsyncMock(return_value={"inserted": 2, "updated": 0, "unchanged": 0})
+    with mock.patch.object(alloyDB, "bulk_load_threshold", 2):
+        result = await upsert_atm_records([atm_record("ATM0001"), atm_record("ATM0002")])
+
+    assert result["inserted"] == 2
+    mock_conn.copy_records_to_table.assert_awaited_once()
+
+
+
+@pytest.mark.asyncio
+async def test_get_atms_by_identifier_returns_database_document(db_mocks):
+    mock_conn = await db_mocks
+    mock_conn.fetchval = AsyncMock(return_value='[{"AutomatedTellerMachines": {}}]')
+    body = await alloyDB.get_atms_by_identifier("ATM1")
+    assert body == b'[{"AutomatedTellerMachines": {}}]'
+    mock_conn.fetchval.assert_awaited_once_with(alloyDB.ATMS_BY_IDENTIFIER_QUERY, "ATM1")
+
+@pytest.mark.asyncio
+async def test_list_atms_pages_by_offset(db_mocks):
+    mock_conn = await db_mocks
+    mock_conn.fetchval = AsyncMock(return_value="[]")
+    await alloyDB.list_atms(3, 50)
+    mock_conn.fetchval.assert_awaited_once_with(alloyDB.ATMS_PAGE_QUERY, 50, 100)
+
+
+def test_upsert_statement_skips_unchanged_rows():
+    assert "IS DISTINCT FROM" in alloyDB.UPSERT_ATM_QUERY
+    assert "AS unchanged" in alloyDB.UPSERT_ATM_QUERY
+    assert "AS unchanged" in alloyDB.APPLY_ATM_STAGING_QUERY
+    assert "seq DESC" in alloyDB.APPLY_ATM_STREAM_STAGING_QUERY
+
+@pytest.mark.asyncio
+async def test_upsert_atm_records_reports_unchanged_rows(db_mocks):
+    mock_conn = await db_mocks
+    mock_conn.fetchrow = AsyncMock(return_value={"inserted": 0, "updated": 1, "unchanged": 1})
+    result = await upsert_atm_records([atm_record("ATM0001"), atm_record("ATM0002")])
+    assert result == {"inserted": 0, "updated": 1, "unchanged": 1}
+
+@pytest.mark.asyncio
+async def test_fingerprint_cache_skips_records_already_written(db_mocks, mocker):
+    from services.fingerprint import FingerprintCache
+    mock_conn = await db_mocks
+    mocker.patch.object(alloyDB, "fingerprint_cache", FingerprintCache(100))
+    mock_conn.fetchrow = AsyncMock(return_value={"inserted": 2, "updated": 0, "unchanged": 0})
+    await upsert_atm_records([atm_record("ATM0001"), atm_record("ATM0002")])
+
+    mock_conn.fetchrow = AsyncMock(return_value={"inserted": 0, "updated": 1, "unchanged": 0})
+    result = await upsert_atm_records([atm_record("ATM0001"), atm_record("ATM0002", "09:00:00 - 18:00:00")])
+
+    assert result == {"inserted": 0, "updated": 1, "unchanged": 1}
+    columns = mock_conn.fetchrow.call_args.args[1:]
+    assert columns[0] == ["ATM0002"]
+
+@pytest.mark.asyncio
+async def test_fingerprint_cache_skips_the_whole_bulk_load(mocker):
+    from services.decoder import AtmBatch
+    from services.fingerprint import FingerprintCache
+    cache = FingerprintCache(100)
+    batch = AtmBatch.from_rows([atm_record("ATM0001")])
+    cache.update(cache.split(batch)[1])
+    mocker.patch.object(alloyDB, "fingerprint_cache", cache)
+    mock_acquire = mocker.patch.object(alloyDB, "acquire")
+    result = await bulk_load_atm_records(batch)
+    assert result["unchanged"] == 1
+    mock_acquire.assert_not_called()
+
+# Runs against a real server, as the race only shows with its snapshots and
+# locks; the database is written to, so it must be a disposable one
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+ATM_TABLE = "presential_service_channels.automated_teller_machines"
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+@pytest.mark.asyncio
+async def test_concurrent_writers_insert_each_new_atm_once():
+    pool = await asyncpg.create_pool(TEST_DATABASE_URL, min_size=8, max_size=8)
+    try:
+        async with pool.acquire() as conn:
+            await conn.execute("CREATE SCHEMA IF NOT EXISTS presential_service_channels")
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {ATM_TABLE} (
+                    atmidentifier text, atmaddress_streetname text, atmaddress_buildingnumber text,
+                    atmtownname text, atmdistrictname text, atmcountrysubdivisionmajorname text,
+                    atmfromdatetime timestamp, atmtodatetime timestamp, atmtimetype text,
+                    atmattentionhour text, atmservicetype text, atmaccesstype text
+                )
+            """)
+            await conn.execute(f"TRUNCATE {ATM_TABLE}")
+        records = [atm_record(f"ATM{index:05d}") for index in range(2000)]
+        with mock.patch.object(alloyDB, "pool", pool):
+            # Eight files holding the same new ATMs, written at the same time
+            await asyncio.gather(*(upsert_atm_records(records, chunk_size=500) for _ in range(8)))
+
+            async def streamed(order):
+                for start in order:
+                    yield records[start:start + 250]
+
+            # Streamed files reading the same keys in opposite orders
+            orders = [range(0, 2000, 250), range(1750, -1, -250)]
+            await asyncio.gather(*(upsert_atm_batches(streamed(orders[i % 2])) for i in range(8)))
+        async with pool.acquire() as conn:
+            rows = await conn.fetchval(f"SELECT count(*) FROM {ATM_TABLE}")
+            keys = await conn.fetchval(f"SELECT count(DISTINCT ({alloyDB._ATM_ORDER})) FROM {ATM_TABLE}")
+        assert rows == keys == len(records)
+    finally:
+        async with pool.acquire() as conn:
+            await conn.execute(f"DROP TABLE IF EXISTS {ATM_TABLE}")
+        await pool.close()
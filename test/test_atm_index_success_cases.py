@@ -0,0 +1,25 @@
+from services.atm_index import AtmRecordIndex, natural_key
+from conftest import atm_record
+
+
+def test_index_lookup_by_natural_key():
+    record = atm_record("ATM0001")
+    index = AtmRecordIndex([record, atm_record("ATM0002")])
+    assert len(index) == 2
+    assert natural_key(record) in index
+    assert index.get(natural_key(record)) == record
+    assert index.get(natural_key(atm_record("ATM0003"))) is None
+
+
+def test_index_last_duplicate_wins_and_keeps_first_position():
+    first = atm_record("ATM0001", attention_hour="08:00:00 - 15:00:00")
+    other = atm_record("ATM0002")
+    last = atm_record("ATM0001", attention_hour="09:00:00 - 18:00:00")
+    index = AtmRecordIndex([first, other, last])
+    assert list(index) == [last, other]
+
+
+def test_index_distinguishes_every_key_column():
+    index = AtmRecordIndex([atm_record("ATM0001"), atm_record("ATM0001", street="Providencia")])
+    assert len(index) == 2
+
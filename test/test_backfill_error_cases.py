@@ -0,0 +1,60 @@
+import json
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from services import alloyDB
+from services.backfill import Checkpoint, Source, run_backfill
+
+
+@pytest.mark.asyncio
+async def test_failed_files_are_recorded_and_retried_on_resume(tmp_path):
+    directory = tmp_path / "files"
+    directory.mkdir()
+    (directory / "broken.json").write_text("[{")
+    source = Source(str(directory))
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path, str(directory))
+
+    with mock.patch.object(alloyDB, "upsert_atm_records") as mock_upsert, ThreadPoolExecutor(1) as executor:
+        stats = await run_backfill(source, source.list(), checkpoint, executor, parse_ahead=1, db_workers=2)
+
+    mock_upsert.assert_not_called()
+    assert stats.failed == 1
+    resumed = Checkpoint.load(path, str(directory))
+    assert "broken.json" in resumed.failed
+    assert resumed.done == {}
+
+
+@pytest.mark.asyncio
+async def test_write_errors_do_not_stop_the_run(tmp_path):
+    directory = tmp_path / "files"
+    directory.mkdir()
+    (directory / "a.json").write_text("[]")
+    (directory / "b.json").write_text("[]")
+    source = Source(str(directory))
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"), str(directory))
+    upsert = mock.AsyncMock(side_effect=[Exception("PostgreSQL error: boom"), {"inserted": 0, "updated": 0, "unchanged": 0}])
+
+    with mock.patch.object(alloyDB, "upsert_atm_records", upsert), ThreadPoolExecutor(1) as executor:
+        stats = await run_backfill(source, source.list(), checkpoint, executor, parse_ahead=1, db_workers=1)
+
+    assert (stats.files, stats.failed) == (1, 1)
+    assert checkpoint.failed == {"a.json": "PostgreSQL error: boom"}
+
+
+def test_checkpoint_of_another_source_is_rejected(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    path.write_text(json.dumps({"source": "gs://bucket/other", "done": {}}))
+    with pytest.raises(ValueError):
+        Checkpoint.load(str(path), "gs://bucket/atms")
+
+
+def test_missing_local_directory_is_not_read_as_a_bucket_prefix(tmp_path):
+    with pytest.raises(ValueError, match="not a directory"):
+        Source(str(tmp_path / "mistyped"))
+
+
+def test_source_in_another_bucket_is_rejected():
+    with mock.patch("services.storage.bucket_name", "atms"):
+        with pytest.raises(ValueError, match="configured bucket atms"):
+            Source("gs://other/atms/")
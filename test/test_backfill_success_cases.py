@@ -0,0 +1,109 @@
+import json
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from services import alloyDB
+from services.backfill import BackfillFile, Checkpoint, Source, decode_file, estimate_backfill, run_backfill
+
+
+def atm_file(*identifiers):
+    return json.dumps([{"payload": {
+        "atmidentifier": identifier,
+        "atmaddress_streetname": "Av. Vicuña Mackenna Ote",
+        "atmaddress_buildingnumber": "6100",
+        "atmtownname": "Talca",
+        "atmdistrictname": "Las Condes",
+        "atmcountrysubdivisionmajorname": "Región de Los Ríos",
+        "atmfromdatetime": "2024-01-01 08:00:00.000",
+        "atmtodatetime": "2024-01-01 15:00:00.000",
+        "atmtimetype": "CONT",
+        "atmattentionhour": "08:00:00 - 15:00:00",
+        "atmservicetype": "DPST",
+        "atmaccesstype": "BRAN",
+    }} for identifier in identifiers])
+
+
+@pytest.fixture
+def source_directory(tmp_path):
+    (tmp_path / "2024").mkdir()
+    (tmp_path / "2024" / "b.json").write_text(atm_file("ATM2", "ATM3"))
+    (tmp_path / "2024" / "a.json").write_text(atm_file("ATM1"))
+    (tmp_path / "notes.txt").write_text("not an ATM file")
+    return tmp_path
+
+
+def test_local_source_lists_matching_files_in_name_order(source_directory):
+    files = Source(str(source_directory), "*.json").list()
+    assert [file.name for file in files] == ["2024/a.json", "2024/b.json"]
+    assert files[0].size == len(atm_file("ATM1"))
+
+
+def test_bucket_source_lists_the_prefix():
+    with mock.patch("services.storage.list_file_sizes", return_value=[("atms/a.json", 10)]) as mock_list, \
+         mock.patch("services.storage.bucket_name", "bucket"):
+        files = Source("gs://bucket/atms/").list()
+    mock_list.assert_called_once_with("atms/")
+    assert files == [BackfillFile("atms/a.json", 10)]
+
+
+def test_decode_file_returns_columns():
+    decoded = decode_file(atm_file("ATM1", "ATM2").encode())
+    assert decoded.columns[0] == ["ATM1", "ATM2"]
+    assert decoded.errors == []
+
+
+@pytest.mark.asyncio
+async def test_run_backfill_writes_every_file_and_checkpoints(source_directory, tmp_path):
+    source = Source(str(source_directory), "*.json")
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"), str(source_directory))
+    written = []
+
+    async def upsert(batch):
+        written.append(batch.columns[0])
+        return {"inserted": len(batch), "updated": 0, "unchanged": 0}
+
+    with mock.patch.object(alloyDB, "upsert_atm_records", side_effect=upsert), \
+         ThreadPoolExecutor(2) as executor:
+        stats = await run_backfill(source, source.list(), checkpoint, executor, parse_ahead=2, db_workers=1)
+
+    assert written == [["ATM1"], ["ATM2", "ATM3"]]  # Listing order with one writer
+    assert (stats.files, stats.records, stats.inserted, stats.failed) == (2, 3, 3, 0)
+    resumed = Checkpoint.load(str(tmp_path / "checkpoint.json"), str(source_directory))
+    assert set(resumed.done) == {"2024/a.json", "2024/b.json"}
+    assert resumed.done["2024/b.json"]["inserted"] == 2
+    assert resumed.records_per_second > 0
+
+
+@pytest.mark.asyncio
+async def test_estimate_extrapolates_the_sample(source_directory):
+    source = Source(str(source_directory), "*.json")
+    files = source.list()
+    estimate = await estimate_backfill(source, files, sample=1, parse_workers=2, records_per_second=10)
+    assert estimate.files == 2
+    assert estimate.bytes == sum(file.size for file in files)
+    assert estimate.records == round(estimate.bytes / files[0].size)
+    assert estimate.write_seconds == estimate.records / 10
+    assert estimate.seconds == max(estimate.parse_seconds, estimate.write_seconds)
+
+
+@pytest.mark.asyncio
+async def test_estimate_without_write_rate_is_unknown(source_directory):
+    source = Source(str(source_directory), "*.json")
+    estimate = await estimate_backfill(source, source.list(), sample=1, parse_workers=1, records_per_second=None)
+    assert estimate.write_seconds is None
+    assert estimate.seconds is None
+
+
+@pytest.mark.asyncio
+async def test_estimate_downloads_bucket_samples_in_the_running_loop():
+    from services.storage import DownloadedFile
+    content = atm_file("ATM1", "ATM2").encode()
+    files = [BackfillFile("atms/a.json", len(content)), BackfillFile("atms/b.json", len(content))]
+    download = mock.AsyncMock(side_effect=[None, DownloadedFile(content, len(content), 1)])
+    with mock.patch("services.storage.bucket_name", "bucket"), \
+         mock.patch("services.storage.download_file_async", download):
+        source = Source("gs://bucket/atms/")
+        estimate = await estimate_backfill(source, files, sample=2, parse_workers=1, records_per_second=None)
+    # The deleted file is left out of the sample
+    assert estimate.records == 4
+    assert download.await_count == 2
@@ -0,0 +1,27 @@
+import os
+import pytest
+from unittest import mock
+from services.blob_cache import BlobCache, entry_name
+
+
+def test_entry_removed_from_disk_is_a_miss(tmp_path):
+    cache = BlobCache(str(tmp_path), 1024)
+    cache.put("a", 1, b"aaaa")
+    os.unlink(tmp_path / entry_name("a", 1))
+    assert cache.get("a", 1) is None
+    assert (len(cache), cache.size) == (0, 0)
+
+
+def test_failed_write_leaves_nothing_behind(tmp_path):
+    cache = BlobCache(str(tmp_path), 1024)
+    with mock.patch("os.replace", side_effect=OSError("No space left on device")):
+        with pytest.raises(OSError):
+            cache.put("a", 1, b"aaaa")
+    assert os.listdir(tmp_path) == []
+    assert cache.get("a", 1) is None
+
+
+def test_directory_that_cannot_be_created(tmp_path):
+    (tmp_path / "file").write_bytes(b"")
+    with pytest.raises(OSError):
+        BlobCache(str(tmp_path / "file" / "blobs"), 1024)
@@ -0,0 +1,61 @@
+import mmap
+import os
+from services.blob_cache import BlobCache, entry_name
+
+
+def test_cached_content_is_read_as_memory_map(tmp_path):
+    cache = BlobCache(str(tmp_path), 1024)
+    cache.put("atms/a.json", 1, b"[1, 2]")
+    content = cache.get("atms/a.json", 1)
+    assert isinstance(content, mmap.mmap)
+    assert content[:] == b"[1, 2]"
+    assert cache.get("atms/a.json", 2) is None
+    assert (len(cache), cache.size) == (1, 6)
+
+
+def test_least_recently_used_entries_are_evicted_beyond_the_bound(tmp_path):
+    cache = BlobCache(str(tmp_path), 10)
+    cache.put("a", 1, b"aaaa")
+    cache.put("b", 1, b"bbbb")
+    cache.get("a", 1)
+    cache.put("c", 1, b"cccc")
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1)[:] == b"aaaa"
+    assert cache.size == 8
+    assert sorted(os.listdir(tmp_path)) == sorted([entry_name("a", 1), entry_name("c", 1)])
+
+
+def test_map_stays_valid_after_eviction(tmp_path):
+    cache = BlobCache(str(tmp_path), 4)
+    cache.put("a", 1, b"aaaa")
+    content = cache.get("a", 1)
+    cache.put("b", 1, b"bbbb")
+    assert cache.get("a", 1) is None
+    assert content[:] == b"aaaa"
+
+
+def test_entries_and_recency_survive_a_restart(tmp_path):
+    cache = BlobCache(str(tmp_path), 8)
+    cache.put("a", 1, b"aaaa")
+    cache.put("b", 1, b"bbbb")
+    os.utime(tmp_path / entry_name("a", 1), (0, 0))
+    (tmp_path / "leftover.tmp").write_bytes(b"partial")
+
+    restarted = BlobCache(str(tmp_path), 8)
+    restarted.put("c", 1, b"cccc")
+    assert restarted.get("a", 1) is None
+    assert restarted.get("b", 1)[:] == b"bbbb"
+    assert not (tmp_path / "leftover.tmp").exists()
+
+
+def test_objects_larger_than_the_bound_are_not_stored(tmp_path):
+    cache = BlobCache(str(tmp_path), 4)
+    cache.put("a", 1, b"too large")
+    assert len(cache) == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_empty_object(tmp_path):
+    cache = BlobCache(str(tmp_path), 4)
+    cache.put("a", 1, b"")
+    assert cache.get("a", 1) == b""
@@ -0,0 +1,43 @@
+import threading
+import time
+from unittest import mock
+from services import clients
+from services.clients import SharedResource
+
+
+def test_shared_resource_is_created_once_across_threads():
+    factory = mock.Mock(side_effect=lambda: time.sleep(0.05) or object())
+    resource = SharedResource(factory)
+    values = []
+    threads = [threading.Thread(target=lambda: values.append(resource.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    factory.assert_called_once()
+    assert len(set(map(id, values))) == 1
+    assert resource.created
+
+
+def test_reset_creates_the_resource_again():
+    resource = SharedResource(mock.Mock(side_effect=[1, 2]))
+    assert resource.get() == 1
+    resource.reset()
+    assert not resource.created
+    assert resource.get() == 2
+
+
+def test_clients_share_one_credentials_load():
+    with mock.patch("google.oauth2.service_account.Credentials.from_service_account_file") as load, \
+            mock.patch("google.cloud.storage.Client") as storage_client, \
+            mock.patch("google.cloud.pubsub_v1.SubscriberClient") as subscriber_client, \
+            mock.patch.object(clients, "credentials", SharedResource(clients._load_credentials)), \
+            mock.patch.object(clients, "storage_client", SharedResource(clients._create_storage_client)), \
+            mock.patch.object(clients, "subscriber_client", SharedResource(clients._create_subscriber_client)):
+        clients.storage_client.get()
+        clients.subscriber_client.get()
+
+    load.assert_called_once_with(clients.credentials_path)
+    storage_client.assert_called_once_with(credentials=load.return_value, project=load.return_value.project_id)
+    subscriber_client.assert_called_once_with(credentials=load.return_value)
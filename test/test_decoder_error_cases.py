@@ -0,0 +1,45 @@
+import json
+import pytest
+from services.decoder import decode_atm_record, parse_timestamp, validate_atm_file
+
+
+@pytest.mark.parametrize("value", ["2024-01-01T08:00:00.000", "2024-13-01 08:00:00.000", "2024-01-01 08:00:00", "", "2024-01-01 08:00:00.1234567"])
+def test_parse_timestamp_invalid_values(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+
+
+def test_decode_atm_record_missing_timestamp():
+    with pytest.raises(ValueError):
+        decode_atm_record({"payload": {"atmidentifier": "ATM0001"}})
+
+
+def test_validate_atm_file_keeps_valid_records():
+    valid = {"payload": {"atmidentifier": "ATM0001", "atmfromdatetime": "2024-01-01 08:00:00.000", "atmtodatetime": "2024-01-01 15:00:00.000"}}
+    invalid = {"payload": {"atmidentifier": "ATM0002", "atmfromdatetime": "08:00", "atmtodatetime": "2024-01-01 15:00:00.000"}}
+    validated = validate_atm_file(json.dumps([valid, invalid, valid]).encode("utf-8"))
+    assert len(validated.batch) == 2
+    assert [index for index, _ in validated.errors] == [1]
+    assert validated.errors[0][1].startswith("payload.atmfromdatetime")
+
+
+def test_validate_atm_file_not_json():
+    with pytest.raises(json.JSONDecodeError):
+        validate_atm_file(b"not json")
+
+
+def test_load_json_rejects_invalid_buffers():
+    from services.decoder import load_json
+    with pytest.raises(json.JSONDecodeError):
+        load_json(memoryview(b"[1, "))
+
+
+@pytest.mark.parametrize("value", ["2024-01-01T08:00:00Z", "2024-01-01T08:00:00.000+02:00", 1704096000, 1704096000.5, "2024-01-01"])
+def test_validate_atm_file_rejects_other_timestamp_formats(value):
+    valid = {"payload": {"atmidentifier": "ATM0001", "atmfromdatetime": "2024-01-01 08:00:00.000", "atmtodatetime": "2024-01-01 15:00:00.000"}}
+    invalid = {"payload": {"atmidentifier": "ATM0002", "atmfromdatetime": value, "atmtodatetime": "2024-01-01 15:00:00.000"}}
+    validated = validate_atm_file(json.dumps([valid, invalid]).encode("utf-8"))
+    assert len(validated.batch) == 1
+    assert [index for index, _ in validated.errors] == [1]
+    assert validated.errors[0][1].startswith("payload.atmfromdatetime")
+    assert all(timestamp.tzinfo is None for timestamp in validated.batch.columns[6])
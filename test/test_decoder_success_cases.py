@@ -0,0 +1,105 @@
+import json
+from datetime import datetime
+from services.decoder import (
+    AtmBatch,
+    decode_atm_record,
+    decode_atm_records,
+    iter_atm_batches,
+    parse_timestamp,
+    validate_atm_file,
+    validate_atm_records,
+)
+
+
+def file_record(identifier, attention_hour="08:00:00 - 15:00:00"):
+    return {"payload": {
+        "atmidentifier": identifier,
+        "atmaddress_streetname": "Av. Vicuña Mackenna Ote",
+        "atmaddress_buildingnumber": "6100",
+        "atmtownname": "Talca",
+        "atmdistrictname": "Las Condes",
+        "atmcountrysubdivisionmajorname": "Región de Los Ríos",
+        "atmfromdatetime": "2024-01-01 08:00:00.000",
+        "atmtodatetime": "2024-01-01 15:00:00.500000",
+        "atmtimetype": "CONT",
+        "atmattentionhour": attention_hour,
+        "atmservicetype": "DPST",
+        "atmaccesstype": "BRAN",
+    }}
+
+
+def test_parse_timestamp_matches_strptime():
+    for value in ("2024-01-01 08:00:00.000", "2024-12-31 23:59:59.123456", "2024-02-29 00:00:00.5"):
+        assert parse_timestamp(value) == datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f")
+
+
+def test_decode_atm_record():
+    assert decode_atm_record(file_record("ATM0001")) == (
+        "ATM0001", "Av. Vicuña Mackenna Ote", "6100", "Talca", "Las Condes", "Región de Los Ríos",
+        datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 15, 0, 0, 500000),
+        "CONT", "08:00:00 - 15:00:00", "DPST", "BRAN",
+    )
+
+
+def test_decode_atm_record_missing_optional_fields():
+    record = file_record("ATM0001")
+    del record["payload"]["atmaccesstype"]
+    assert decode_atm_record(record)[11] is None
+
+
+def test_decode_atm_records_is_columnar():
+    batch = decode_atm_records([file_record("ATM0001"), file_record("ATM0002")])
+    assert len(batch) == 2
+    assert batch.columns[0] == ["ATM0001", "ATM0002"]
+    assert list(batch) == [decode_atm_record(file_record("ATM0001")), decode_atm_record(file_record("ATM0002"))]
+
+
+def test_deduplicated_keeps_last_record_per_key():
+    batch = decode_atm_records([
+        file_record("ATM0001", "08:00:00 - 15:00:00"),
+        file_record("ATM0002"),
+        file_record("ATM0001", "09:00:00 - 18:00:00"),
+    ])
+    unique = batch.deduplicated()
+    assert unique.columns[0] == ["ATM0001", "ATM0002"]
+    assert unique.columns[9] == ["09:00:00 - 18:00:00", "08:00:00 - 15:00:00"]
+
+
+def test_iter_atm_batches():
+    batches = list(iter_atm_batches((file_record(f"ATM{i:04d}") for i in range(5)), 2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert len(AtmBatch.from_rows([])) == 0
+
+
+def test_validate_atm_file_matches_decoder():
+    records = [file_record("ATM0001"), file_record("ATM0002")]
+    validated = validate_atm_file(json.dumps(records).encode("utf-8"))
+    assert validated.errors == []
+    assert list(validated.batch) == list(decode_atm_records(records))
+
+
+def test_validate_atm_file_single_record_and_missing_fields():
+    record = file_record("ATM0001")
+    del record["payload"]["atmaccesstype"]
+    record["payload"]["atmaddress_buildingnumber"] = 6100
+    validated = validate_atm_file(json.dumps(record).encode("utf-8"))
+    row = next(iter(validated.batch))
+    assert row[2] == "6100"
+    assert row[11] is None
+
+
+def test_validate_atm_records_streamed_batch():
+    validated = validate_atm_records([file_record("ATM0001")])
+    assert len(validated.batch) == 1 and validated.errors == []
+
+
+def test_memory_mapped_file_is_parsed_in_place(tmp_path):
+    import mmap
+    from services.decoder import load_json
+    path = tmp_path / "file.json"
+    path.write_bytes(json.dumps([file_record("ATM0001"), file_record("ATM0002")]).encode("utf-8"))
+    with open(path, "rb") as file:
+        content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    mapped, read = validate_atm_file(content), validate_atm_file(path.read_bytes())
+    assert (mapped.batch.columns, mapped.errors) == (read.batch.columns, read.errors)
+    assert load_json(content) == json.loads(path.read_bytes())
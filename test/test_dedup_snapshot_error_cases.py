@@ -0,0 +1,31 @@
+import pytest
+from services.dedup_snapshot import FANOUT, HEADER, MAGIC, DedupPersistence, Snapshot
+from services.in_memory_cache import DedupCache
+
+
+def test_snapshot_rejects_other_files(tmp_path):
+    path = tmp_path / "dedup.snapshot"
+    path.write_bytes(b"not a snapshot")
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
+
+
+def test_snapshot_rejects_truncated_snapshot(tmp_path):
+    path = tmp_path / "dedup.snapshot"
+    path.write_bytes(HEADER.pack(MAGIC, 10) + bytes(FANOUT.size) + bytes(40))
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
+
+
+def test_missing_snapshot(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Snapshot(str(tmp_path / "missing"))
+
+
+def test_unreadable_snapshot_is_ignored(tmp_path):
+    path = tmp_path / "dedup.snapshot"
+    path.write_bytes(b"")
+    cache = DedupCache(max_entries=10, ttl=60)
+    assert DedupPersistence(cache, str(path)).load() == 0
+    assert cache.fallback is None
+    assert cache.journal == []
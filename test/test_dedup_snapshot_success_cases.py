@@ -0,0 +1,146 @@
+import pytest
+from unittest import mock
+from services.dedup_snapshot import (
+    ENTRY,
+    DedupPersistence,
+    Snapshot,
+    log_path,
+    replay_log,
+    write_snapshot,
+)
+from services.in_memory_cache import DedupCache
+from conftest import digest
+
+
+def test_snapshot_lookup(tmp_path):
+    path = str(tmp_path / "dedup.snapshot")
+    write_snapshot(path, [(digest(value), 1000.0 + value) for value in range(50)], None, 0.0, 100)
+    snapshot = Snapshot(path)
+    assert len(snapshot) == 50
+    assert all(snapshot.lookup(digest(value)) == 1000.0 + value for value in range(50))
+    assert snapshot.lookup(digest(50)) is None
+    snapshot.forget(digest(1))
+    assert snapshot.lookup(digest(1)) is None
+    assert len(list(snapshot.entries())) == 49
+    snapshot.close()
+
+
+def test_write_snapshot_merges_drops_expired_and_keeps_most_recent(tmp_path):
+    path = str(tmp_path / "dedup.snapshot")
+    write_snapshot(path, [(digest(value), 1000.0 + value) for value in range(5)], None, 0.0, 100)
+    previous = Snapshot(path)
+    write_snapshot(path, [(digest(4), 2000.0), (digest(5), 2001.0), (digest(6), 2002.0)], previous, 1001.5, 4)
+    previous.close()
+
+    snapshot = Snapshot(path)
+    assert sorted(snapshot.entries(), key=lambda entry: entry[1]) == [
+        (digest(3), 1003.0), (digest(4), 2000.0), (digest(5), 2001.0), (digest(6), 2002.0)
+    ]
+    snapshot.close()
+
+
+def test_expired_snapshot_entries_are_ignored_on_lookup(tmp_path):
+    path = str(tmp_path / "dedup.snapshot")
+    write_snapshot(path, [(digest(1), 1000.0), (digest(2), 1050.0)], None, 0.0, 100)
+    cache = DedupCache(max_entries=10, ttl=60)
+    cache.fallback = Snapshot(path)
+    with mock.patch("time.time", return_value=1070.0):
+        assert cache.check_and_add(digest(1)) is False
+        assert cache.check_and_add(digest(2)) is True
+    cache.fallback.close()
+
+
+def test_missing_log_replays_nothing(tmp_path):
+    cache = DedupCache(max_entries=10, ttl=60)
+    assert replay_log(str(tmp_path / "missing.log"), cache) == 0
+    assert len(cache) == 0
+
+
+def test_log_replay_applies_changes_in_order(tmp_path):
+    path = str(tmp_path / "dedup.snapshot.log")
+    with open(path, "wb") as file:
+        for entry in ((digest(1), 1000.0), (digest(2), 1001.0), (digest(1), 0.0), (digest(3), 900.0)):
+            file.write(ENTRY.pack(*entry))
+        # Partial entry of an interrupted append
+        file.write(ENTRY.pack(digest(4), 1002.0)[:10])
+    cache = DedupCache(max_entries=10, ttl=60)
+    assert replay_log(path, cache, now=1010.0) == 4
+    assert [key for key, _ in cache.items()] == [digest(2)]
+
+
+@pytest.mark.asyncio
+async def test_restarted_process_recognizes_processed_messages(tmp_path):
+    path = str(tmp_path / "dedup.snapshot")
+    cache = DedupCache(max_entries=100, ttl=3600)
+    persistence = DedupPersistence(cache, path, compact_entries=3)
+    persistence.load()
+    cache.check_and_add(digest(1))
+    cache.check_and_add(digest(2))
+    cache.discard(digest(2))
+    persistence.flush()
+    assert persistence.log_entries == 3
+    await persistence.compact()
+    cache.check_and_add(digest(3))
+    persistence.flush()
+
+    restarted = DedupCache(max_entries=100, ttl=3600)
+    assert DedupPersistence(restarted, path).load() == 1
+    assert len(restarted) == 1
+    assert restarted.check_and_add(digest(1)) is True
+    assert restarted.check_and_add(digest(3)) is True
+    assert restarted.check_and_add(digest(2)) is False
+
+
+@pytest.mark.asyncio
+async def test_compaction_keeps_only_the_discards_still_in_the_snapshot(tmp_path):
+    path = str(tmp_path / "dedup.snapshot")
+    cache = DedupCache(max_entries=100, ttl=3600)
+    persistence = DedupPersistence(cache, path)
+    persistence.load()
+    for value in range(3):
+        cache.check_and_add(digest(value))
+    await persistence.compact()
+    cache.discard(digest(0))
+    assert persistence.snapshot.forgotten == {digest(0)}
+
+    def write_while_discarding(path, entries, previous, *args):
+        write_snapshot(path, entries, previous, *args)
+        # Discarded once its entry was written
+        cache.discard(digest(1))
+
+    with mock.patch("services.dedup_snapshot.write_snapshot", write_while_discarding):
+        await persistence.compact()
+    assert persistence.snapshot.forgotten == {digest(1)}
+    assert persistence.snapshot.lookup(digest(1)) is None
+    assert persistence.snapshot.lookup(digest(2)) is not None
+
+
+@pytest.mark.asyncio
+async def test_discards_survive_a_restart(tmp_path):
+    path = str(tmp_path / "dedup.snapshot")
+    cache = DedupCache(max_entries=100, ttl=3600)
+    persistence = DedupPersistence(cache, path)
+    persistence.load()
+    cache.check_and_add(digest(1))
+    await persistence.compact()
+
+    restarted = DedupCache(max_entries=100, ttl=3600)
+    DedupPersistence(restarted, path).load()
+    restarted.journal = None
+    restarted.discard(digest(1))
+    assert restarted.check_and_add(digest(1)) is False
+
+
+@pytest.mark.asyncio
+async def test_stop_writes_a_final_snapshot(tmp_path):
+    path = str(tmp_path / "dedup.snapshot")
+    cache = DedupCache(max_entries=100, ttl=3600)
+    persistence = DedupPersistence(cache, path, interval=3600)
+    persistence.load()
+    persistence.start()
+    cache.check_and_add(digest(1))
+    await persistence.stop()
+
+    assert (tmp_path / "dedup.snapshot.log").read_bytes() == b""
+    assert Snapshot(path).lookup(digest(1)) is not None
+    assert log_path(path) == path + ".log"
@@ -0,0 +1,59 @@
+import pytest
+from unittest import mock
+import services.in_memory_cache as in_memory_cache
+import controllers.extractTyc as extractTyc
+import services.dedup as dedup_module
+from services.dedup import MemoryDedupBackend, Seen, create_dedup_backend
+from services.in_memory_cache import DedupCache
+from services.redis import RedisDedupBackend
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_uses_the_in_process_cache():
+    with mock.patch.object(in_memory_cache, "cache", DedupCache(10, 60)):
+        backend = MemoryDedupBackend()
+        assert await backend.check_and_add_many([b"a", b"b", b"a"]) == [Seen.NEW, Seen.NEW, Seen.IN_FLIGHT]
+        await backend.commit(b"b")
+        assert await backend.check_and_add(b"b") == Seen.DONE
+        await backend.discard(b"a")
+        assert await backend.check_and_add(b"a") == Seen.NEW
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_persists_committed_digests_only(tmp_path):
+    from services.dedup_snapshot import DedupPersistence
+    path = str(tmp_path / "dedup.snapshot")
+    cache = DedupCache(100, 3600)
+    persistence = DedupPersistence(cache, path, interval=3600)
+    persistence.load()
+    persistence.start()
+    with mock.patch.object(in_memory_cache, "cache", cache):
+        backend = MemoryDedupBackend()
+        await backend.check_and_add_many([b"c" * 32, b"f" * 32])
+        await backend.commit(b"c" * 32)
+    await persistence.stop()
+
+    # After a restart, the message that was in flight is processed again
+    restarted = DedupCache(100, 3600)
+    DedupPersistence(restarted, path).load()
+    with mock.patch.object(in_memory_cache, "cache", restarted):
+        backend = MemoryDedupBackend()
+        assert await backend.check_and_add_many([b"c" * 32, b"f" * 32]) == [Seen.DONE, Seen.NEW]
+
+
+def test_create_dedup_backend():
+    assert isinstance(create_dedup_backend("memory"), MemoryDedupBackend)
+    assert isinstance(create_dedup_backend("redis"), RedisDedupBackend)
+
+
+@pytest.mark.asyncio
+async def test_claim_outlasts_the_longest_message_lease():
+    clock = mock.Mock(time=mock.Mock(return_value=1000.0))
+    with mock.patch.object(in_memory_cache, "cache", DedupCache(10, 7200)), \
+            mock.patch.object(dedup_module, "time", clock):
+        backend = MemoryDedupBackend()
+        assert await backend.check_and_add(b"a") == Seen.NEW
+        # Still being processed, its message leased by the subscriber
+        clock.time.return_value += extractTyc.max_lease_seconds - 1
+        assert await backend.check_and_add(b"a") == Seen.IN_FLIGHT
+    assert dedup_module.dedup_lease_seconds >= extractTyc.max_lease_seconds
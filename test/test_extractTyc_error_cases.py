@@ -8,7 +8,19 @@ app = FastAPI()
 app.include_router(router)
 # Testing a request that should return 422
 client = TestClient(app)
-@pytest.mark.asyncio
-async def test_invalid_request_422(mock_redis_client, bulk_db_mocks):
-    response = client.post("/api/v1/extractTyc", json={"invalidField": "invalidValue"})
-    assert response.status_code == 422
\ No newline at end of file
+def test_invalid_request_422():
+    response = client.get("/api/v1/atms", params={"page": "invalidValue"})
+    assert response.status_code == 422
+
+def test_get_unknown_atm_returns_404(mocker):
+    from unittest.mock import AsyncMock
+    import controllers.extractTyc as extractTyc
+    extractTyc.read_cache.clear()
+    mocker.patch.object(extractTyc, "get_atms_by_identifier", AsyncMock(return_value=b"[]"))
+    response = client.get("/api/v1/atms/UNKNOWN")
+    assert response.status_code == 404
+
+
+def test_invalid_page_size_returns_422():
+    response = client.get("/api/v1/atms", params={"size": 0})
+    assert response.status_code == 422
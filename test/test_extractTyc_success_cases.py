@@ -0,0 +1,415 @@
+import asyncio
+import threading
+import asyncpg
+import pytest
+from unittest import mock
+import controllers.extractTyc as extractTyc
+from services.storage import DownloadedFile
+
+
+@pytest.mark.asyncio
+async def test_stream_messages_acks_processed_messages():
+    message = mock.Mock(data=b'{"name": "file.json"}', attributes={"eventType": "OBJECT_FINALIZE"})
+    mock_subscriber = mock.Mock()
+
+    def subscribe(subscription, callback, flow_control):
+        threading.Thread(target=callback, args=(message,)).start()
+        return mock.Mock()
+
+    mock_subscriber.subscribe.side_effect = subscribe
+
+    async def process_messages(messages):
+        for incoming in messages:
+            await incoming.ack()
+
+    with mock.patch.object(extractTyc, "subscriber", mock_subscriber), \
+         mock.patch.object(extractTyc, "process_messages", mock.AsyncMock(side_effect=process_messages)) as mock_process:
+        task = asyncio.create_task(extractTyc.stream_messages())
+        for _ in range(100):
+            if message.ack.called:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    mock_process.assert_awaited_once()
+    incoming = mock_process.call_args.args[0][0]
+    assert (incoming.data, incoming.attributes) == (message.data, message.attributes)
+    message.ack.assert_called_once()
+    flow_control = mock_subscriber.subscribe.call_args.kwargs["flow_control"]
+    assert flow_control.max_messages == extractTyc.flow_control_max_messages
+
+
+@pytest.mark.asyncio
+async def test_process_message_submits_finalize_events_to_pipeline():
+    mock_pipeline = mock.Mock(submit=mock.AsyncMock())
+    ack = mock.AsyncMock()
+    with mock.patch.object(extractTyc, "pipeline", mock_pipeline):
+        await extractTyc.process_messages([extractTyc.IncomingMessage(
+            b'{"name": "atms/new.json", "generation": "1"}', {"eventType": "OBJECT_FINALIZE"}, ack, mock.AsyncMock()
+        )])
+
+    job = mock_pipeline.submit.call_args.args[0]
+    assert (job.file_name, job.generation) == ("atms/new.json", 1)
+    ack.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_files_owned_by_another_worker_are_handed_over():
+    mock_pipeline = mock.Mock(submit=mock.AsyncMock())
+    queues = [mock.Mock(), mock.Mock()]
+    manager = extractTyc.AckManager(mock.Mock(), mock.Mock())
+    manager.lease("ack-1")
+    owner = extractTyc.shard_of("atms/new.json", 2)
+    with mock.patch.object(extractTyc, "pipeline", mock_pipeline), \
+            mock.patch.object(extractTyc, "ack_manager", manager), \
+            mock.patch.object(extractTyc, "shard", extractTyc.Shard(1 - owner, 2, queues)):
+        await extractTyc.submit_file(
+            extractTyc.IncomingMessage(b"{}", {}, mock.AsyncMock(), mock.AsyncMock(), "ack-1"),
+            "atms/new.json", b"hash",
+        )
+
+    mock_pipeline.submit.assert_not_awaited()
+    queues[owner].put.assert_called_once_with(("ack-1", "atms/new.json", b"hash", None, None))
+    assert manager.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_handed_over_files_are_leased_and_submitted():
+    mock_pipeline = mock.Mock(submit=mock.AsyncMock())
+    inbound = mock.Mock(get=mock.Mock(side_effect=[("ack-1", "atms/new.json", b"hash", 7, 42), None]))
+    manager = extractTyc.AckManager(mock.Mock(), mock.Mock())
+    with mock.patch.object(extractTyc, "pipeline", mock_pipeline), \
+            mock.patch.object(extractTyc, "ack_manager", manager), \
+            mock.patch.object(extractTyc, "shard", extractTyc.Shard(0, 2, [inbound, mock.Mock()])):
+        await extractTyc.receive_handed_over_files()
+        job = mock_pipeline.submit.call_args.args[0]
+        await job.ack()
+
+    assert (job.file_name, job.message_hash, job.generation, job.size) == ("atms/new.json", b"hash", 7, 42)
+    assert manager._acks == ["ack-1"]
+
+
+@pytest.mark.asyncio
+async def test_process_message_acks_ignored_events():
+    mock_pipeline = mock.Mock(submit=mock.AsyncMock())
+    ack = mock.AsyncMock()
+    with mock.patch.object(extractTyc, "pipeline", mock_pipeline):
+        await extractTyc.process_messages([extractTyc.IncomingMessage(
+            b'{"name": "atms/deleted.json", "generation": "2"}', {"eventType": "OBJECT_DELETE"}, ack, mock.AsyncMock()
+        )])
+
+    mock_pipeline.submit.assert_not_awaited()
+    ack.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_nacks_only_unsettled_messages():
+    from services.dedup import Seen
+    submitted = extractTyc.IncomingMessage(b'{"name": "atms/a.json"}', {"eventType": "OBJECT_FINALIZE"}, mock.AsyncMock(), mock.AsyncMock())
+    malformed = extractTyc.IncomingMessage(b"not json", {}, mock.AsyncMock(), mock.AsyncMock())
+    failing = extractTyc.IncomingMessage(b'{"name": "atms/b.json"}', {"eventType": "OBJECT_FINALIZE"}, mock.AsyncMock(), mock.AsyncMock())
+    mock_pipeline = mock.Mock(submit=mock.AsyncMock(side_effect=[None, RuntimeError("pipeline stopped")]))
+    mock_backend = mock.Mock(
+        check_and_add_many=mock.AsyncMock(return_value=[Seen.NEW, Seen.NEW]),
+        discard=mock.AsyncMock(side_effect=ConnectionError("Redis unavailable")),
+    )
+    with mock.patch.object(extractTyc, "pipeline", mock_pipeline), \
+         mock.patch.object(extractTyc, "dedup_backend", mock_backend):
+        await extractTyc.process_messages([submitted, malformed, failing])
+
+    submitted.nack.assert_not_awaited()
+    malformed.ack.assert_awaited_once()
+    malformed.nack.assert_not_awaited()
+    failing.nack.assert_awaited_once()
+    assert mock_pipeline.submit.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_dedup_check_nacks_the_batch_without_discarding():
+    messages = [
+        extractTyc.IncomingMessage(b'{"name": "atms/a.json"}', {"eventType": "OBJECT_FINALIZE"}, mock.AsyncMock(), mock.AsyncMock())
+        for _ in range(2)
+    ]
+    mock_backend = mock.Mock(
+        check_and_add_many=mock.AsyncMock(side_effect=ConnectionError("Redis unavailable")),
+        discard=mock.AsyncMock(),
+    )
+    with mock.patch.object(extractTyc, "dedup_backend", mock_backend):
+        await extractTyc.process_messages(messages)
+
+    assert all(message.nack.await_count == 1 for message in messages)
+    mock_backend.discard.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_process_messages_checks_the_whole_batch_at_once():
+    mock_pipeline = mock.Mock(submit=mock.AsyncMock())
+    mock_backend = mock.Mock(check_and_add_many=mock.AsyncMock(return_value=[False, True]))
+    first_ack, second_ack = mock.AsyncMock(), mock.AsyncMock()
+    messages = [
+        extractTyc.IncomingMessage(b'{"name": "atms/a.json"}', {"eventType": "OBJECT_FINALIZE"}, first_ack, mock.AsyncMock()),
+        extractTyc.IncomingMessage(b'{"name": "atms/b.json"}', {"eventType": "OBJECT_FINALIZE"}, second_ack, mock.AsyncMock()),
+    ]
+    with mock.patch.object(extractTyc, "pipeline", mock_pipeline), \
+         mock.patch.object(extractTyc, "dedup_backend", mock_backend):
+        await extractTyc.process_messages(messages)
+
+    assert len(mock_backend.check_and_add_many.call_args.args[0]) == 2
+    assert mock_pipeline.submit.call_args.args[0].file_name == "atms/a.json"
+    first_ack.assert_not_awaited()
+    second_ack.assert_awaited_once()
+
+
+
+def test_notification_identity_changes_with_generation():
+    attributes = {"eventType": "OBJECT_FINALIZE", "bucketId": "atms", "objectId": "atms/a.json", "objectGeneration": "1"}
+    first = extractTyc.IncomingMessage(b'{"name": "atms/a.json", "updated": "t1"}', attributes, None, None)
+    resent = extractTyc.IncomingMessage(b'{"updated": "t1", "name": "atms/a.json"}', attributes, None, None)
+    rewritten = extractTyc.IncomingMessage(first.data, {**attributes, "objectGeneration": "2"}, None, None)
+    with mock.patch.object(extractTyc, "message_identity", "notification"):
+        first_hash = extractTyc.get_message_hash(first, {})
+        assert len(first_hash) == 32
+        assert extractTyc.get_message_hash(resent, {}) == first_hash
+        assert extractTyc.get_message_hash(rewritten, {}) != first_hash
+
+
+def test_raw_and_canonical_identities():
+    first = extractTyc.IncomingMessage(b'{"a": 1, "b": 2}', {}, None, None)
+    reordered = extractTyc.IncomingMessage(b'{"b": 2, "a": 1}', {}, None, None)
+    with mock.patch.object(extractTyc, "message_identity", "raw"):
+        assert extractTyc.get_message_hash(first, {"a": 1, "b": 2}) != extractTyc.get_message_hash(reordered, {"b": 2, "a": 1})
+    with mock.patch.object(extractTyc, "message_identity", "canonical"):
+        assert extractTyc.get_message_hash(first, {"a": 1, "b": 2}) == extractTyc.get_message_hash(reordered, {"b": 2, "a": 1})
+    with mock.patch.object(extractTyc, "message_identity", "notification"):
+        # Messages that do not describe an object fall back to the raw hash
+        assert extractTyc.get_message_hash(first, {"a": 1, "b": 2}) != extractTyc.get_message_hash(reordered, {"b": 2, "a": 1})
+
+
+@pytest.mark.asyncio
+async def test_failed_file_is_nacked_and_forgotten():
+    job = extractTyc.FileJob(file_name="atms/a.json", ack=mock.AsyncMock(), nack=mock.AsyncMock(), message_hash=b"h" * 32)
+    mock_backend = mock.Mock(discard=mock.AsyncMock())
+    with mock.patch.object(extractTyc, "dedup_backend", mock_backend):
+        await extractTyc.on_pipeline_error(job, asyncpg.exceptions.ConnectionDoesNotExistError("connection was closed"))
+    job.nack.assert_awaited_once()
+    job.ack.assert_not_awaited()
+    mock_backend.discard.assert_awaited_once_with(b"h" * 32)
+
+
+@pytest.mark.asyncio
+async def test_malformed_file_is_acked():
+    job = extractTyc.FileJob(file_name="atms/a.json", ack=mock.AsyncMock(), nack=mock.AsyncMock(), message_hash=b"h" * 32)
+    await extractTyc.on_pipeline_error(job, ValueError("time data '' does not match format"))
+    job.ack.assert_awaited_once()
+    job.nack.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_malformed_record_without_validation_is_acked():
+    job = extractTyc.FileJob(
+        file_name="atms/a.json", ack=mock.AsyncMock(), nack=mock.AsyncMock(), message_hash=b"h" * 32,
+        content=b'[{"AutomatedTellerMachines": {}}, 42]',
+    )
+    mock_backend = mock.Mock(commit=mock.AsyncMock())
+    with mock.patch.object(extractTyc, "validate_ingest", False), \
+         mock.patch.object(extractTyc, "dedup_backend", mock_backend):
+        with pytest.raises(Exception) as excinfo:
+            await extractTyc.decode_stage(job)
+        await extractTyc.on_pipeline_error(job, excinfo.value)
+    job.ack.assert_awaited_once()
+    job.nack.assert_not_awaited()
+    mock_backend.commit.assert_awaited_once_with(b"h" * 32)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error, transient", [
+    (asyncpg.exceptions.DataError("invalid input for query argument $7"), False),
+    (asyncpg.exceptions.NotNullViolationError("null value in column"), False),
+    (asyncpg.exceptions.DeadlockDetectedError("deadlock detected"), True),
+    (asyncpg.exceptions.QueryCanceledError("canceling statement due to statement timeout"), True),
+    (asyncio.TimeoutError(), True),
+    (FileNotFoundError("atms/a.json"), False),
+])
+async def test_only_transient_write_errors_are_nacked(error, transient):
+    job = extractTyc.FileJob(file_name="atms/a.json", ack=mock.AsyncMock(), nack=mock.AsyncMock(), message_hash=b"h" * 32)
+    mock_backend = mock.Mock(commit=mock.AsyncMock(), discard=mock.AsyncMock())
+    with mock.patch.object(extractTyc, "dedup_backend", mock_backend):
+        await extractTyc.on_pipeline_error(job, error)
+    assert job.nack.await_count == int(transient)
+    assert job.ack.await_count == int(not transient)
+
+
+def test_notified_size_is_read_from_the_notification():
+    assert extractTyc.notified_size({"size": "1048576"}) == 1048576
+    assert extractTyc.notified_size({"size": "unknown"}) is None
+    assert extractTyc.notified_size({}) is None
+
+
+@pytest.mark.asyncio
+async def test_download_stage_passes_the_notified_object():
+    job = extractTyc.FileJob(
+        file_name="atms/a.json", ack=mock.AsyncMock(), nack=mock.AsyncMock(), message_hash=b"h" * 32,
+        generation=7, size=4,
+    )
+    download = mock.AsyncMock(return_value=DownloadedFile(b"[12]", 4, 7))
+    with mock.patch.object(extractTyc, "download_file_async", download), \
+         mock.patch.object(extractTyc, "ingest_mode", "buffered"):
+        await extractTyc.download_stage(job)
+    download.assert_awaited_once_with("atms/a.json", 7, 4)
+    assert job.content == b"[12]"
+
+
+@pytest.mark.asyncio
+async def test_download_connection_error_is_nacked():
+    job = extractTyc.FileJob(file_name="atms/a.json", ack=mock.AsyncMock(), nack=mock.AsyncMock(), message_hash=b"h" * 32)
+    download = mock.AsyncMock(side_effect=ConnectionError("Connection reset by peer"))
+    with mock.patch.object(extractTyc, "download_file_async", download), \
+         mock.patch.object(extractTyc, "ingest_mode", "buffered"):
+        with pytest.raises(ConnectionError) as excinfo:
+            await extractTyc.download_stage(job)
+        await extractTyc.on_pipeline_error(job, excinfo.value)
+    job.nack.assert_awaited_once()
+    job.ack.assert_not_awaited()
+
+
+
+@pytest.fixture
+def api_client():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api.router import router
+    app = FastAPI()
+    app.include_router(router)
+    extractTyc.read_cache.clear()
+    return TestClient(app)
+
+
+def test_get_atm_serves_cached_body_with_etag(api_client):
+    body = b'[{"AutomatedTellerMachines": {"ATMIdentifier": "ATM1"}}]'
+    with mock.patch.object(extractTyc, "get_atms_by_identifier", mock.AsyncMock(return_value=body)) as mock_get:
+        response = api_client.get("/api/v1/atms/ATM1")
+        cached = api_client.get("/api/v1/atms/ATM1")
+    assert response.status_code == 200
+    assert response.content == body
+    assert cached.headers["etag"] == response.headers["etag"]
+    mock_get.assert_awaited_once_with("ATM1")
+
+
+def test_get_atm_not_modified_when_etag_matches(api_client):
+    with mock.patch.object(extractTyc, "get_atms_by_identifier", mock.AsyncMock(return_value=b'[{}]')):
+        etag = api_client.get("/api/v1/atms/ATM1").headers["etag"]
+        response = api_client.get("/api/v1/atms/ATM1", headers={"If-None-Match": f'"other", W/{etag}'})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+def test_response_model_matches_the_served_document(api_client):
+    from models.responseDTO import ResponseDTO
+    document = {"AutomatedTellerMachines": {
+        "ATMIdentifier": "ATM1", "ATMFromDatetime": "08:00:00", "ATMToDatetime": "15:00:00",
+        "ATMAttentionHour": "08:00:00 - 15:00:00",
+    }}
+    assert ResponseDTO.model_validate(document).AutomatedTellerMachines.ATMAttentionHour == "08:00:00 - 15:00:00"
+    schemas = api_client.app.openapi()["components"]["schemas"]
+    attention_hour = schemas["AutomatedTellerMachines"]["properties"]["ATMAttentionHour"]
+    assert {"type": "string"} in attention_hour["anyOf"]
+
+
+def test_get_town_atms_and_listing(api_client):
+    with mock.patch.object(extractTyc, "get_atms_by_town", mock.AsyncMock(return_value=b"[]")) as mock_town, \
+         mock.patch.object(extractTyc, "list_atms", mock.AsyncMock(return_value=b"[]")) as mock_list:
+        assert api_client.get("/api/v1/towns/Talca/atms", params={"district": "Centro"}).json() == []
+        assert api_client.get("/api/v1/atms", params={"page": 2, "size": 10}).json() == []
+    mock_town.assert_awaited_once_with("Talca", "Centro")
+    mock_list.assert_awaited_once_with(2, 10)
+
+
+@pytest.mark.asyncio
+async def test_write_stage_invalidates_cached_reads():
+    from services.decoder import AtmBatch
+    from services.read_cache import atm_tag
+    batch = AtmBatch.from_rows([("ATM1", "s", "1", "Talca", "d", "r", None, None, "t", "h", "s", "a")])
+    job = extractTyc.FileJob("file.json", mock.AsyncMock(), mock.AsyncMock(), b"hash", insert_values=batch)
+    extractTyc.read_cache.clear()
+    await extractTyc.read_cache.get_or_load(("atm", "ATM1"), [atm_tag("ATM1")], mock.AsyncMock(return_value=b"[]"))
+    await extractTyc.read_cache.get_or_load(("atm", "ATM2"), [atm_tag("ATM2")], mock.AsyncMock(return_value=b"[]"))
+    with mock.patch.object(extractTyc, "upsert_atm_records", mock.AsyncMock(return_value={"inserted": 1, "updated": 0, "unchanged": 0})):
+        await extractTyc.write_stage(job)
+    assert extractTyc.read_cache.get(("atm", "ATM1")) is None
+    assert extractTyc.read_cache.get(("atm", "ATM2")) is not None
+
+
+@pytest.mark.asyncio
+async def test_worker_write_stage_sends_invalidations_to_the_http_process():
+    from services.decoder import AtmBatch
+    from services.supervisor import Shard
+    batch = AtmBatch.from_rows([("ATM1", "s", "1", "Talca", "d", "r", None, None, "t", "h", "s", "a")])
+    job = extractTyc.FileJob("file.json", mock.AsyncMock(), mock.AsyncMock(), b"hash", insert_values=batch)
+    events = mock.Mock()
+    with mock.patch.object(extractTyc, "shard", Shard(0, 2, [], events)), \
+         mock.patch.object(extractTyc, "upsert_atm_records", mock.AsyncMock(return_value={"inserted": 1, "updated": 0, "unchanged": 0})):
+        await extractTyc.write_stage(job)
+    kind, tags = events.put.call_args.args[0]
+    assert kind == "invalidate"
+    assert set(tags) == {("atm", "ATM1"), ("town", "Talca"), ("page",)}
+
+
+@pytest.mark.asyncio
+async def test_listen_for_messages_pulls_again_at_once_after_a_full_pull():
+    from types import SimpleNamespace
+    requested = []
+
+    def pull(request, timeout):
+        requested.append(request.max_messages)
+        received = [
+            SimpleNamespace(ack_id=f"{len(requested)}-{i}", message=SimpleNamespace(data=b"{}", attributes={}))
+            for i in range(request.max_messages if len(requested) < 4 else 0)
+        ]
+        return SimpleNamespace(received_messages=received)
+
+    mock_subscriber = mock.Mock()
+    mock_subscriber.pull.side_effect = pull
+    ack_manager = mock.Mock(in_flight=0, ack=mock.AsyncMock(), nack=mock.AsyncMock())
+    sleep = mock.AsyncMock(side_effect=asyncio.CancelledError)
+    with mock.patch.object(extractTyc, "subscriber", mock_subscriber), \
+         mock.patch.object(extractTyc, "ack_manager", ack_manager), \
+         mock.patch.object(extractTyc, "process_messages", mock.AsyncMock()), \
+         mock.patch.object(extractTyc, "pull_min_messages", 1), \
+         mock.patch.object(extractTyc.asyncio, "sleep", sleep):
+        with pytest.raises(asyncio.CancelledError):
+            await extractTyc.listen_for_messages()
+
+    # Full pulls grow the batch, only the empty fourth pull is followed by a pause
+    assert requested == [1, 2, 4, 8]
+    sleep.assert_awaited_once_with(extractTyc.pull_backoff_min_seconds)
+
+
+@pytest.mark.asyncio
+async def test_message_in_flight_elsewhere_is_neither_acked_nor_processed():
+    mock_pipeline = mock.Mock(submit=mock.AsyncMock())
+    mock_backend = mock.Mock(check_and_add_many=mock.AsyncMock(return_value=[extractTyc.Seen.IN_FLIGHT]))
+    ack, nack = mock.AsyncMock(), mock.AsyncMock()
+    with mock.patch.object(extractTyc, "pipeline", mock_pipeline), \
+            mock.patch.object(extractTyc, "dedup_backend", mock_backend), \
+            mock.patch.object(extractTyc, "dedup_in_flight_retry_seconds", 0):
+        await extractTyc.process_messages([extractTyc.IncomingMessage(
+            b'{"name": "atms/a.json"}', {"eventType": "OBJECT_FINALIZE"}, ack, nack
+        )])
+        await asyncio.gather(*extractTyc.deferred_nacks)
+
+    mock_pipeline.submit.assert_not_awaited()
+    ack.assert_not_awaited()
+    nack.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_ack_stage_commits_the_digest_before_acking():
+    calls = []
+    mock_backend = mock.Mock(commit=mock.AsyncMock(side_effect=lambda key: calls.append(("commit", key))))
+    job = extractTyc.FileJob(
+        file_name="atms/a.json", ack=mock.AsyncMock(side_effect=lambda: calls.append(("ack",))),
+        nack=mock.AsyncMock(), message_hash=b"h" * 32,
+    )
+    with mock.patch.object(extractTyc, "dedup_backend", mock_backend):
+        await extractTyc.ack_stage(job)
+    assert calls == [("commit", b"h" * 32), ("ack",)]
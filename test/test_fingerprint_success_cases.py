@@ -0,0 +1,39 @@
+from services.decoder import AtmBatch
+from services.fingerprint import FingerprintCache, row_fingerprint
+from conftest import atm_record
+
+
+def test_fingerprint_covers_mutable_columns_only():
+    assert row_fingerprint(atm_record("ATM1")) == row_fingerprint(atm_record("ATM1"))
+    assert row_fingerprint(atm_record("ATM1")) != row_fingerprint(atm_record("ATM1", "09:00:00 - 18:00:00"))
+    assert row_fingerprint(atm_record("ATM1")) == row_fingerprint(atm_record("ATM2"))
+
+
+def test_split_keeps_unknown_and_changed_records():
+    cache = FingerprintCache(10)
+    batch = AtmBatch.from_rows([atm_record("ATM1"), atm_record("ATM2")])
+    changed, fingerprints = cache.split(batch)
+    assert changed is batch
+    cache.update(fingerprints)
+
+    changed, fingerprints = cache.split(AtmBatch.from_rows([atm_record("ATM1"), atm_record("ATM2", "09:00:00 - 18:00:00")]))
+    assert list(changed) == [atm_record("ATM2", "09:00:00 - 18:00:00")]
+    assert [key[0] for key, _ in fingerprints] == ["ATM2"]
+
+
+def test_split_of_an_unchanged_batch_is_empty():
+    cache = FingerprintCache(10)
+    batch = AtmBatch.from_rows([atm_record("ATM1")])
+    cache.update(cache.split(batch)[1])
+    changed, fingerprints = cache.split(batch)
+    assert len(changed) == 0
+    assert fingerprints == []
+
+
+def test_least_recently_used_keys_are_evicted():
+    cache = FingerprintCache(2)
+    for identifier in ("ATM1", "ATM2", "ATM3"):
+        cache.update(cache.split(AtmBatch.from_rows([atm_record(identifier)]))[1])
+    assert len(cache) == 2
+    changed, _ = cache.split(AtmBatch.from_rows([atm_record("ATM1"), atm_record("ATM3")]))
+    assert [row[0] for row in changed] == ["ATM1"]
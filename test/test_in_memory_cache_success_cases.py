@@ -0,0 +1,85 @@
+import pytest
+from unittest import mock
+import services.in_memory_cache as in_memory_cache
+from services.in_memory_cache import DedupCache
+from conftest import digest
+
+
+def test_check_and_add_reports_duplicates():
+    cache = DedupCache(max_entries=10, ttl=60)
+    assert cache.check_and_add(digest("a")) is False
+    assert cache.check_and_add(digest("a")) is True
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = DedupCache(max_entries=2, ttl=60)
+    cache.check_and_add(digest("a"))
+    cache.check_and_add(digest("b"))
+    cache.check_and_add(digest("a"))  # "b" becomes the least recently used
+    cache.check_and_add(digest("c"))
+    assert digest("a") in cache
+    assert digest("b") not in cache
+    assert cache.evictions == 1
+
+
+def test_expired_entries_are_evicted_incrementally():
+    cache = DedupCache(max_entries=10, ttl=60)
+    with mock.patch("time.time", return_value=1000.0):
+        for value in "abc":
+            cache.add(digest(value))
+    with mock.patch("time.time", return_value=1030.0):
+        cache.add(digest("d"))
+    assert cache.expire(now=1070.0, limit=2) == 2
+    assert len(cache) == 2
+    assert cache.expire(now=1070.0) == 1
+    assert len(cache) == 1
+    with mock.patch("time.time", return_value=1070.0):
+        assert digest("d") in cache
+
+
+def test_expired_entry_is_not_a_hit():
+    cache = DedupCache(max_entries=10, ttl=60)
+    with mock.patch("time.time", return_value=1000.0):
+        cache.check_and_add(digest("a"))
+    with mock.patch("time.time", return_value=1061.0):
+        assert cache.check_and_add(digest("a")) is False
+
+
+def test_set_expiration_time_uses_hours():
+    with mock.patch.object(in_memory_cache, "cache", DedupCache(10, 60)):
+        in_memory_cache.set_expiration_time(2)
+        assert in_memory_cache.cache.ttl == 2 * 60 * 60
+
+
+@pytest.mark.asyncio
+async def test_module_check_and_add():
+    with mock.patch.object(in_memory_cache, "cache", DedupCache(10, 60)):
+        assert await in_memory_cache.check_and_add(digest("a")) is False
+        assert await in_memory_cache.is_message_processed(digest("a")) is True
+        await in_memory_cache.clean_old_messages()
+        assert in_memory_cache.cache_stats()["size"] == 1
+
+
+def test_journal_records_changes():
+    cache = DedupCache(max_entries=10, ttl=60)
+    cache.journal = []
+    with mock.patch("time.time", return_value=1000.0):
+        cache.check_and_add(digest("a"))
+        cache.check_and_add(digest("a"))
+        cache.discard(digest("a"))
+        cache.discard(digest("b"))
+    assert cache.journal == [
+        (digest("a"), 1000.0), (digest("a"), 1000.0), (digest("a"), 0.0), (digest("b"), 0.0)
+    ]
+
+
+def test_fallback_entries_count_until_they_expire():
+    cache = DedupCache(max_entries=10, ttl=60)
+    cache.fallback = mock.Mock(lookup=lambda key: {digest("a"): 1000.0, digest("b"): 900.0}.get(key))
+    with mock.patch("time.time", return_value=1010.0):
+        assert digest("a") in cache
+        assert cache.check_and_add(digest("a")) is True
+        assert cache.check_and_add(digest("b")) is False
+        cache.discard(digest("a"))
+    cache.fallback.forget.assert_called_once_with(digest("a"))
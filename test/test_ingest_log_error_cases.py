@@ -0,0 +1,9 @@
+import pytest
+from services.ingest_log import parse_sample_rates
+
+
+def test_parse_sample_rates_rejects_invalid_rates():
+    with pytest.raises(ValueError):
+        parse_sample_rates("message=0")
+    with pytest.raises(ValueError):
+        parse_sample_rates("message=often")
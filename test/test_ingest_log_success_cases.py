@@ -0,0 +1,58 @@
+import logging
+import threading
+from unittest import mock
+import services.ingest_log as ingest_log
+from services.ingest_log import EventSampler, Lazy, Truncated, log_event, parse_sample_rates
+
+
+def test_truncated_cuts_long_payloads():
+    assert str(Truncated("short", limit=10)) == "short"
+    assert str(Truncated("x" * 20, limit=10)) == "xxxxxxxxxx... (20 chars)"
+    assert str(Truncated(b"abcdef", limit=3)) == "abc... (6 chars)"
+
+
+def test_lazy_arguments_are_not_rendered_when_disabled(caplog):
+    payload = mock.MagicMock()
+    with caplog.at_level(logging.WARNING):
+        log_event("message", logging.INFO, "Received message: %s", Truncated(payload))
+        logging.debug("Data: %s", Lazy(payload.render))
+    payload.__str__.assert_not_called()
+    payload.render.assert_not_called()
+
+
+def test_sampler_keeps_one_in_n():
+    sampler = EventSampler(parse_sample_rates("message=3, duplicate=1"))
+    assert [sampler.sampled("message") for _ in range(7)] == [True, False, False, True, False, False, True]
+    assert all(sampler.sampled("duplicate") for _ in range(3))
+    assert all(sampler.sampled("other") for _ in range(3))
+
+
+def test_log_event_skips_unsampled_occurrences(caplog):
+    with mock.patch.object(ingest_log, "sampler", EventSampler({"message": 2})), caplog.at_level(logging.INFO):
+        for index in range(4):
+            log_event("message", logging.INFO, "Received message %s", index)
+    assert [record.getMessage() for record in caplog.records] == ["Received message 0", "Received message 2"]
+
+
+def test_queue_logging_formats_on_the_listener_thread():
+    formatted_on = []
+
+    class RecordingHandler(logging.Handler):
+        def emit(self, record):
+            formatted_on.append((threading.current_thread().name, self.format(record)))
+
+    root = logging.getLogger()
+    saved = root.handlers[:]
+    root.handlers = [RecordingHandler()]
+    try:
+        with mock.patch.object(ingest_log, "log_queue", True):
+            ingest_log.start_queue_logging()
+            root.warning("Received message %s", Lazy(lambda: threading.current_thread().name))
+            ingest_log.stop_queue_logging()
+        assert isinstance(root.handlers[0], RecordingHandler)
+    finally:
+        root.handlers = saved
+
+    (thread, message), = formatted_on
+    assert thread != threading.current_thread().name
+    assert message == f"Received message {thread}"
@@ -0,0 +1,9 @@
+import json
+import pytest
+from services.json_stream import iter_json_records
+
+
+@pytest.mark.parametrize("data", [b'[{"a": 1} {"b": 2}]', b'[{"a": 1},', b'{"a": ', b'[{"a": 1}, }'])
+def test_iter_json_records_malformed(data):
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_records([data[i:i + 3] for i in range(0, len(data), 3)]))
@@ -0,0 +1,44 @@
+import json
+import pytest
+from services.json_stream import iter_batches, iter_json_records
+
+RECORDS = [{"payload": {"atmidentifier": f"ATM{i:04d}", "atmtownname": "Región de Los Ríos"}} for i in range(20)]
+
+
+def split(data: bytes, size: int) -> list:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024 * 1024])
+def test_iter_json_records_array(chunk_size):
+    data = json.dumps(RECORDS, ensure_ascii=False).encode("utf-8")
+    assert list(iter_json_records(split(data, chunk_size))) == RECORDS
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024 * 1024])
+def test_iter_json_records_ndjson(chunk_size):
+    data = "\n".join(json.dumps(record, ensure_ascii=False) for record in RECORDS).encode("utf-8")
+    assert list(iter_json_records(split(data, chunk_size))) == RECORDS
+
+
+def test_iter_json_records_single_record():
+    data = json.dumps(RECORDS[0]).encode("utf-8")
+    assert list(iter_json_records(split(data, 5))) == [RECORDS[0]]
+
+
+def test_iter_json_records_empty_inputs():
+    assert list(iter_json_records([])) == []
+    assert list(iter_json_records([b" [ ", b"]\n"])) == []
+
+
+def test_iter_json_records_is_lazy():
+    def chunks():
+        yield b'[{"a": 1},'
+        raise AssertionError("read past the first record")
+
+    assert next(iter_json_records(chunks())) == {"a": 1}
+
+
+def test_iter_batches():
+    assert list(iter_batches(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(iter_batches([], 2)) == []
@@ -0,0 +1,20 @@
+import pytest
+from services.metrics import Counter, stage_seconds, timed_stage
+
+
+def test_wrong_number_of_labels_is_rejected():
+    counter = Counter("files_total", "Files.", ("outcome",))
+    with pytest.raises(ValueError):
+        counter.labels("processed", "extra")
+
+
+@pytest.mark.asyncio
+async def test_timed_stage_observes_failed_calls():
+    async def failing(job):
+        raise RuntimeError("boom")
+
+    histogram = stage_seconds.labels("failing")
+    timed = timed_stage("failing", failing)
+    with pytest.raises(RuntimeError):
+        await timed("job")
+    assert sum(histogram.counts) == 1
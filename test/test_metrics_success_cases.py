@@ -0,0 +1,112 @@
+import pytest
+from unittest import mock
+from services.metrics import Counter, Gauge, Histogram, Registry, timed_stage
+
+
+def test_counter_renders_labelled_samples():
+    counter = Counter("files_total", "Files.", ("outcome",))
+    counter.labels("processed").inc()
+    counter.labels("processed").inc(2)
+    counter.labels("failed").inc()
+    assert counter.render() == [
+        "# HELP files_total Files.",
+        "# TYPE files_total counter",
+        'files_total{outcome="processed"} 3',
+        'files_total{outcome="failed"} 1',
+    ]
+
+
+def test_unlabelled_counter_starts_at_zero():
+    assert Counter("messages_total", "Messages.").render()[-1] == "messages_total 0"
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("stage_seconds", "Stages.", ("stage",), buckets=(0.1, 1))
+    child = histogram.labels("write")
+    child.observe(0.05)
+    child.observe(0.1)
+    child.observe(0.5)
+    child.observe(3)
+    assert histogram.render()[2:] == [
+        'stage_seconds_bucket{stage="write",le="0.1"} 2',
+        'stage_seconds_bucket{stage="write",le="1"} 3',
+        'stage_seconds_bucket{stage="write",le="+Inf"} 4',
+        'stage_seconds_sum{stage="write"} 3.65',
+        'stage_seconds_count{stage="write"} 4',
+    ]
+
+
+def test_gauge_reads_its_value_when_rendered():
+    sizes = {"in_use": 1, "idle": 3}
+    gauge = Gauge("pool_connections", "Pool.", lambda: sizes, ("state",))
+    sizes["in_use"] = 2
+    assert gauge.render()[2:] == ['pool_connections{state="in_use"} 2', 'pool_connections{state="idle"} 3']
+    assert Gauge("absent", "Absent.", lambda: None).render()[2:] == []
+
+
+def test_label_values_are_escaped():
+    counter = Counter("errors_total", "Errors.", ("type",))
+    counter.labels('a"b\\c').inc()
+    assert counter.render()[-1] == 'errors_total{type="a\\"b\\\\c"} 1'
+
+
+def test_registry_renders_every_metric():
+    registry = Registry()
+    registry.register(Counter("a_total", "A."))
+    registry.register(Counter("b_total", "B."))
+    text = registry.render()
+    assert "a_total 0\n" in text
+    assert text.endswith("b_total 0\n")
+
+
+@pytest.mark.asyncio
+async def test_timed_stage_observes_each_call():
+    handler = mock.AsyncMock(return_value="done")
+    with mock.patch("services.metrics.stage_seconds", Histogram("s", "S.", ("stage",))) as histogram:
+        timed = timed_stage("download", handler)
+        assert await timed("job") == "done"
+    handler.assert_awaited_once_with("job")
+    assert histogram.render()[-1] == 's_count{stage="download"} 1'
+
+
+def test_metrics_endpoint(mocker):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api.router import router
+    from services import alloyDB, metrics
+    mocker.patch.object(alloyDB, "pool", None)
+    metrics.files_total.labels("processed").inc()
+    app = FastAPI()
+    app.include_router(router)
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'atm_ingest_files_total{outcome="processed"}' in response.text
+    assert "atm_dedup_cache_entries" in response.text
+    assert 'atm_db_pool_connections{state="max_size"}' in response.text
+
+
+def test_registry_sums_the_snapshots_of_other_processes():
+    worker = Registry()
+    worker_files = worker.register(Counter("files_total", "Files.", ("outcome",)))
+    worker_stage = worker.register(Histogram("stage_seconds", "Stages.", buckets=(1,)))
+    worker.register(Gauge("in_flight", "In flight.", lambda: 3))
+    worker_files.labels("processed").inc(2)
+    worker_files.labels("failed").inc()
+    worker_stage.observe(0.5)
+
+    registry = Registry()
+    registry.register(Counter("files_total", "Files.", ("outcome",))).labels("processed").inc()
+    registry.register(Histogram("stage_seconds", "Stages.", buckets=(1,))).observe(2)
+    registry.register(Gauge("in_flight", "In flight.", lambda: None))
+    registry.set_remote(("worker", 0), worker.snapshot())
+    registry.set_remote(("worker", 1), worker.snapshot())
+    text = registry.render()
+    assert 'files_total{outcome="processed"} 5\n' in text
+    assert 'files_total{outcome="failed"} 2\n' in text
+    assert 'stage_seconds_bucket{le="1"} 2\n' in text
+    assert "stage_seconds_count 3\n" in text
+    assert "in_flight 6\n" in text
+
+    registry.drop_remote(("worker", 1))
+    assert 'files_total{outcome="processed"} 3\n' in registry.render()
@@ -0,0 +1,42 @@
+import pytest
+from unittest import mock
+from services.pipeline import Pipeline, Stage
+
+
+@pytest.mark.asyncio
+async def test_pipeline_failed_item_goes_to_error_handler():
+    on_error = mock.AsyncMock()
+    last = mock.AsyncMock()
+
+    async def fail(item):
+        raise ValueError("bad item")
+
+    pipeline = Pipeline([Stage("fail", fail), Stage("last", last)], key=lambda item: item, on_error=on_error)
+    pipeline.start()
+    await pipeline.submit("item")
+    await pipeline.join()
+    await pipeline.stop()
+
+    last.assert_not_awaited()
+    item, error = on_error.call_args.args
+    assert item == "item"
+    assert isinstance(error, ValueError)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_error_handler_failure_does_not_stop_workers():
+    done = mock.AsyncMock()
+    on_error = mock.AsyncMock(side_effect=Exception("handler error"))
+
+    async def fail_first(item):
+        if item == "first":
+            raise ValueError("bad item")
+
+    pipeline = Pipeline([Stage("fail", fail_first), Stage("done", done)], key=lambda item: 0, on_error=on_error)
+    pipeline.start()
+    await pipeline.submit("first")
+    await pipeline.submit("second")
+    await pipeline.join()
+    await pipeline.stop()
+
+    done.assert_awaited_once_with("second")
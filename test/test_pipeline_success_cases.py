@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from unittest import mock
+from services.pipeline import Pipeline, Stage
+
+
+@pytest.mark.asyncio
+async def test_pipeline_runs_every_stage():
+    seen = []
+
+    async def first(item):
+        item["first"] = True
+
+    async def second(item):
+        seen.append(item)
+
+    pipeline = Pipeline([Stage("first", first, 2), Stage("second", second)], key=lambda item: item["key"])
+    pipeline.start()
+    for key in ("a", "b", "c"):
+        await pipeline.submit({"key": key})
+    await pipeline.join()
+    await pipeline.stop()
+
+    assert sorted(item["key"] for item in seen) == ["a", "b", "c"]
+    assert all(item["first"] for item in seen)
+    assert pipeline.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_pipeline_keeps_order_per_key():
+    applied = []
+
+    async def slow_first_version(item):
+        # The first version of each object is slower, it must still be applied first
+        await asyncio.sleep(0.02 if item["version"] == 1 else 0)
+
+    async def write(item):
+        applied.append((item["key"], item["version"]))
+
+    pipeline = Pipeline(
+        [Stage("download", slow_first_version, 4), Stage("write", write, 4)],
+        key=lambda item: item["key"],
+        queue_size=2,
+    )
+    pipeline.start()
+    for version in (1, 2, 3):
+        for key in ("a", "b"):
+            await pipeline.submit({"key": key, "version": version})
+    await pipeline.join()
+    await pipeline.stop()
+
+    for key in ("a", "b"):
+        assert [version for k, version in applied if k == key] == [1, 2, 3]
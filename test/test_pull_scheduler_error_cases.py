@@ -0,0 +1,15 @@
+from services.pull_scheduler import PullScheduler
+
+
+def test_failed_pulls_back_off_and_reset_on_success():
+    scheduler = PullScheduler(min_backoff=1, max_backoff=3)
+    assert scheduler.on_error() == 1
+    assert scheduler.on_error() == 2
+    assert scheduler.on_error() == 3
+    assert scheduler.on_pull(1, in_flight=0) == 0
+    assert scheduler.on_error() == 1
+
+
+def test_invalid_bounds_are_clamped():
+    scheduler = PullScheduler(min_batch=0, max_batch=0, max_in_flight=0)
+    assert scheduler.next_batch_size() == 1
@@ -0,0 +1,35 @@
+from services.pull_scheduler import PullScheduler
+
+
+def test_batch_size_grows_after_full_pulls():
+    scheduler = PullScheduler(min_batch=1, max_batch=8, max_in_flight=100)
+    sizes = []
+    for _ in range(5):
+        size = scheduler.next_batch_size()
+        sizes.append(size)
+        assert scheduler.on_pull(size, in_flight=0) == 0
+    assert sizes == [1, 2, 4, 8, 8]
+
+
+def test_partial_pull_keeps_the_size_and_polls_at_once():
+    scheduler = PullScheduler(min_batch=4, max_batch=64, max_in_flight=100)
+    assert scheduler.on_pull(2, in_flight=0) == 0
+    assert scheduler.next_batch_size() == 4
+
+
+def test_batch_size_shrinks_under_backpressure():
+    scheduler = PullScheduler(min_batch=1, max_batch=64, max_in_flight=10)
+    for _ in range(4):
+        scheduler.on_pull(scheduler.next_batch_size(), in_flight=0)
+    assert scheduler.next_batch_size() == 10  # Capped by the room left
+    scheduler.on_pull(10, in_flight=12)
+    assert scheduler.next_batch_size() == 1  # No room left, smallest pull
+    scheduler.on_pull(1, in_flight=3)
+    assert scheduler.next_batch_size() == 7
+
+
+def test_empty_pulls_back_off_exponentially_until_messages_arrive():
+    scheduler = PullScheduler(min_backoff=0.1, max_backoff=0.5)
+    assert [scheduler.on_pull(0, in_flight=0) for _ in range(4)] == [0.1, 0.2, 0.4, 0.5]
+    assert scheduler.on_pull(1, in_flight=1) == 0
+    assert scheduler.on_pull(0, in_flight=0) == 0.1
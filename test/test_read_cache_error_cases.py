@@ -0,0 +1,21 @@
+import asyncio
+import pytest
+from services.read_cache import ReadCache
+
+
+@pytest.mark.asyncio
+async def test_failed_load_is_not_cached_and_reaches_waiters():
+    cache = ReadCache(max_entries=10, ttl=60)
+    release = asyncio.Event()
+
+    async def load():
+        await release.wait()
+        raise RuntimeError("database down")
+
+    tasks = [asyncio.create_task(cache.get_or_load("key", [], load)) for _ in range(2)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.get("key") is None
+    assert len(cache) == 0
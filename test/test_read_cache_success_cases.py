@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from unittest import mock
+from services.decoder import AtmBatch
+from services.read_cache import LISTING_TAG, ReadCache, atm_batch_tags, atm_tag, make_etag, town_tag
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_caches_the_response():
+    cache = ReadCache(max_entries=10, ttl=60)
+    load = mock.AsyncMock(return_value=b"[1]")
+    first = await cache.get_or_load("key", [], load)
+    second = await cache.get_or_load("key", [], load)
+    assert first == second
+    assert first.body == b"[1]"
+    assert first.etag == make_etag(b"[1]")
+    load.assert_awaited_once()
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 1}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_load():
+    cache = ReadCache(max_entries=10, ttl=60)
+    release = asyncio.Event()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return b"[]"
+
+    tasks = [asyncio.create_task(cache.get_or_load("key", [], load)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    responses = await asyncio.gather(*tasks)
+    assert calls == 1
+    assert len({response.etag for response in responses}) == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_reloaded():
+    cache = ReadCache(max_entries=10, ttl=60)
+    load = mock.AsyncMock(side_effect=[b"[1]", b"[2]"])
+    with mock.patch("services.read_cache.time.monotonic", return_value=0):
+        await cache.get_or_load("key", [], load)
+    with mock.patch("services.read_cache.time.monotonic", return_value=61):
+        response = await cache.get_or_load("key", [], load)
+    assert response.body == b"[2]"
+
+
+@pytest.mark.asyncio
+async def test_invalidate_drops_tagged_entries_only():
+    cache = ReadCache(max_entries=10, ttl=60)
+    await cache.get_or_load("a", [atm_tag("ATM1")], mock.AsyncMock(return_value=b"a"))
+    await cache.get_or_load("b", [atm_tag("ATM2")], mock.AsyncMock(return_value=b"b"))
+    await cache.get_or_load("page", [LISTING_TAG], mock.AsyncMock(return_value=b"p"))
+    assert cache.invalidate([atm_tag("ATM1"), LISTING_TAG]) == 2
+    assert cache.get("a") is None
+    assert cache.get("page") is None
+    assert cache.get("b").body == b"b"
+
+
+@pytest.mark.asyncio
+async def test_load_overlapping_an_invalidation_is_not_stored():
+    cache = ReadCache(max_entries=10, ttl=60)
+
+    async def load():
+        cache.invalidate([atm_tag("ATM1")])  # A write commits while loading
+        return b"old"
+
+    response = await cache.get_or_load("a", [atm_tag("ATM1")], load)
+    assert response.body == b"old"
+    assert cache.get("a") is None
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_entry_is_evicted():
+    cache = ReadCache(max_entries=2, ttl=60)
+    for key in ("a", "b"):
+        await cache.get_or_load(key, [atm_tag(key)], mock.AsyncMock(return_value=b"x"))
+    cache.get("a")
+    await cache.get_or_load("c", [atm_tag("c")], mock.AsyncMock(return_value=b"x"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.invalidate([atm_tag("b")]) == 0
+
+
+def test_atm_batch_tags():
+    batch = AtmBatch.from_rows([("ATM1", "s", "1", "Talca", "d", "r", None, None, "t", "h", "s", "a")])
+    assert atm_batch_tags(batch) == {atm_tag("ATM1"), town_tag("Talca"), LISTING_TAG}
@@ -0,0 +1,24 @@
+import pytest
+from unittest import mock
+from services.readiness import Readiness
+
+
+@pytest.mark.asyncio
+async def test_failing_dependency_reports_its_error_and_backs_off():
+    readiness = Readiness(retry_min=1, retry_max=3)
+    init = mock.AsyncMock(side_effect=[ConnectionError("refused")] * 3 + [None])
+    states = []
+
+    async def sleep(delay):
+        states.append((delay, readiness.report()["dependencies"]["database"]))
+
+    with mock.patch("asyncio.sleep", sleep):
+        await readiness.warm("database", init)
+
+    assert [delay for delay, _ in states] == [1, 2, 3]
+    assert states[0][1] == {"ready": False, "error": "refused"}
+    assert readiness.ready
+
+
+def test_nothing_expected_is_not_ready():
+    assert Readiness().ready is False
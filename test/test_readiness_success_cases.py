@@ -0,0 +1,58 @@
+import pytest
+from unittest import mock
+from services.readiness import Readiness
+
+
+@pytest.mark.asyncio
+async def test_ready_once_every_expected_dependency_is_warm():
+    readiness = Readiness(retry_min=0)
+    readiness.expect("database", "storage")
+    assert not readiness.ready
+    await readiness.warm("database", mock.AsyncMock())
+    assert not readiness.ready
+    await readiness.warm("storage", mock.AsyncMock())
+
+    report = readiness.report()
+    assert report["ready"] is True
+    assert set(report["dependencies"]) == {"database", "storage"}
+    assert all(state["ready"] and "seconds" in state for state in report["dependencies"].values())
+
+
+@pytest.mark.asyncio
+async def test_warm_retries_until_success():
+    readiness = Readiness(retry_min=0)
+    init = mock.AsyncMock(side_effect=[ConnectionError("refused"), None])
+    await readiness.warm("database", init)
+    assert init.await_count == 2
+    assert readiness.report()["dependencies"]["database"]["ready"]
+
+
+def test_first_message_time_is_recorded_once():
+    readiness = Readiness(started=0.0)
+    with mock.patch("time.perf_counter", return_value=2.5):
+        readiness.message_processed()
+    with mock.patch("time.perf_counter", return_value=9.0):
+        readiness.message_processed()
+    assert readiness.first_message_seconds == 2.5
+
+
+def test_ready_endpoint(mocker):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api.router import router
+    import controllers.health as health
+    readiness = Readiness()
+    mocker.patch.object(health, "readiness", readiness)
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    readiness.expect("database")
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json()["dependencies"] == {"database": {"ready": False}}
+
+    readiness.mark_ready("database", 0.25)
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["dependencies"]["database"]["seconds"] == 0.25
@@ -1,7 +1,8 @@
 import pytest
 from unittest import mock
 from fastapi import HTTPException
-from services.redis import check_redis_connection
+from services.dedup import Seen
+from services.redis import RedisDedupBackend, check_redis_connection
 
 @pytest.mark.asyncio
 async def test_check_redis_connection_failure(mock_redis_client):
@@ -16,3 +17,12 @@ async def test_check_redis_connection_failure(mock_redis_client):
         mock_redis_client.ping.assert_called_once()
         mock_log_error.assert_called_once_with("Redis connection check failed", exc_info=True)
 
+
+@pytest.mark.asyncio
+async def test_redis_backend_falls_back_to_local_cache(mock_redis_client):
+    mock_redis_client.pipeline = mock.Mock(side_effect=Exception("Redis connection error"))
+    backend = RedisDedupBackend()
+    assert await backend.check_and_add_many([b"a"]) == [Seen.NEW]
+    assert await backend.check_and_add_many([b"a"]) == [Seen.IN_FLIGHT]
+    await backend.commit(b"a")
+    assert await backend.check_and_add_many([b"a"]) == [Seen.DONE]
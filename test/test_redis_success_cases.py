@@ -1,7 +1,10 @@
 import pytest
 from unittest import mock
 from fastapi import HTTPException
-from services.redis import check_redis_connection
+import services.in_memory_cache as in_memory_cache
+import services.redis as redis_module
+from services.dedup import Seen, dedup_in_flight_retry_seconds, dedup_lease_seconds
+from services.redis import COMMITTED, RedisDedupBackend, check_redis_connection
 
 @pytest.mark.asyncio
 async def test_check_redis_connection_success(mock_redis_client):
@@ -11,3 +14,56 @@ async def test_check_redis_connection_success(mock_redis_client):
         mock_redis_client.ping.assert_called_once()
         mock_log_info.assert_called_once_with("Redis connection successfull.")
 
+
+@pytest.mark.asyncio
+async def test_redis_backend_claims_a_batch_in_one_round_trip(fake_redis):
+    backend = RedisDedupBackend()
+    assert await backend.check_and_add_many([b"a", b"b"]) == [Seen.NEW, Seen.NEW]
+    assert fake_redis.pipelines == 1
+    # Claims last a short lease, not the dedup TTL
+    value, ttl = fake_redis.store[b"dedup:a"]
+    assert ttl == dedup_lease_seconds
+
+@pytest.mark.asyncio
+async def test_redis_backend_commit_keeps_the_key_for_the_dedup_ttl(fake_redis):
+    backend = RedisDedupBackend()
+    await backend.check_and_add_many([b"a"])
+    await backend.commit(b"a")
+    assert fake_redis.store[b"dedup:a"] == (COMMITTED, in_memory_cache.expiration_time)
+
+@pytest.mark.asyncio
+async def test_redis_backend_shared_between_replicas(fake_redis):
+    first_replica, second_replica = RedisDedupBackend(), RedisDedupBackend()
+    assert await first_replica.check_and_add_many([b"a"]) == [Seen.NEW]
+    # Claimed but not committed: neither acked nor processed again
+    assert await second_replica.check_and_add_many([b"a", b"b"]) == [Seen.IN_FLIGHT, Seen.NEW]
+    await first_replica.commit(b"a")
+    assert await second_replica.check_and_add_many([b"a"]) == [Seen.DONE]
+
+@pytest.mark.asyncio
+async def test_redis_backend_local_hits_skip_redis(fake_redis):
+    backend = RedisDedupBackend()
+    await backend.check_and_add_many([b"a", b"b"])
+    await backend.commit(b"a")
+    assert await backend.check_and_add_many([b"a", b"b"]) == [Seen.DONE, Seen.IN_FLIGHT]
+    assert fake_redis.pipelines == 1
+
+@pytest.mark.asyncio
+async def test_redis_backend_discarded_claim_is_new_again(fake_redis):
+    first_replica, second_replica = RedisDedupBackend(), RedisDedupBackend()
+    await first_replica.check_and_add_many([b"a"])
+    await first_replica.discard(b"a")
+    assert await second_replica.check_and_add_many([b"a"]) == [Seen.NEW]
+
+@pytest.mark.asyncio
+async def test_redis_backend_claim_of_a_handed_over_file_expires(fake_redis):
+    clock = mock.Mock(monotonic=mock.Mock(return_value=1000.0))
+    with mock.patch.object(redis_module, "time", clock):
+        # A claims the file, hands it over, and B, its owner, commits it
+        a, b = RedisDedupBackend(), RedisDedupBackend()
+        assert await a.check_and_add_many([b"a"]) == [Seen.NEW]
+        await b.commit(b"a")
+        assert await a.check_and_add_many([b"a"]) == [Seen.IN_FLIGHT]
+        clock.monotonic.return_value += dedup_in_flight_retry_seconds
+        assert await a.check_and_add_many([b"a"]) == [Seen.DONE]
+    assert a.claimed == {}
@@ -0,0 +1,21 @@
+import pytest
+from services.shared_dedup import SharedDedupTable
+
+
+def test_open_missing_table(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        SharedDedupTable(str(tmp_path / "missing"))
+
+
+def test_open_file_that_is_not_a_table(tmp_path):
+    path = tmp_path / "other"
+    path.write_bytes(b"not a dedup table at all")
+    with pytest.raises(ValueError):
+        SharedDedupTable(str(path))
+
+
+def test_open_empty_file(tmp_path):
+    path = tmp_path / "empty"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        SharedDedupTable(str(path))
@@ -0,0 +1,98 @@
+from multiprocessing import get_context
+import pytest
+from unittest import mock
+import services.in_memory_cache as in_memory_cache
+from services.dedup import Seen, create_dedup_backend
+from services.shared_dedup import SharedDedupBackend, SharedDedupTable
+from conftest import digest
+
+
+def add_digests(path: str, count: int) -> int:
+    # Runs in a separate process: the number of digests it claimed first
+    table = SharedDedupTable(path)
+    try:
+        return sum(table.claim(digest(value), ttl=3600, lease=60) == Seen.NEW for value in range(count))
+    finally:
+        table.close()
+
+
+def test_claim_reports_in_flight_and_committed_digests(tmp_path):
+    table = SharedDedupTable.create(str(tmp_path / "dedup"), capacity=64)
+    assert table.claim(digest(1), ttl=60, lease=30, now=1000.0) == Seen.NEW
+    assert table.claim(digest(1), ttl=60, lease=30, now=1010.0) == Seen.IN_FLIGHT
+    assert not table.contains(digest(1), ttl=60, now=1010.0)
+    table.commit(digest(1), ttl=60, lease=30, now=1020.0)
+    assert table.claim(digest(1), ttl=60, lease=30, now=1030.0) == Seen.DONE
+    assert table.claim(digest(2), ttl=60, lease=30, now=1030.0) == Seen.NEW
+    assert table.contains(digest(1), ttl=60, now=1040.0)
+
+
+def test_claim_of_a_crashed_worker_expires_after_the_lease(tmp_path):
+    table = SharedDedupTable.create(str(tmp_path / "dedup"), capacity=64)
+    table.claim(digest(1), ttl=3600, lease=30, now=1000.0)
+    # Never committed: the redelivered message is claimed again
+    assert table.claim(digest(1), ttl=3600, lease=30, now=1031.0) == Seen.NEW
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    table = SharedDedupTable.create(str(tmp_path / "dedup"), capacity=64)
+    table.commit(digest(1), ttl=60, lease=30, now=1000.0)
+    assert not table.contains(digest(1), ttl=60, now=1061.0)
+    assert table.claim(digest(1), ttl=60, lease=30, now=1061.0) == Seen.NEW
+
+
+def test_discard_forgets_a_digest(tmp_path):
+    table = SharedDedupTable.create(str(tmp_path / "dedup"), capacity=64)
+    table.claim(digest(1), ttl=60, lease=30)
+    table.discard(digest(1))
+    assert table.claim(digest(1), ttl=60, lease=30) == Seen.NEW
+
+
+def test_full_set_evicts_least_recently_seen(tmp_path):
+    # A single set: every digest competes for the same 4 slots
+    table = SharedDedupTable.create(str(tmp_path / "dedup"), capacity=4, ways=4)
+    for value in range(4):
+        table.commit(digest(value), ttl=60, lease=30, now=1000.0 + value)
+    table.claim(digest(0), ttl=60, lease=30, now=1010.0)
+    table.commit(digest(4), ttl=60, lease=30, now=1011.0)
+    assert not table.contains(digest(1), ttl=60, now=1012.0)
+    assert all(table.contains(digest(value), ttl=60, now=1012.0) for value in (0, 2, 3, 4))
+
+
+def test_table_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "dedup")
+    first = SharedDedupTable.create(path, capacity=64)
+    second = SharedDedupTable(path)
+    first.claim(digest(1), ttl=60, lease=30)
+    assert second.claim(digest(1), ttl=60, lease=30) == Seen.IN_FLIGHT
+    first.commit(digest(1), ttl=60, lease=30)
+    assert second.claim(digest(1), ttl=60, lease=30) == Seen.DONE
+    assert second.capacity == first.capacity
+
+
+def test_processes_see_each_digest_first_once(tmp_path):
+    path = str(tmp_path / "dedup")
+    SharedDedupTable.create(path, capacity=4096)
+    with get_context("spawn").Pool(4) as pool:
+        firsts = pool.starmap(add_digests, [(path, 1000)] * 4)
+    assert sum(firsts) == 1000
+
+
+@pytest.mark.asyncio
+async def test_shared_backend_uses_the_cache_expiration(tmp_path):
+    path = str(tmp_path / "dedup")
+    SharedDedupTable.create(path, capacity=64)
+    with mock.patch.object(in_memory_cache, "expiration_time", 3600):
+        backend = SharedDedupBackend(path)
+        assert await backend.check_and_add_many([b"a" * 32, b"b" * 32, b"a" * 32]) == [Seen.NEW, Seen.NEW, Seen.IN_FLIGHT]
+        await backend.commit(b"b" * 32)
+        assert await backend.check_and_add(b"b" * 32) == Seen.DONE
+        await backend.discard(b"a" * 32)
+        assert await backend.check_and_add(b"a" * 32) == Seen.NEW
+
+
+def test_create_dedup_backend_shared(tmp_path):
+    path = str(tmp_path / "dedup")
+    SharedDedupTable.create(path, capacity=64)
+    with mock.patch("services.shared_dedup.dedup_shared_path", path):
+        assert isinstance(create_dedup_backend("shared"), SharedDedupBackend)
@@ -1,11 +1,67 @@
 import pytest
 from unittest import mock
+from google.api_core.exceptions import NotFound
+from google.resumable_media import DataCorruption
 import services.storage as storage_module
 
 def test_download_file_not_found(mock_bucket):
     file_name = "non_existent_file.txt"
-    mock_bucket.get_blob.return_value = None
+    mock_bucket.blob.return_value.download_as_bytes.side_effect = NotFound("No such object")
     result = storage_module.download_file(file_name)
-    mock_bucket.get_blob.assert_called_once_with(file_name)
+    mock_bucket.blob.assert_called_once_with(file_name)
     assert result is None
 
+@pytest.mark.asyncio
+async def test_download_file_async_checksum_mismatch(mock_bucket):
+    mock_blob = mock_bucket.blob.return_value
+    mock_blob.crc32c = "AAAAAA=="
+    mock_blob.download_as_bytes.side_effect = lambda start, end, checksum: b"x" * (end - start + 1)
+    with mock.patch.object(storage_module, "parallel_download_threshold", 4), \
+         mock.patch.object(storage_module, "download_range_size", 4):
+        with pytest.raises(OSError, match="Checksum mismatch"):
+            await storage_module.download_file_async("test_file.txt", 1, 8)
+
+
+@pytest.mark.asyncio
+async def test_download_file_async_corrupted_single_request(mock_bucket):
+    mock_bucket.blob.return_value.download_as_bytes.side_effect = DataCorruption(None, "Checksum mismatch")
+    with pytest.raises(OSError, match="Checksum mismatch"):
+        await storage_module.download_file_async("test_file.txt")
+
+
+@pytest.mark.asyncio
+async def test_download_file_deleted_before_its_ranges_are_read(mock_bucket):
+    mock_bucket.blob.return_value.download_as_bytes.side_effect = NotFound("gone")
+    with mock.patch.object(storage_module, "parallel_download_threshold", 4):
+        assert await storage_module.download_file_async("atms/a.json", 1, 8) is None
+
+
+@pytest.mark.asyncio
+async def test_download_file_async_raises_transient_errors(mock_bucket):
+    mock_bucket.blob.return_value.download_as_bytes.side_effect = ConnectionError("Connection reset by peer")
+    with pytest.raises(ConnectionError):
+        await storage_module.download_file_async("atms/a.json")
+
+
+def test_iter_file_chunks_missing_file(mock_bucket):
+    mock_bucket.blob.return_value.open.side_effect = NotFound("No such object")
+    with pytest.raises(FileNotFoundError):
+        list(storage_module.iter_file_chunks("atms/a.json"))
+
+
+@pytest.mark.asyncio
+async def test_download_succeeds_when_the_blob_cache_cannot_write(mock_bucket, blob_cache):
+    mock_blob = mock_bucket.blob.return_value
+    mock_blob.generation = 1
+    mock_blob.download_as_bytes.return_value = b"[12]"
+    with mock.patch.object(blob_cache, "put", side_effect=OSError("No space left on device")):
+        downloaded = await storage_module.download_file_async("atms/a.json", 1)
+    assert downloaded.content == b"[12]"
+
+
+def test_blob_cache_that_cannot_be_opened_is_disabled(mock_bucket, tmp_path):
+    (tmp_path / "file").write_bytes(b"")
+    with mock.patch.object(storage_module, "blob_cache_dir", str(tmp_path / "file" / "blobs")):
+        assert storage_module.get_blob_cache() is None
+        assert storage_module.get_blob_cache() is None
+    assert storage_module.blob_cache_failed
@@ -1,3 +1,6 @@
+import base64
+import google_crc32c
+import threading
 import pytest
 from unittest import mock
 import services.storage as storage_module
@@ -17,11 +20,11 @@ async def test_upload_file(mock_bucket):
 def test_download_file(mock_bucket):
     file_name = "test_file.txt"
     file_content = b"test content"
-    mock_blob = mock_bucket.get_blob.return_value
+    mock_blob = mock_bucket.blob.return_value
     mock_blob.download_as_bytes.return_value = file_content
     result = storage_module.download_file(file_name)
-    mock_bucket.get_blob.assert_called_once_with(file_name)
-    mock_blob.download_as_bytes.assert_called_once()
+    mock_bucket.blob.assert_called_once_with(file_name)
+    mock_blob.download_as_bytes.assert_called_once_with(checksum="crc32c")
     assert result == file_content
 
 def test_list_files(mock_bucket):
@@ -34,3 +37,111 @@ def test_list_files(mock_bucket):
     mock_bucket.list_blobs.assert_called_once()
     assert result == ["file1.txt", "file2.txt"]
 
+def test_list_file_sizes_with_prefix(mock_bucket):
+    mock_blob = mock.Mock(size=42)
+    mock_blob.name = "atms/file1.json"
+    mock_bucket.list_blobs.return_value = [mock_blob]
+    result = storage_module.list_file_sizes("atms/")
+    mock_bucket.list_blobs.assert_called_once_with(prefix="atms/")
+    assert result == [("atms/file1.json", 42)]
+
+
+def test_iter_file_chunks(mock_bucket):
+    mock_bucket.blob.return_value.open.return_value = mock.MagicMock()
+    reader = mock_bucket.blob.return_value.open.return_value.__enter__.return_value
+    reader.read.side_effect = [b"chunk1", b"chunk2", b""]
+    result = list(storage_module.iter_file_chunks("test_file.txt", chunk_size=6))
+    mock_bucket.blob.assert_called_once_with("test_file.txt")
+    mock_bucket.blob.return_value.open.assert_called_once_with("rb", chunk_size=6)
+    assert result == [b"chunk1", b"chunk2"]
+
+@pytest.mark.asyncio
+async def test_download_file_async_returns_metadata(mock_bucket):
+    file_content = b"test content"
+    mock_blob = mock_bucket.blob.return_value
+    # Set from the response headers by the download itself
+    mock_blob.generation = 1700000000000001
+    mock_blob.download_as_bytes.return_value = file_content
+    result = await storage_module.download_file_async("test_file.txt")
+    # One request, no metadata lookup
+    mock_bucket.get_blob.assert_not_called()
+    mock_blob.download_as_bytes.assert_called_once()
+    assert result == storage_module.DownloadedFile(file_content, len(file_content), 1700000000000001)
+
+@pytest.mark.asyncio
+async def test_download_file_async_parallel_ranges(mock_bucket):
+    file_content = b"0123456789"
+    mock_blob = mock_bucket.blob.return_value
+    mock_blob.generation = 3
+    mock_blob.crc32c = base64.b64encode(google_crc32c.Checksum(file_content).digest()).decode("ascii")
+    mock_blob.download_as_bytes.side_effect = lambda start, end, checksum: file_content[start:end + 1]
+    with mock.patch.object(storage_module, "parallel_download_threshold", 4), \
+         mock.patch.object(storage_module, "download_range_size", 4):
+        result = await storage_module.download_file_async("test_file.txt", 3, len(file_content))
+    # The ranges are pinned to the notified generation
+    mock_bucket.blob.assert_called_once_with("test_file.txt", generation=3)
+    ranges = sorted((c.kwargs["start"], c.kwargs["end"]) for c in mock_blob.download_as_bytes.call_args_list)
+    assert ranges == [(0, 3), (4, 7), (8, 9)]
+    assert result.content == file_content
+
+
+@pytest.mark.asyncio
+async def test_download_file_async_without_size_is_one_request(mock_bucket):
+    mock_blob = mock_bucket.blob.return_value
+    mock_blob.generation = 3
+    mock_blob.download_as_bytes.return_value = b"0123456789"
+    with mock.patch.object(storage_module, "parallel_download_threshold", 4):
+        result = await storage_module.download_file_async("test_file.txt", 3)
+    mock_blob.download_as_bytes.assert_called_once_with(checksum="crc32c")
+    assert result.content == b"0123456789"
+
+
+def test_bucket_is_created_on_first_use():
+    client = mock.Mock()
+    with mock.patch.object(storage_module, "bucket", None), \
+            mock.patch.object(storage_module.storage_client, "get", return_value=client):
+        assert storage_module.get_bucket() is client.bucket.return_value
+        assert storage_module.get_bucket() is client.bucket.return_value
+    client.bucket.assert_called_once_with(storage_module.bucket_name)
+
+
+@pytest.mark.asyncio
+async def test_downloaded_file_is_read_from_the_blob_cache_again(mock_bucket, blob_cache):
+    mock_blob = mock_bucket.blob.return_value
+    mock_blob.generation = 7
+    mock_blob.download_as_bytes.return_value = b"[1, 2]"
+    downloaded = await storage_module.download_file_async("atms/a.json")
+    assert downloaded == storage_module.DownloadedFile(b"[1, 2]", 6, 7)
+
+    # With the notified generation, nothing is requested
+    notified = await storage_module.download_file_async("atms/a.json", 7)
+    assert (notified.content[:], notified.size, notified.generation) == (b"[1, 2]", 6, 7)
+    mock_blob.download_as_bytes.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_new_generation_is_downloaded(mock_bucket, blob_cache):
+    blob_cache.put("atms/a.json", 7, b"[1]")
+    mock_blob = mock_bucket.blob.return_value
+    mock_blob.generation = 8
+    mock_blob.download_as_bytes.return_value = b"[1, 2]"
+    downloaded = await storage_module.download_file_async("atms/a.json", 8)
+    assert downloaded.content == b"[1, 2]"
+    assert blob_cache.get("atms/a.json", 8)[:] == b"[1, 2]"
+
+
+@pytest.mark.asyncio
+async def test_blob_cache_is_read_off_the_event_loop(mock_bucket, blob_cache):
+    blob_cache.put("atms/a.json", 7, b"[1]")
+    threads = []
+    get = blob_cache.get
+
+    def recording_get(*args):
+        threads.append(threading.get_ident())
+        return get(*args)
+
+    with mock.patch.object(blob_cache, "get", recording_get):
+        downloaded = await storage_module.download_file_async("atms/a.json", 7)
+    assert downloaded.content[:] == b"[1]"
+    assert threads and threading.get_ident() not in threads
+    mock_bucket.blob.assert_not_called()
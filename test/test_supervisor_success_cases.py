@@ -0,0 +1,85 @@
+import os
+import pytest
+from multiprocessing import get_context
+from unittest import mock
+from services.shared_dedup import SharedDedupTable
+from services.metrics import Counter, Registry
+from services.read_cache import read_cache
+from services.supervisor import Shard, Supervisor, shard_of
+
+
+def test_shard_of_is_stable_and_in_range():
+    names = [f"atms/file-{index}.json" for index in range(100)]
+    shards = [shard_of(name, 4) for name in names]
+    assert shards == [shard_of(name, 4) for name in names]
+    assert set(shards) == {0, 1, 2, 3}
+
+
+@pytest.mark.asyncio
+async def test_start_spawns_workers_sharing_the_dedup_table(tmp_path):
+    path = str(tmp_path / "dedup")
+    supervisor = Supervisor(3, dedup_path=path)
+    supervisor._context = mock.Mock(Queue=get_context("spawn").Queue)
+    with mock.patch.dict(os.environ, {"DEDUP_BACKEND": "memory"}):
+        supervisor.start()
+        assert os.environ["DEDUP_BACKEND"] == "shared"
+        assert os.environ["DEDUP_SHARED_PATH"] == path
+    SharedDedupTable(path).close()
+
+    shards = [call.kwargs["args"][0] for call in supervisor._context.Process.call_args_list]
+    assert [shard.index for shard in shards] == [0, 1, 2]
+    assert all(isinstance(shard, Shard) and shard.count == 3 and len(shard.queues) == 3 for shard in shards)
+    assert all(shard.events is shards[0].events for shard in shards)
+    await supervisor.stop()
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_is_kept(tmp_path):
+    supervisor = Supervisor(2, dedup_path=str(tmp_path / "dedup"))
+    supervisor._context = mock.Mock(Queue=get_context("spawn").Queue)
+    with mock.patch.dict(os.environ, {"DEDUP_BACKEND": "redis"}):
+        supervisor.start()
+        assert os.environ["DEDUP_BACKEND"] == "redis"
+    assert not (tmp_path / "dedup").exists()
+    await supervisor.stop()
+
+
+@pytest.mark.asyncio
+async def test_exited_workers_are_restarted(tmp_path):
+    supervisor = Supervisor(2, dedup_path=str(tmp_path / "dedup"))
+    supervisor._context = mock.Mock(Queue=get_context("spawn").Queue, Process=mock.Mock(side_effect=lambda **kwargs: mock.Mock()))
+    with mock.patch.dict(os.environ, {"DEDUP_BACKEND": "redis"}):
+        supervisor.start()
+    exited = supervisor._processes[1]
+    exited.is_alive.return_value = False
+    supervisor._processes[0].is_alive.return_value = True
+    registry = Registry()
+    registry.register(Counter("messages_total", "Messages."))
+    with mock.patch("services.metrics.registry", registry):
+        supervisor.handle_event(("metrics", 1, {"messages_total": {(): 7}}))
+        supervisor.check_workers()
+
+    assert registry.render().endswith("messages_total 0\n")
+    assert supervisor._processes[1] is not exited
+    assert supervisor._context.Process.call_count == 3
+    assert supervisor._context.Process.call_args.kwargs["args"][0].index == 1
+    await supervisor.stop()
+
+
+@pytest.mark.asyncio
+async def test_worker_events_reach_the_http_process(tmp_path):
+    supervisor = Supervisor(1, dedup_path=str(tmp_path / "dedup"))
+    supervisor._context = mock.Mock(Queue=get_context("spawn").Queue)
+    read_cache.clear()
+    await read_cache.get_or_load(("atm", "ATM1"), [("atm", "ATM1")], mock.AsyncMock(return_value=b"[]"))
+    registry = Registry()
+    registry.register(Counter("messages_total", "Messages.")).inc()
+    with mock.patch.dict(os.environ, {"DEDUP_BACKEND": "redis"}), \
+         mock.patch("services.metrics.registry", registry):
+        supervisor.start()
+        supervisor._events.put(("metrics", 0, {"messages_total": {(): 41}}))
+        supervisor._events.put(("invalidate", [("atm", "ATM1")]))
+        await supervisor.stop()
+
+    assert registry.render().endswith("messages_total 42\n")
+    assert read_cache.get(("atm", "ATM1")) is None